@@ -1,40 +1,179 @@
-
 import jwt
 from flask import Flask
 from flask_login import LoginManager
 from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
 from flask_wtf.csrf import CSRFProtect
 from flask_jwt_extended import JWTManager
 from flask_cors import CORS
-from flask_mail import Mail
+from werkzeug.middleware.proxy_fix import ProxyFix
 from app.config import Config
+from app.dbpool import engine_options, make_psycopg2_cooperative
+from app.metrics import Metrics
+from app.profiler import SQLProfiler
+from app.hashing import PasswordHasher
+from app.imaging import ImagePipeline
+from app.ratelimit import RateLimiter
+from app.serialization import create_json_provider
+
+# Extensions are created here unbound and set up on each app by create_app().
+# Flask-Mail and Flask-Migrate are left out on purpose. The outbox sets up
+# mail the first time it sends, and cli.py adds migrations, so web workers
+# never import either.
 
-# Initialize Flask application
-app = Flask(__name__)
+# Instantiate SQLAlchemy
+db = SQLAlchemy()
 
-CORS(app, resources={r"/api/*": {"origins": "*"}})
+# Instantiate request, database and worker metrics
+metrics = Metrics()
 
-app.config.from_object(Config)
+# Instantiate the per-request SQL profiler and slow-query log
+sql_profiler = SQLProfiler()
 
-# Initialize SQLAlchemy
-db = SQLAlchemy(app)
+# Instantiate the password hashing pool
+hasher = PasswordHasher()
 
-# Instantiate Flask-Migrate library here
-migrate = Migrate(app, db)
+# Instantiate the auth endpoint rate limits
+rate_limiter = RateLimiter()
 
-# Instantiate Flask-Mail
-mail = Mail(app)
+# Instantiate the profile photo pipeline
+image_pipeline = ImagePipeline()
 
 # Instantiate CSRF-Protect library here
-csrf = CSRFProtect(app)
-csrf.exempt('api.*') 
+csrf = CSRFProtect()
 
 #Initialize JWT
-jwt = JWTManager(app)
+jwt = JWTManager()
 
 # Initialize LoginManager
-login_manager = LoginManager(app)
-login_manager.login_view = 'login'
+login_manager = LoginManager()
+login_manager.login_view = 'api.login'
+
+from app.catalog import CatalogCache, catalog_cli
+
+# Instantiate the precomputed catalog listings
+catalog_cache = CatalogCache()
+
+from app.search import CatalogSearch
+
+# Instantiate the in-memory catalog search index
+catalog_search = CatalogSearch()
+
+from app.workshops import WorkshopDirectory
+
+# Instantiate the in-memory workshop spatial index
+workshop_directory = WorkshopDirectory()
+
+from app.tokens import RevocationList
+
+# Instantiate the in-memory token revocation filter
+token_revocations = RevocationList()
+
+from app.availability import TakenNames
+
+# Instantiate the in-memory filter of taken usernames and emails
+taken_names = TakenNames()
+
+# The indexes warm_up() builds, by name for its log messages
+WARM_INDEXES = (
+    ('catalog search', catalog_search),
+    ('workshop', workshop_directory),
+    ('token revocation', token_revocations),
+    ('taken names', taken_names),
+)
+
+
+def create_app(config=Config):
+    """Build an app from a config object.
+
+    Nothing here opens a connection or starts a thread or process. A master
+    that builds the app before forking (gunicorn --preload) therefore hands
+    its workers nothing they would have to share. Those costs are paid on
+    first use, or up front by warm_up().
+    """
+    app = Flask(__name__)
+    app.config.from_object(config)
+
+    CORS(app, resources={r"/api/*": {"origins": "*"}})
+
+    # Take the client address and scheme from the configured proxies' headers
+    if app.config['PROXY_FIX_X_FOR'] or app.config['PROXY_FIX_X_PROTO']:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_FIX_X_FOR'], x_proto=app.config['PROXY_FIX_X_PROTO'])
+
+    # Encode and parse JSON with the configured provider
+    app.json = create_json_provider(app.config['JSON_PROVIDER'], app)
+
+    # Size and instrument the connection pool, and go cooperative under gevent
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config))
+    if app.config['GEVENT_MODE']:
+        make_psycopg2_cooperative()
+
+    db.init_app(app)
+    metrics.init_app(app)
+    sql_profiler.init_app(app)
+    hasher.init_app(app)
+    rate_limiter.init_app(app)
+    image_pipeline.init_app(app)
+    csrf.init_app(app)
+    jwt.init_app(app)
+    login_manager.init_app(app)
+    catalog_cache.init_app(app)
+    catalog_search.init_app(app)
+    workshop_directory.init_app(app)
+    token_revocations.init_app(app)
+    taken_names.init_app(app)
+
+    from app.views import api
+    from app.outbox import outbox_cli
+    from app.uploads import uploads_cli
+    from app.bookings import bookings_cli
+    from app.users import users_cli
+    from app.resets import reset_codes_cli
+    from app.tokens import tokens_cli
+
+    app.register_blueprint(api)
+    csrf.exempt(api)
+
+    app.cli.add_command(outbox_cli)
+    app.cli.add_command(uploads_cli)
+    app.cli.add_command(catalog_cli)
+    app.cli.add_command(bookings_cli)
+    app.cli.add_command(users_cli)
+    app.cli.add_command(reset_codes_cli)
+    app.cli.add_command(tokens_cli)
+    return app
+
+
+def warm_up(app):
+    """Get a worker ready before it takes traffic.
+
+    Opens DB_WARM_CONNECTIONS pooled connections at once and returns them
+    to the pool, so the first requests skip connection setup, then builds
+    the in-memory indexes. A failure is logged and does not stop the worker.
+    Whatever did not warm up is built on first use instead.
+    """
+    with app.app_context():
+        try:
+            connections = [db.engine.connect() for _ in range(app.config['DB_WARM_CONNECTIONS'])]
+            for connection in connections:
+                connection.close()
+        except Exception:
+            app.logger.exception("Could not open database connections ahead of traffic")
+        for name, index in WARM_INDEXES:
+            try:
+                index.warm()
+            except Exception:
+                app.logger.exception(f"Could not build the {name} index; it will be built on first use")
+
+
+_app = None
+
 
-from app import views
\ No newline at end of file
+def __getattr__(name):
+    # app is built on first access, not at import. That is the app gunicorn
+    # (app:app), flask (FLASK_APP=app) and the scripts get.
+    global _app
+    if name == 'app':
+        if _app is None:
+            _app = create_app()
+        return _app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,196 @@
+"""
+The async serving mode, for running under an ASGI server instead of gunicorn:
+
+    uvicorn asgi:application --workers 4
+    gunicorn -c gunicorn.asgi.conf.py -w 4 asgi:application
+
+The read endpoints that are nearly all database wait (booking history and
+workshop slots) run as native async handlers on an async SQLAlchemy engine,
+so one worker can have hundreds of them in flight on a single thread. Every
+other /api/v1 route is the Flask app itself, run through a WSGI bridge on a
+thread pool; those block a pool thread, never the event loop. Mail never
+blocks a request in either mode, since the outbox sends it.
+"""
+
+import time
+
+from datetime import datetime
+
+import jwt
+from a2wsgi import WSGIMiddleware
+from sqlalchemy.ext.asyncio import create_async_engine
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import Response
+from starlette.routing import Mount, Route
+from werkzeug.datastructures import Accept
+from werkzeug.http import parse_accept_header
+
+from app import create_app, warm_up, metrics
+from app.config import Config
+from app.auth import decode_token
+from app.bookings import history_query, history_page, slots_query
+from app.httpcache import choose_encoding, compress
+from app.schemas import booking_history_schema, compact_booking_history_schema, booking_slot_schema
+
+# The asyncio driver to use in place of each synchronous one
+ASYNC_DRIVERS = {
+    'postgresql': 'postgresql+asyncpg',
+    'sqlite': 'sqlite+aiosqlite',
+}
+
+
+def async_database_url(url):
+    scheme, rest = url.split('://', 1)
+    dialect = scheme.split('+')[0]
+    try:
+        return f"{ASYNC_DRIVERS[dialect]}://{rest}"
+    except KeyError:
+        raise ValueError(f"No async driver for {dialect} databases")
+
+
+def create_engine(config):
+    url = async_database_url(config['SQLALCHEMY_DATABASE_URI'])
+    options = {}
+    if url.startswith('postgresql'):
+        options = {
+            'pool_size': config['DB_POOL_SIZE'],
+            'max_overflow': config['DB_MAX_OVERFLOW'],
+            'pool_timeout': config['DB_POOL_TIMEOUT'],
+            'pool_recycle': config['DB_POOL_RECYCLE'],
+            'pool_pre_ping': config['DB_POOL_PRE_PING'],
+        }
+    return create_async_engine(url, **options)
+
+
+def json_response(request, obj, status=200):
+    flask_app = request.app.state.flask_app
+    body = flask_app.json.dumps(obj).encode('utf-8') + b"\n"
+    headers = {'Vary': 'Accept-Encoding'}
+    if len(body) >= flask_app.config['COMPRESS_MIN_SIZE']:
+        encoding = choose_encoding(parse_accept_header(request.headers.get('accept-encoding'), Accept))
+        if encoding is not None:
+            body = compress(body, encoding)
+            headers['Content-Encoding'] = encoding
+    return Response(body, status_code=status, headers=headers, media_type='application/json')
+
+
+def _authenticate(flask_app, authorization):
+    """The user id of a valid bearer token, else None.
+
+    Runs on a pool thread: the revocation check can query the database (on
+    a filter hit, and when the filter syncs or rebuilds), through the
+    synchronous session.
+    """
+    parts = authorization.split()
+    if len(parts) != 2 or parts[0].lower() != 'bearer':
+        return None
+    with flask_app.app_context():
+        try:
+            return int(decode_token(parts[1])['user_id'])
+        except jwt.InvalidTokenError:
+            return None
+
+
+def native(endpoint, login_required=False):
+    """Wrap an async handler with what Flask's hooks do for the bridged routes.
+
+    Runs it in an app context (for config and the JSON provider),
+    authenticates the bearer token off the event loop when login_required,
+    and records the same request metrics.
+    """
+    def decorator(handler):
+        async def wrapped(request):
+            start = time.perf_counter()
+            flask_app = request.app.state.flask_app
+            user_id = None
+            if login_required:
+                user_id = await run_in_threadpool(_authenticate, flask_app, request.headers.get('authorization', ''))
+            with flask_app.app_context():
+                if login_required and user_id is None:
+                    response = json_response(request, {"error": "Authentication required"}, 401)
+                else:
+                    response = await handler(request, user_id)
+                metrics.inc('http_requests_total', endpoint=endpoint, method=request.method,
+                            status=str(response.status_code))
+                metrics.observe('http_request_duration_seconds', time.perf_counter() - start, endpoint=endpoint)
+            return response
+        return wrapped
+    return decorator
+
+
+def _int_arg(request, name, default):
+    try:
+        return int(request.query_params.get(name, default))
+    except ValueError:
+        return default
+
+
+async def _history_page(request, user_id):
+    limit = max(1, min(_int_arg(request, 'limit', 20), 100))
+    compact = request.query_params.get('view') == 'compact'
+    try:
+        query = history_query(user_id, request.query_params.get('cursor'), limit, compact)
+    except ValueError:
+        return json_response(request, {"error": "Invalid cursor"}, 400)
+    async with request.app.state.engine.connect() as conn:
+        rows = (await conn.execute(query)).all()
+    rows, next_cursor = history_page(rows, limit)
+    schema = compact_booking_history_schema if compact else booking_history_schema
+    return json_response(request, {"bookings": schema.many(rows), "next_cursor": next_cursor})
+
+
+@native('api.list_bookings', login_required=True)
+async def list_bookings(request, user_id):
+    return await _history_page(request, user_id)
+
+
+@native('api.user_history', login_required=True)
+async def user_history(request, user_id):
+    if request.path_params['user_id'] != user_id:
+        return json_response(request, {"error": "Unauthorized access"}, 403)
+    return await _history_page(request, user_id)
+
+
+@native('api.workshop_slots')
+async def workshop_slots(request, user_id):
+    try:
+        since = datetime.fromisoformat(request.query_params['from']) \
+            if request.query_params.get('from') else datetime.utcnow()
+    except ValueError as e:
+        return json_response(request, {"error": "Invalid from", "details": str(e)}, 400)
+    days = max(1, min(_int_arg(request, 'days', 7), 31))
+    async with request.app.state.engine.connect() as conn:
+        slots = (await conn.execute(slots_query(request.path_params['workshop_id'], since, days))).all()
+    return json_response(request, {"slots": booking_slot_schema.many(slots)})
+
+
+class ASGIConfig(Config):
+    # Nothing runs on a gevent hub here, even if the environment says
+    # GEVENT_MODE=True for the gevent workers
+    GEVENT_MODE = False
+
+
+def create_asgi_app(flask_app=None):
+    """The ASGI application: native async routes first, then the Flask app"""
+    flask_app = flask_app or create_app(ASGIConfig)
+
+    async def startup():
+        application.state.engine = create_engine(flask_app.config)
+        warm_up(flask_app)
+
+    async def shutdown():
+        await application.state.engine.dispose()
+
+    application = Starlette(
+        routes=[
+            Route('/api/v1/bookings', list_bookings, methods=['GET']),
+            Route('/api/v1/users/{user_id:int}/history', user_history, methods=['GET']),
+            Route('/api/v1/workshops/{workshop_id:int}/slots', workshop_slots, methods=['GET']),
+            Mount('/', WSGIMiddleware(flask_app, workers=flask_app.config['ASGI_BRIDGE_THREADS'])),
+        ],
+        on_startup=[startup],
+        on_shutdown=[shutdown],
+    )
+    application.state.flask_app = flask_app
+    return application
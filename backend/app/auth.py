@@ -0,0 +1,94 @@
+import hashlib
+import time
+import jwt
+
+from flask import current_app
+from werkzeug.exceptions import Unauthorized
+
+from app import db
+from app.cache import TTLCache
+from app.models import User
+from app.tokens import is_revoked
+
+_claims_cache = None
+
+
+def _get_claims_cache():
+    global _claims_cache
+    if _claims_cache is None:
+        _claims_cache = TTLCache(
+            maxsize=current_app.config['AUTH_TOKEN_CACHE_SIZE'],
+            ttl=current_app.config['AUTH_TOKEN_CACHE_TTL']
+        )
+    return _claims_cache
+
+
+def decode_token(token):
+    """Verify a bearer token and return its claims.
+
+    Verified claims are cached per process, keyed by a hash of the token, until
+    the token's own expiry. Revocation is still checked on every call, against
+    the in-memory filter. Raises the usual jwt exceptions on bad tokens.
+    """
+    cache = _get_claims_cache()
+    key = hashlib.sha256(token.encode('utf-8')).digest()
+
+    claims = cache.get(key)
+    if claims is None:
+        claims = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=["HS256"])
+        if 'user_id' not in claims:
+            raise jwt.InvalidTokenError('Token has no subject')
+        if claims.get('type') == 'refresh':
+            raise jwt.InvalidTokenError('Refresh tokens cannot authenticate requests')
+
+        ttl = claims['exp'] - time.time() if 'exp' in claims else None
+        cache.set(key, claims, ttl)
+
+    if is_revoked(claims):
+        raise jwt.InvalidTokenError('Token has been revoked')
+    return claims
+
+
+def bearer_token(request):
+    """Return the token from an 'Authorization: Bearer' header, or None"""
+    parts = request.headers.get('Authorization', '').split()
+    if len(parts) == 2 and parts[0].lower() == 'bearer':
+        return parts[1]
+    return None
+
+
+class TokenUser(object):
+    """The user behind a verified token, loaded from the database only on demand.
+
+    `id` and the token claims are available without a query. Reading or
+    writing any other attribute loads the User row once and proxies to it.
+    """
+
+    is_authenticated = True
+    is_active = True
+    is_anonymous = False
+
+    def __init__(self, claims):
+        object.__setattr__(self, 'id', int(claims['user_id']))
+        object.__setattr__(self, 'claims', claims)
+        object.__setattr__(self, '_user', None)
+
+    def get_id(self):
+        return str(self.id)
+
+    def _load(self):
+        if self._user is None:
+            user = db.session.get(User, self.id)
+            if user is None:
+                raise Unauthorized('User no longer exists')
+            object.__setattr__(self, '_user', user)
+        return self._user
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._load(), name, value)
+
+    def __repr__(self):
+        return '<TokenUser %r>' % (self.id)
@@ -0,0 +1,102 @@
+import threading
+import time
+
+from datetime import timedelta
+from flask import current_app
+from sqlalchemy import select
+
+from app import db, metrics
+from app.cache import BloomFilter
+from app.models import User
+
+# The user columns whose values must be unique, by the name clients ask with
+FIELDS = {
+    'username': User.username,
+    'email': User.email,
+}
+
+
+class TakenNames(object):
+    """Which usernames and emails are taken, answered from memory.
+
+    Every username and email in the users table goes into a Bloom filter.
+    The usual answer for a new name (free) therefore costs a few hashes and
+    no query. Only when the filter says maybe does the unique index get
+    asked. Names registered by this process are added as they commit, and
+    every TAKEN_NAMES_SYNC_INTERVAL seconds the filter also reads users who
+    joined since its last sync. It is rebuilt from the table once it holds
+    more distinct names than it was sized for. Names read again, by a sync's
+    overlap or after add(), are not counted twice.
+
+    Accounts are never renamed, so a name never leaves the filter. A freshly
+    taken name that has not synced yet may be reported free. Register's
+    INSERT still refuses it.
+    """
+
+    def __init__(self, app=None):
+        self._lock = threading.RLock()
+        self.filter = None
+        self._synced_at = 0.0
+        self._watermark = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.capacity = app.config['TAKEN_NAMES_CAPACITY']
+        self.error_rate = app.config['TAKEN_NAMES_ERROR_RATE']
+        self.sync_interval = app.config['TAKEN_NAMES_SYNC_INTERVAL']
+        self.sync_overlap = timedelta(seconds=app.config['INDEX_SYNC_OVERLAP'])
+        app.extensions['taken_names'] = self
+
+    def warm(self):
+        with self._lock:
+            self._refresh()
+
+    def _refresh(self):
+        if self.filter is not None and time.monotonic() - self._synced_at < self.sync_interval:
+            return
+        query = select(User.username, User.email, User.joined_on)
+        if self.filter is None or self.filter.count > self.filter.capacity:
+            users = db.session.scalar(select(db.func.count(User.id)))
+            # Two names per user, and room for as many again before the next rebuild
+            self.filter = BloomFilter(max(self.capacity, users * 4), self.error_rate)
+            self._watermark = None
+        elif self._watermark is not None:
+            # Allow for clock skew between the app servers stamping joined_on
+            query = query.where(User.joined_on >= self._watermark - self.sync_overlap)
+        for username, email, joined_on in db.session.execute(query.execution_options(yield_per=1000)):
+            self.filter.add(f"username:{username}")
+            self.filter.add(f"email:{email}")
+            if self._watermark is None or joined_on > self._watermark:
+                self._watermark = joined_on
+        self._synced_at = time.monotonic()
+
+    def add(self, username, email):
+        with self._lock:
+            if self.filter is not None:
+                self.filter.add(f"username:{username}")
+                self.filter.add(f"email:{email}")
+
+    def is_taken(self, field, value):
+        """Whether a user already has value as their field ('username' or 'email')"""
+        with self._lock:
+            self._refresh()
+            if f"{field}:{value}" not in self.filter:
+                metrics.inc('taken_names_checks_total', result='free')
+                return False
+        column = FIELDS[field]
+        taken = db.session.scalar(select(User.id).where(column == value)) is not None
+        metrics.inc('taken_names_checks_total', result='taken' if taken else 'false_positive')
+        return taken
+
+
+def _taken_names():
+    return current_app.extensions['taken_names']
+
+
+def is_taken(field, value):
+    return _taken_names().is_taken(field, value)
+
+
+def add_taken(username, email):
+    _taken_names().add(username, email)
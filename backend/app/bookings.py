@@ -0,0 +1,204 @@
+import time
+import base64
+import click
+
+from collections import Counter
+from datetime import datetime, timedelta
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import tuple_, update
+
+from app import db, metrics
+from app.models import Booking, BookingSlot, Workshop
+
+bookings_cli = AppGroup('bookings', help='Manage booking holds.')
+
+# Lock order is always bookings rows, then slot rows (in id order), so
+# cancels and sweeps cannot deadlock each other; reserve only takes the slot.
+
+
+def _release(slot_id, count=1):
+    db.session.execute(
+        update(BookingSlot)
+        .where(BookingSlot.id == slot_id)
+        .values(reserved=BookingSlot.reserved - count)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def expire_holds(slot_id=None, now=None):
+    """Expire lapsed holds, for one slot or all, and free their places.
+
+    Returns the number expired; the caller commits. Each hold is moved off
+    'held' by a conditional UPDATE, so it is released exactly once even when
+    several sweepers (or a sweeper and a booker) race for it.
+    """
+    now = now or datetime.utcnow()
+    expire = update(Booking).where(Booking.status == 'held', Booking.hold_expires_at <= now)
+    if slot_id is not None:
+        expire = expire.where(Booking.slot_id == slot_id)
+    expired = Counter(db.session.scalars(
+        expire.values(status='expired').returning(Booking.slot_id).execution_options(synchronize_session=False)
+    ))
+    for expired_slot_id in sorted(expired):
+        _release(expired_slot_id, expired[expired_slot_id])
+    if expired:
+        metrics.inc('bookings_total', sum(expired.values()), result='expired')
+    return sum(expired.values())
+
+
+def reserve(slot_id, user_id, service=None):
+    """Hold a place in a slot; returns (booking, 'held') or (None, why not).
+
+    The place is claimed by a single conditional UPDATE on the slot row, so
+    racing bookers only queue on that one row and the loser finds
+    reserved == capacity. No table lock or serializable transaction is needed.
+    Only when the claim misses is the slot read, to tell why: 'not_found',
+    'started' or 'full'.
+    """
+    now = datetime.utcnow()
+    claim = (
+        update(BookingSlot)
+        .where(BookingSlot.id == slot_id, BookingSlot.reserved < BookingSlot.capacity, BookingSlot.starts_at > now)
+        .values(reserved=BookingSlot.reserved + 1)
+        .execution_options(synchronize_session=False)
+    )
+    if not db.session.execute(claim).rowcount:
+        # Lapsed holds may be all that is filling the slot
+        if not expire_holds(slot_id, now) or not db.session.execute(claim).rowcount:
+            db.session.commit()
+            slot = db.session.get(BookingSlot, slot_id)
+            if slot is None:
+                result = 'not_found'
+            elif slot.starts_at <= now:
+                result = 'started'
+            else:
+                result = 'full'
+            metrics.inc('bookings_total', result=result)
+            return None, result
+
+    booking = Booking(
+        slot_id=slot_id,
+        user_id=user_id,
+        service=service,
+        status='held',
+        hold_expires_at=now + timedelta(seconds=current_app.config['BOOKING_HOLD_SECONDS'])
+    )
+    db.session.add(booking)
+    db.session.commit()
+    metrics.inc('bookings_total', result='held')
+    return booking, 'held'
+
+
+def confirm(booking_id, user_id):
+    """Turn the user's unexpired hold into a booking; False if there is none"""
+    now = datetime.utcnow()
+    confirmed = db.session.execute(
+        update(Booking)
+        .where(Booking.id == booking_id, Booking.user_id == user_id,
+               Booking.status == 'held', Booking.hold_expires_at > now)
+        .values(status='confirmed', confirmed_at=now, hold_expires_at=None)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    if confirmed:
+        metrics.inc('bookings_total', result='confirmed')
+    return bool(confirmed)
+
+
+def cancel(booking_id, user_id):
+    """Cancel the user's hold or booking and free its place; False if there is none"""
+    slot_id = db.session.scalar(
+        update(Booking)
+        .where(Booking.id == booking_id, Booking.user_id == user_id, Booking.status.in_(('held', 'confirmed')))
+        .values(status='cancelled', hold_expires_at=None)
+        .returning(Booking.slot_id)
+        .execution_options(synchronize_session=False)
+    )
+    if slot_id is None:
+        db.session.rollback()
+        return False
+    _release(slot_id)
+    db.session.commit()
+    metrics.inc('bookings_total', result='cancelled')
+    return True
+
+
+##
+# History
+##
+
+# The compact view reads only these, which ix_bookings_user_id_created_at_id covers
+COMPACT_COLUMNS = (Booking.id, Booking.slot_id, Booking.status, Booking.service, Booking.created_at)
+
+FULL_COLUMNS = COMPACT_COLUMNS + (
+    Booking.hold_expires_at, Booking.confirmed_at, BookingSlot.starts_at, BookingSlot.ends_at,
+    BookingSlot.workshop_id, Workshop.name.label('workshop_name'), Workshop.address.label('workshop_address')
+)
+
+
+def encode_cursor(created_at, booking_id):
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{booking_id}".encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """The (created_at, id) a cursor points at; raises ValueError if it is malformed"""
+    created_at, booking_id = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode().split('|')
+    return datetime.fromisoformat(created_at), int(booking_id)
+
+
+def history_query(user_id, cursor=None, limit=20, compact=False):
+    """The statement behind history(), for running on any connection"""
+    if compact:
+        query = db.select(*COMPACT_COLUMNS)
+    else:
+        query = db.select(*FULL_COLUMNS) \
+            .join(BookingSlot, BookingSlot.id == Booking.slot_id) \
+            .join(Workshop, Workshop.id == BookingSlot.workshop_id)
+    query = query.where(Booking.user_id == user_id)
+    if cursor is not None:
+        query = query.where(tuple_(Booking.created_at, Booking.id) < decode_cursor(cursor))
+    return query.order_by(Booking.created_at.desc(), Booking.id.desc()).limit(limit + 1)
+
+
+def history_page(rows, limit):
+    """Split the rows of a history_query() into the page and the next cursor"""
+    if len(rows) <= limit:
+        return rows, None
+    return rows[:limit], encode_cursor(rows[limit - 1].created_at, rows[limit - 1].id)
+
+
+def history(user_id, cursor=None, limit=20, compact=False):
+    """A page of the user's bookings, newest first, and the cursor of the next page.
+
+    Pages seek to the rows below the cursor's (created_at, id) on
+    ix_bookings_user_id_created_at_id instead of using OFFSET, so a late page
+    costs the same as the first. Raises ValueError for a malformed cursor.
+    """
+    rows = db.session.execute(history_query(user_id, cursor, limit, compact)).all()
+    return history_page(rows, limit)
+
+
+def slots_query(workshop_id, since, days):
+    """A workshop's slots starting within days of since, in time order"""
+    return db.select(BookingSlot) \
+        .where(BookingSlot.workshop_id == workshop_id, BookingSlot.starts_at >= since,
+               BookingSlot.starts_at < since + timedelta(days=days)) \
+        .order_by(BookingSlot.starts_at)
+
+
+@bookings_cli.command('expire')
+@click.option('--once', is_flag=True, help='Expire what has lapsed and exit instead of polling.')
+@click.option('--interval', type=float, default=None, help='Seconds between sweeps.')
+def expire_command(once, interval):
+    """Expire lapsed booking holds and free their slots"""
+    interval = interval if interval is not None else current_app.config['BOOKING_SWEEP_INTERVAL']
+    while True:
+        expired = expire_holds()
+        db.session.commit()
+        if expired:
+            metrics.flush()
+            current_app.logger.info(f"Expired {expired} booking holds")
+        if once:
+            break
+        time.sleep(interval)
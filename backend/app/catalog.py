@@ -0,0 +1,170 @@
+import bisect
+import time
+import click
+
+from blinker import Namespace
+from flask import current_app, has_app_context
+from flask.cli import AppGroup
+from sqlalchemy import event, insert, update
+from sqlalchemy.orm import Session
+
+from app import db
+from app.cache import TTLCache
+from app.models import CatalogItem, CatalogMeta
+from app.schemas import catalog_item_schema, catalog_item_input_schema
+
+catalog_cli = AppGroup('catalog', help='Manage the service, rental and parts catalog.')
+
+# Sent after a commit that touched the catalog, with the serialized items
+# upserted (by id) and the ids deleted
+_signals = Namespace()
+catalog_changed = _signals.signal('catalog-changed')
+
+EDITABLE_FIELDS = tuple(catalog_item_input_schema.fields)
+
+
+serialize_item = catalog_item_schema.one
+
+
+class CatalogCache(object):
+    """Per-process, precomputed catalog listings.
+
+    Each kind is loaded and serialised once per catalog version, and rendered
+    pages are kept as ready-to-send bytes. Writes in this process invalidate it
+    on commit; other workers notice the bumped catalog_meta version within
+    CATALOG_VERSION_CHECK_INTERVAL seconds.
+    """
+
+    def __init__(self, app=None):
+        self._version = None
+        self._checked_at = 0.0
+        self._lists = {}
+        self._pages = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.check_interval = app.config['CATALOG_VERSION_CHECK_INTERVAL']
+        self._pages = TTLCache(maxsize=app.config['CATALOG_CACHE_PAGES'], ttl=24 * 60 * 60)
+        app.extensions['catalog_cache'] = self
+
+    def invalidate(self):
+        self._checked_at = 0.0
+
+    def version(self):
+        now = time.monotonic()
+        if self._version is None or now - self._checked_at > self.check_interval:
+            version = db.session.query(CatalogMeta.version).filter_by(id=1).scalar() or 0
+            if version != self._version:
+                self._lists.clear()
+                self._pages.clear()
+                self._version = version
+            self._checked_at = now
+        return self._version
+
+    def items(self, kind):
+        """(ids, serialised items) for one kind, ordered by id"""
+        self.version()
+        cached = self._lists.get(kind)
+        if cached is None:
+            rows = CatalogItem.query.filter_by(kind=kind).order_by(CatalogItem.id).all()
+            items = catalog_item_schema.many(rows)
+            cached = self._lists[kind] = ([item['id'] for item in items], items)
+        return cached
+
+    def page(self, kind, cursor, limit):
+        """Rendered JSON for the page after cursor (an item id, or None)"""
+        key = (kind, cursor, limit)
+        body = self._pages.get(key)
+        if body is None:
+            ids, items = self.items(kind)
+            start = bisect.bisect_right(ids, cursor) if cursor is not None else 0
+            page = items[start:start + limit]
+            has_more = start + limit < len(items)
+            body = current_app.json.dumps({
+                "items": page,
+                "next_cursor": page[-1]['id'] if has_more else None,
+                "version": self._version
+            })
+            self._pages.set(key, body)
+        return body
+
+
+##
+# Version bumps and change notification
+##
+
+@event.listens_for(Session, 'after_flush')
+def _record_catalog_changes(session, flush_context):
+    upserted = {o.id: o for o in session.new | session.dirty if isinstance(o, CatalogItem)}
+    deleted = {o.id for o in session.deleted if isinstance(o, CatalogItem)}
+    if not upserted and not deleted:
+        return
+
+    bumped = session.execute(
+        update(CatalogMeta).where(CatalogMeta.id == 1).values(version=CatalogMeta.version + 1)
+    )
+    if not bumped.rowcount:
+        session.execute(insert(CatalogMeta).values(id=1, version=1))
+
+    # Serialize now, while the rows are loaded; no SQL may run after the commit
+    changes = session.info.setdefault('catalog_changes', {'upserted': {}, 'deleted': set()})
+    for item_id, item in upserted.items():
+        changes['upserted'][item_id] = serialize_item(item)
+    for item_id in deleted:
+        changes['upserted'].pop(item_id, None)
+    changes['deleted'] |= deleted
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_catalog_changes(session):
+    changes = session.info.pop('catalog_changes', None)
+    if not changes or not has_app_context():
+        return
+    cache = current_app.extensions.get('catalog_cache')
+    if cache is not None:
+        cache.invalidate()
+    catalog_changed.send(current_app._get_current_object(), **changes)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_catalog_changes(session):
+    session.info.pop('catalog_changes', None)
+
+
+##
+# Commands
+##
+
+DEFAULT_CATALOG = [
+    dict(kind='services', title='Repair Service', type='Repair', icon='repair', image='image1'),
+    dict(kind='services', title='Flat Tyre Service', type='Flat Tyre', icon='wheel', image='image2'),
+    dict(kind='services', title='Flat Battery Service', type='Flat Battery', icon='battery', image='image3'),
+    dict(kind='services', title='Wash Service', type='Wash', icon='wash', image='image4'),
+    dict(kind='services', title='Recovery Service', type='Recovery', icon='crane', image='image5'),
+    dict(kind='services', title='Oil Change Service', type='Oil Change', icon='oil', image='image6'),
+    dict(kind='rentals', title='Car Rent Service', image='car'),
+    dict(kind='rentals', title='Motorcycle Service', image='motorcycle'),
+    dict(kind='rentals', title='Bicycle Rent Service', image='bicycle'),
+    dict(kind='rentals', title='Truck Rent Service', image='truck'),
+]
+
+
+@catalog_cli.command('seed')
+def seed_command():
+    """Load the catalog the app used to ship hardcoded"""
+    if CatalogItem.query.first():
+        click.echo('Catalog already has items; nothing to do.')
+        return
+    for entry in DEFAULT_CATALOG:
+        item = CatalogItem(**entry)
+        if item.kind == 'services':
+            item.frequency = '24/7'
+            item.rating = 4.9
+            item.users_count = 1605000
+            item.price = 100
+            item.price_unit = 'hour'
+            item.description = 'The Model B was a Ford automobile with production starting in model year 1932'
+        db.session.add(item)
+    db.session.commit()
+    click.echo(f"Added {len(DEFAULT_CATALOG)} catalog items.")
@@ -1,8 +1,18 @@
-from app.__init__ import create_app, db
+"""
+The app as the flask command sees it (FLASK_APP=app.cli): the served app
+plus Flask-Migrate for 'flask db', which the web workers do without.
+"""
+
+from flask_migrate import Migrate
+
+from app import create_app, db
 from app.models import User
 
 app = create_app()
 
+# Instantiate Flask-Migrate library here
+migrate = Migrate(app, db)
+
 @app.shell_context_processor
 def make_shell_context():
-    return {'db': db, 'User': User}
\ No newline at end of file
+    return {'db': db, 'User': User}
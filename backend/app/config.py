@@ -1,4 +1,5 @@
 import os
+import tempfile
 from datetime import timedelta
 from os.path import join, dirname
 from dotenv import load_dotenv
@@ -16,15 +17,78 @@ class Config(object):
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB
 
+    # Profile photo variants generated on upload
+    PHOTO_SIZES = (64, 256, 1024)
+    PHOTO_FORMATS = ('webp', 'jpeg')
+    PHOTO_DEFAULT_SIZE = 256
+    PHOTO_QUALITY = 80
+    # Processes encoding variants off-request; 0 encodes inline, during the upload
+    IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', 2))
+
+    # Photo blob storage; see app.storage.STORAGE_BACKENDS
+    PHOTO_STORAGE_BACKEND = os.environ.get('PHOTO_STORAGE_BACKEND', 'local')
+    PHOTO_STORAGE_OPTIONS = {'root': os.path.join(UPLOAD_FOLDER, 'photos')}
+    PHOTO_CACHE_MAX_AGE = 365 * 24 * 60 * 60
     
     # Database
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', '').replace('postgres://', 'postgresql://')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # Connection pool, per worker process (PostgreSQL only)
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 20))
+    DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10))
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+    DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', 'True') == 'True'
+
+    # Gevent mode: make psycopg2 cooperative under gunicorn's gevent worker
+    GEVENT_MODE = os.environ.get('GEVENT_MODE', 'False') == 'True'
+
+    # Connections app.warm_up() opens per worker before it takes traffic
+    DB_WARM_CONNECTIONS = int(os.environ.get('DB_WARM_CONNECTIONS', 2))
+
+    # ASGI mode (app.asgi): threads per worker running the Flask routes that have
+    # no native async version
+    ASGI_BRIDGE_THREADS = int(os.environ.get('ASGI_BRIDGE_THREADS', 10))
+
     # JWT
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'your-jwt-secret-key')
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=1)
 
+    # JSON encoding and parsing for requests and responses: 'orjson' or Flask's 'default'
+    JSON_PROVIDER = os.environ.get('JSON_PROVIDER', 'orjson')
+
+    # Response compression (app.httpcache): bodies smaller than this go out as they
+    # are; compressed bodies of responses with an ETag are kept for reuse
+    COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+    COMPRESS_GZIP_LEVEL = 6
+    COMPRESS_BROTLI_QUALITY = 5
+    COMPRESS_CACHE_SIZE = 256
+
+    # Authentication: 'session' (cookie + user_loader) or 'token' (bearer only)
+    AUTH_MODE = os.environ.get('AUTH_MODE', 'token')
+    AUTH_TOKEN_CACHE_SIZE = int(os.environ.get('AUTH_TOKEN_CACHE_SIZE', 4096))
+    AUTH_TOKEN_CACHE_TTL = int(os.environ.get('AUTH_TOKEN_CACHE_TTL', 300))
+
+    # Short-lived access tokens, renewed with single-use refresh tokens (app.tokens)
+    ACCESS_TOKEN_TTL = int(os.environ.get('ACCESS_TOKEN_TTL', 15 * 60))
+    REFRESH_TOKEN_TTL = int(os.environ.get('REFRESH_TOKEN_TTL', 30 * 24 * 3600))
+    # The in-memory revocation filter: ids it is sized for before it is rebuilt
+    # larger, its false positive rate (each costs one lookup), and how often it
+    # picks up revocations made by other processes
+    TOKEN_REVOCATION_CAPACITY = int(os.environ.get('TOKEN_REVOCATION_CAPACITY', 100000))
+    TOKEN_REVOCATION_ERROR_RATE = 0.001
+    TOKEN_REVOCATION_SYNC_INTERVAL = float(os.environ.get('TOKEN_REVOCATION_SYNC_INTERVAL', 5.0))
+    TOKEN_SWEEP_INTERVAL = 300.0
+    TOKEN_SWEEP_BATCH_SIZE = 1000
+
+    # The in-memory filter of taken usernames and emails (app.availability),
+    # configured the same way: names it is sized for, false positive rate and
+    # how often it picks up users who registered through other processes
+    TAKEN_NAMES_CAPACITY = int(os.environ.get('TAKEN_NAMES_CAPACITY', 200000))
+    TAKEN_NAMES_ERROR_RATE = 0.001
+    TAKEN_NAMES_SYNC_INTERVAL = float(os.environ.get('TAKEN_NAMES_SYNC_INTERVAL', 5.0))
+
     # Mail
     MAIL_SERVER =  os.environ.get('MAIL_SERVER') 
     MAIL_PORT = 2525
@@ -32,11 +96,106 @@ class Config(object):
     MAIL_USE_SSL = False
     MAIL_USERNAME = os.environ.get('MAIL_USERNAME') 
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD') 
+    MAIL_DEFAULT_SENDER = os.environ.get('MAIL_DEFAULT_SENDER', 'noreply@yourdomain.com')
+
+    # Mail outbox
+    OUTBOX_BATCH_SIZE = int(os.environ.get('OUTBOX_BATCH_SIZE', 50))
+    OUTBOX_POLL_INTERVAL = float(os.environ.get('OUTBOX_POLL_INTERVAL', 2.0))
+    OUTBOX_MAX_ATTEMPTS = int(os.environ.get('OUTBOX_MAX_ATTEMPTS', 5))
+    OUTBOX_RETRY_BASE = 30  # seconds, doubled per attempt
+    OUTBOX_RETRY_MAX = 3600
+
+    # Password hashing
+    PASSWORD_HASH_METHOD = 'pbkdf2:sha256'
+    HASH_WORKERS = int(os.environ.get('HASH_WORKERS', os.cpu_count() or 1))
+    HASH_MAX_PENDING = int(os.environ.get('HASH_MAX_PENDING', 64))
+    HASH_QUEUE_TIMEOUT = float(os.environ.get('HASH_QUEUE_TIMEOUT', 2.0))
+
+    # Rate limits on the unauthenticated auth endpoints, as token buckets of
+    # (requests, per seconds) per endpoint and key. 'memory' buckets are per
+    # worker; 'shared' ones are shared by the workers on a host through a
+    # memory-mapped file, and 'redis' ones by every host.
+    RATELIMIT_ENABLED = os.environ.get('RATELIMIT_ENABLED', 'True') == 'True'
+    RATELIMIT_BACKEND = os.environ.get('RATELIMIT_BACKEND', 'memory')
+    RATELIMIT_BACKEND_OPTIONS = {
+        'memory': {'max_keys': 100000},
+        'shared': {
+            'path': os.environ.get('RATELIMIT_SHARED_PATH', os.path.join(tempfile.gettempdir(), 'autocare-ratelimit')),
+            'slots': 65536
+        },
+        'redis': {'url': os.environ.get('RATELIMIT_REDIS_URL', 'redis://localhost:6379/0')},
+    }
+    RATELIMITS = {
+        'api.login': {'ip': (30, 60), 'email': (10, 300)},
+        'api.register': {'ip': (20, 3600), 'username': (5, 3600), 'email': (5, 3600)},
+        'api.request_reset': {'ip': (10, 3600), 'email': (3, 900)},
+        'api.verify_code': {'ip': (30, 600), 'email': (10, 600)},
+        'api.reset_password_with_token': {'ip': (10, 600)},
+        'api.availability': {'ip': (60, 60)},
+    }
+
+    # Proxies in front of the app. With PROXY_FIX_X_FOR set to the number of
+    # proxies that append to X-Forwarded-For, request.remote_addr (and so the
+    # 'ip' rate limits) is the client rather than the nearest proxy. 0 trusts
+    # no forwarded headers, which is right when clients connect directly.
+    PROXY_FIX_X_FOR = int(os.environ.get('PROXY_FIX_X_FOR', 0))
+    PROXY_FIX_X_PROTO = int(os.environ.get('PROXY_FIX_X_PROTO', 0))
 
     # CSRF
     WTF_CSRF_ENABLED = False 
     WTF_CSRF_CHECK_DEFAULT = False
 
+    # Metrics: point METRICS_DIR at a directory shared by all workers (and emptied on
+    # deploy, like prometheus_client's multiprocess dir) to aggregate them
+    METRICS_DIR = os.environ.get('METRICS_DIR')
+    METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 5.0))
+
+    # SQL profiling: per request via header, or for every request
+    SQL_PROFILER_ENABLED = os.environ.get('SQL_PROFILER_ENABLED', 'False') == 'True'
+    SQL_PROFILER_ALLOW_HEADER = os.environ.get('SQL_PROFILER_ALLOW_HEADER', 'False') == 'True'
+    SQL_PROFILER_HEADER = 'X-Profile-SQL'
+    SQL_PROFILER_REPEAT_THRESHOLD = 3
+    SQL_SLOW_QUERY_MS = float(os.environ.get('SQL_SLOW_QUERY_MS', 200))
+    SQL_SLOW_QUERY_LOG = os.environ.get('SQL_SLOW_QUERY_LOG')  # defaults to the app log
+
+    # Catalog listings: page sizes, and how often workers check for catalog writes
+    CATALOG_PAGE_SIZE = 20
+    CATALOG_MAX_PAGE_SIZE = 100
+    CATALOG_VERSION_CHECK_INTERVAL = float(os.environ.get('CATALOG_VERSION_CHECK_INTERVAL', 5.0))
+    CATALOG_CACHE_PAGES = 1024
+
+    # Catalog search
+    SEARCH_DEFAULT_LIMIT = 20
+    SEARCH_MAX_LIMIT = 50
+
+    # Workshop discovery
+    WORKSHOP_GRID_DEGREES = 0.02  # spatial index cell size, about 2.2km of latitude
+    WORKSHOP_SYNC_INTERVAL = float(os.environ.get('WORKSHOP_SYNC_INTERVAL', 5.0))
+    WORKSHOP_DEFAULT_RESULTS = 10
+    WORKSHOP_MAX_RESULTS = 50
+    WORKSHOP_DEFAULT_RADIUS_KM = 25
+    WORKSHOP_MAX_RADIUS_KM = 200
+
+    # Bookings: how long a place is held before it must be confirmed
+    BOOKING_HOLD_SECONDS = int(os.environ.get('BOOKING_HOLD_SECONDS', 5 * 60))
+    BOOKING_SWEEP_INTERVAL = 30.0
+
+    # Password reset codes: lifetime, wrong guesses allowed, and how often
+    # `flask reset-codes sweep` deletes dead ones, in batches of this many rows
+    RESET_CODE_TTL = int(os.environ.get('RESET_CODE_TTL', 15 * 60))
+    RESET_CODE_MAX_ATTEMPTS = int(os.environ.get('RESET_CODE_MAX_ATTEMPTS', 5))
+    RESET_CODE_SWEEP_INTERVAL = 60.0
+    RESET_CODE_SWEEP_BATCH_SIZE = 1000
+
+    # Seconds re-read when the in-memory indexes sync, for clock skew between servers
+    INDEX_SYNC_OVERLAP = 60
+
+    # Most users GET /api/v1/users?ids= returns in one request
+    USERS_BATCH_MAX_IDS = int(os.environ.get('USERS_BATCH_MAX_IDS', 100))
+
+    # Admin endpoints are limited to these user ids (comma-separated)
+    ADMIN_USER_IDS = {int(i) for i in os.environ.get('ADMIN_USER_IDS', '').split(',') if i.strip()}
+
     # Security
     SECRET_KEY = os.environ.get('SECRET_KEY')
     SECURITY_PASSWORD_SALT = os.environ.get('SECURITY_PASSWORD_SALT')
@@ -0,0 +1,109 @@
+import time
+
+from sqlalchemy import exc
+from sqlalchemy.pool import QueuePool
+
+
+class PoolStats(object):
+    def __init__(self):
+        self.checkouts = 0
+        self.waited = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.exhausted = 0
+
+
+class MonitoredQueuePool(QueuePool):
+    """A QueuePool that records how long checkouts wait and how often it runs dry"""
+
+    # Checkouts faster than this are served from idle connections; slower ones waited
+    WAIT_THRESHOLD = 0.001
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            self.stats.exhausted += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            self.stats.checkouts += 1
+            self.stats.wait_seconds += elapsed
+            if elapsed > self.WAIT_THRESHOLD:
+                self.stats.waited += 1
+            if elapsed > self.stats.max_wait_seconds:
+                self.stats.max_wait_seconds = elapsed
+
+
+def engine_options(config):
+    """SQLAlchemy engine options for the configured database.
+
+    Pool sizing only applies to server databases; SQLite keeps its defaults.
+    """
+    if not config['SQLALCHEMY_DATABASE_URI'].startswith('postgresql'):
+        return {}
+    return {
+        'poolclass': MonitoredQueuePool,
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+    }
+
+
+def gevent_wait_callback(conn, timeout=None):
+    """Yield to the gevent hub while psycopg2 waits on the server"""
+    from gevent.socket import wait_read, wait_write
+    from psycopg2 import OperationalError, extensions
+
+    while True:
+        state = conn.poll()
+        if state == extensions.POLL_OK:
+            break
+        elif state == extensions.POLL_READ:
+            wait_read(conn.fileno(), timeout=timeout)
+        elif state == extensions.POLL_WRITE:
+            wait_write(conn.fileno(), timeout=timeout)
+        else:
+            raise OperationalError("Bad result from poll: %r" % state)
+
+
+def make_psycopg2_cooperative():
+    """Make psycopg2 block greenlets instead of the whole gevent worker"""
+    from psycopg2 import extensions
+    extensions.set_wait_callback(gevent_wait_callback)
+
+
+def pool_status(engine):
+    """Snapshot of the engine's pool for the diagnostics endpoint"""
+    pool = engine.pool
+    status = {
+        "pool_class": type(pool).__name__,
+        "status": pool.status(),
+    }
+    if isinstance(pool, QueuePool):
+        status.update({
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": pool.overflow(),
+            "max_overflow": pool._max_overflow,
+            "timeout": pool.timeout(),
+        })
+    stats = getattr(pool, 'stats', None)
+    if stats is not None:
+        status.update({
+            "checkouts": stats.checkouts,
+            "checkouts_waited": stats.waited,
+            "wait_seconds_total": round(stats.wait_seconds, 6),
+            "wait_seconds_avg": round(stats.wait_seconds / stats.checkouts, 6) if stats.checkouts else 0.0,
+            "wait_seconds_max": round(stats.max_wait_seconds, 6),
+            "exhausted": stats.exhausted,
+        })
+    return status
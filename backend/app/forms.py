@@ -1,7 +1,7 @@
 from flask_wtf import FlaskForm
 from wtforms import StringField, PasswordField, TextAreaField, FileField
 from wtforms.validators import DataRequired, Email, Length, ValidationError, Optional
-from app.models import User
+from app.availability import is_taken
 
 class RegistrationForm(FlaskForm):
     username = StringField('Username', validators=[DataRequired(), Length(min=4, max=64)])
@@ -13,13 +13,11 @@ class RegistrationForm(FlaskForm):
     profile_photo = FileField('Profile Photo')
     
     def validate_username(self, username):
-        user = User.query.filter_by(username=username.data).first()
-        if user:
+        if is_taken('username', username.data):
             raise ValidationError('Username is already taken. Please choose a different one.')
     
     def validate_email(self, email):
-        user = User.query.filter_by(email=email.data).first()
-        if user:
+        if is_taken('email', email.data):
             raise ValidationError('Email is already registered. Please use a different one.')
 
 class LoginForm(FlaskForm):
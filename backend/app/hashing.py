@@ -0,0 +1,72 @@
+import threading
+import time
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+from app.workers import LazyProcessPool
+
+
+class HashingOverloaded(Exception):
+    """Raised when the hashing queue is full and a request cannot be admitted"""
+
+    def __init__(self, retry_after=1):
+        super().__init__("Password hashing is at capacity")
+        self.retry_after = retry_after
+
+
+class PasswordHasher(object):
+    """Runs pbkdf2 hashing in a bounded process pool instead of on the request worker.
+
+    At most HASH_WORKERS hashes run at once and at most HASH_MAX_PENDING may be
+    queued behind them; anything beyond that waits up to HASH_QUEUE_TIMEOUT for
+    a slot and then fails fast with HashingOverloaded. Setting HASH_WORKERS to 0
+    hashes inline, which is what the CLI and local debugging want.
+    """
+
+    def __init__(self, app=None):
+        self.method = 'pbkdf2:sha256'
+        self.workers = 0
+        self.timeout = 2.0
+        self._slots = None
+        self._pool = None
+        self.metrics = None
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.method = app.config['PASSWORD_HASH_METHOD']
+        self.workers = app.config['HASH_WORKERS']
+        self.timeout = app.config['HASH_QUEUE_TIMEOUT']
+        self._slots = threading.BoundedSemaphore(self.workers + app.config['HASH_MAX_PENDING'])
+        self._pool = LazyProcessPool(self.workers or None)
+        self.metrics = app.extensions.get('metrics')
+        app.extensions['password_hasher'] = self
+
+    def _run(self, op, fn, *args):
+        start = time.perf_counter()
+        try:
+            if not self.workers:
+                return fn(*args)
+
+            if not self._slots.acquire(timeout=self.timeout):
+                raise HashingOverloaded(retry_after=max(1, int(self.timeout)))
+            try:
+                return self._pool.submit(fn, *args).result()
+            finally:
+                self._slots.release()
+        finally:
+            if self.metrics is not None:
+                self.metrics.observe('password_hash_duration_seconds', time.perf_counter() - start, op=op)
+
+    def hash(self, password):
+        """Return a salted hash of password"""
+        return self._run('hash', generate_password_hash, password, self.method)
+
+    def verify(self, pwhash, password):
+        """Check password against a stored hash"""
+        return self._run('verify', check_password_hash, pwhash, password)
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown()
@@ -0,0 +1,117 @@
+import gzip
+
+from functools import wraps
+from flask import current_app, make_response, request
+
+from app.cache import TTLCache
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = {'application/json', 'text/plain', 'text/html', 'text/csv'}
+
+_compressed_cache = None
+
+
+def _get_compressed_cache():
+    global _compressed_cache
+    if _compressed_cache is None:
+        _compressed_cache = TTLCache(maxsize=current_app.config['COMPRESS_CACHE_SIZE'], ttl=3600)
+    return _compressed_cache
+
+
+def conditional(etag, public=False):
+    """View decorator answering revalidation before the view runs.
+
+    etag is called with the view's arguments and returns a tag that changes
+    whenever the response would (a version number, say), or None to just run
+    the view. A GET whose If-None-Match holds the tag gets a 304 without the
+    view being called; otherwise a 200 goes out with the tag. Tags are weak,
+    since compressed() may send the same content in different encodings.
+    Responses must be revalidated before reuse, and are private to the user
+    unless public is set.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(*args, **kwargs)
+            tag = etag(*args, **kwargs)
+            if tag is None:
+                return view(*args, **kwargs)
+
+            if request.if_none_match.contains_weak(tag):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(tag, weak=True)
+            if public:
+                response.cache_control.public = True
+            else:
+                response.cache_control.private = True
+            response.cache_control.no_cache = True
+            return response
+        return wrapped
+    return decorator
+
+
+def choose_encoding(accept_encodings):
+    """The best encoding we can produce from a parsed Accept-Encoding, or None"""
+    return accept_encodings.best_match(('br', 'gzip') if brotli is not None else ('gzip',))
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=current_app.config['COMPRESS_BROTLI_QUALITY'])
+    # mtime=0 keeps the output, and so any cached copy, byte-identical
+    return gzip.compress(data, compresslevel=current_app.config['COMPRESS_GZIP_LEVEL'], mtime=0)
+
+
+def compress_response(response):
+    """Compress a response body in place, with brotli or gzip as the client accepts.
+
+    Bodies under COMPRESS_MIN_SIZE are sent as they are, since the headers
+    would eat most of the saving. A response with an ETag names its content,
+    so its compressed body is kept and reused until the tag changes.
+    """
+    if response.status_code != 200 or response.direct_passthrough or 'Content-Encoding' in response.headers:
+        return response
+    if response.mimetype not in COMPRESSIBLE_MIMETYPES:
+        return response
+    response.vary.add('Accept-Encoding')
+
+    data = response.get_data()
+    if len(data) < current_app.config['COMPRESS_MIN_SIZE']:
+        return response
+    encoding = choose_encoding(request.accept_encodings)
+    if encoding is None:
+        return response
+
+    tag, weak = response.get_etag()
+    if tag is None:
+        compressed = compress(data, encoding)
+    else:
+        cache = _get_compressed_cache()
+        compressed = cache.get((tag, encoding))
+        if compressed is None:
+            compressed = compress(data, encoding)
+            cache.set((tag, encoding), compressed)
+        if not weak:
+            # The same tag now covers more than one byte sequence
+            response.set_etag(tag, weak=True)
+
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def compressed(view):
+    """View decorator compressing large text responses; see compress_response()"""
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        return compress_response(make_response(view(*args, **kwargs)))
+    return wrapped
@@ -0,0 +1,201 @@
+import os
+import uuid
+
+from app.storage import create_backend, save_hashed
+from app.workers import LazyProcessPool
+
+# Pillow format name and mimetype for each variant extension we serve
+VARIANT_FORMATS = {
+    'webp': ('WEBP', 'image/webp'),
+    'jpeg': ('JPEG', 'image/jpeg'),
+}
+
+# Formats accepted on upload, as reported by Pillow from the file header
+SOURCE_FORMATS = {'PNG', 'JPEG', 'GIF'}
+
+# Pillow is imported by the functions that use it, on the first upload or
+# photo request, rather than by every process that imports the app
+
+
+def variant_key(digest, size, fmt):
+    """Storage key of one variant; digest is the sha256 of the uploaded bytes"""
+    return f"{digest}/{size}.{fmt}"
+
+
+def sniff_image(stream):
+    """Describe an image from its header as (format, width, height), or None.
+
+    Only the header is parsed; the stream is rewound afterwards. Dimensions
+    are as displayed, i.e. after EXIF orientation is applied.
+    """
+    from PIL import Image
+    try:
+        with Image.open(stream) as im:
+            width, height = im.size
+            if im.format == 'JPEG' and im.getexif().get(0x0112) in (5, 6, 7, 8):
+                width, height = height, width
+            return im.format, width, height
+    except Exception:
+        return None
+    finally:
+        stream.seek(0)
+
+
+def mime_type(pil_format):
+    from PIL import Image
+    return Image.MIME.get(pil_format, 'application/octet-stream')
+
+
+def render_variants(src_path, store, digest, sizes, formats, quality):
+    """Normalise an upload and store every size/format variant of it.
+
+    Runs in a worker process. Orientation is baked in from EXIF and no
+    metadata is carried over. Variants are encoded next to the source and
+    moved into the store whole, so readers never see a partial image.
+    """
+    from PIL import Image, ImageOps
+    scratch = os.path.dirname(src_path)
+    with Image.open(src_path) as im:
+        im.draft('RGB', (max(sizes), max(sizes)))
+        im = ImageOps.exif_transpose(im)
+        if im.mode not in ('RGB', 'RGBA'):
+            im = im.convert('RGBA' if 'transparency' in im.info or im.mode in ('LA', 'PA') else 'RGB')
+
+        # Resize from the largest variant down; each step starts from the last
+        current = im
+        for size in sorted(sizes, reverse=True):
+            current = current.copy()
+            current.thumbnail((size, size), Image.LANCZOS)
+            for fmt in formats:
+                key = variant_key(digest, size, fmt)
+                if store.exists(key):
+                    continue
+                pil_format, _ = VARIANT_FORMATS[fmt]
+                out = current.convert('RGB') if pil_format == 'JPEG' else current
+                tmp = os.path.join(scratch, f"{uuid.uuid4().hex}.{fmt}.tmp")
+                if pil_format == 'JPEG':
+                    out.save(tmp, pil_format, quality=quality, optimize=True, progressive=True)
+                else:
+                    out.save(tmp, pil_format, quality=quality, method=4)
+                store.put_file(key, tmp)
+    return digest
+
+
+class ImagePipeline(object):
+    """Turns raw profile photo uploads into resized, metadata-free variants.
+
+    Photos are addressed by the sha256 of the uploaded bytes, so identical
+    uploads share one set of variants. Uploads are parked under
+    UPLOAD_FOLDER/originals and encoded into the store in a process pool after
+    the request returns (or inline, with IMAGE_WORKERS at 0); the original is
+    deleted once its variants exist.
+    ensure() renders synchronously for the brief window before the background
+    job lands.
+    """
+
+    def __init__(self, app=None):
+        self.workers = 0
+        self._pool = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.upload_folder = app.config['UPLOAD_FOLDER']
+        self.originals_folder = os.path.join(self.upload_folder, 'originals')
+        self.sizes = tuple(app.config['PHOTO_SIZES'])
+        self.formats = tuple(app.config['PHOTO_FORMATS'])
+        self.quality = app.config['PHOTO_QUALITY']
+        self.store = create_backend(app.config['PHOTO_STORAGE_BACKEND'], **app.config['PHOTO_STORAGE_OPTIONS'])
+        self.logger = app.logger
+        self.workers = app.config['IMAGE_WORKERS']
+        self._pool = LazyProcessPool(self.workers or None)
+        app.extensions['image_pipeline'] = self
+
+    def pick_size(self, requested):
+        """Smallest variant at least as large as requested, else the largest"""
+        for size in sorted(self.sizes):
+            if requested <= size:
+                return size
+        return max(self.sizes)
+
+    def variant_keys(self, digest):
+        return [variant_key(digest, size, fmt) for size in self.sizes for fmt in self.formats]
+
+    def original_path(self, digest):
+        """Where a raw upload waits for processing (format is sniffed, not named)"""
+        return os.path.join(self.originals_folder, digest)
+
+    def _render(self, src_path, digest):
+        try:
+            render_variants(src_path, self.store, digest, self.sizes, self.formats, self.quality)
+            os.remove(src_path)
+        except FileNotFoundError:
+            # Another renderer finished first and already removed the original
+            pass
+
+    def ingest(self, stream):
+        """Store an upload and queue its variants; returns (digest, size in bytes).
+
+        Re-uploading bytes the store already holds costs one hash and no encoding.
+        """
+        digest, size = save_hashed(stream, self.originals_folder)
+        src_path = self.original_path(digest)
+        if all(self.store.exists(key) for key in self.variant_keys(digest)):
+            try:
+                os.remove(src_path)
+            except FileNotFoundError:
+                # A concurrent upload of the same bytes got there first
+                pass
+        else:
+            self.submit(src_path, digest)
+        return digest, size
+
+    def submit(self, src_path, digest):
+        """Queue variant generation for an upload saved at src_path.
+
+        With IMAGE_WORKERS set to 0 the variants are rendered inline instead,
+        and None is returned.
+        """
+        if not self.workers:
+            try:
+                self._render(src_path, digest)
+            except Exception as e:
+                self.logger.error(f"Image processing failed for {digest}: {str(e)}")
+            return None
+
+        future = self._pool.submit(
+            render_variants, src_path, self.store, digest, self.sizes, self.formats, self.quality
+        )
+
+        def done(f):
+            try:
+                f.result()
+            except FileNotFoundError:
+                return
+            except Exception as e:
+                self.logger.error(f"Image processing failed for {digest}: {str(e)}")
+                return
+            try:
+                os.remove(src_path)
+            except FileNotFoundError:
+                pass
+
+        future.add_done_callback(done)
+        return future
+
+    def ensure(self, digest):
+        """Render variants now if the background job hasn't produced them yet"""
+        src_path = self.original_path(digest)
+        if not os.path.exists(src_path):
+            return False
+        self._render(src_path, digest)
+        return True
+
+    def delete(self, digest):
+        """Remove every variant (and any pending original) of a photo"""
+        for key in self.variant_keys(digest):
+            self.store.delete(key)
+        try:
+            os.remove(self.original_path(digest))
+        except FileNotFoundError:
+            pass
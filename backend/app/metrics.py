@@ -0,0 +1,256 @@
+import atexit
+import bisect
+import glob
+import json
+import os
+import time
+
+from collections import defaultdict
+from flask import Response, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class Metrics(object):
+    """Process-local counters, gauges and histograms with Prometheus text output.
+
+    Updates are plain dict arithmetic with no lock: under the gevent worker
+    greenlets cannot interleave inside an increment, and in threaded serving
+    (the ASGI bridge threads, the hashing pool) the rare lost update is an
+    acceptable price for keeping the hot path cheap. A new series can still be
+    added while a snapshot is taken, so snapshots iterate over copies. With
+    METRICS_DIR set, each process periodically writes a snapshot there and
+    /metrics sums the snapshots of every worker (and of the CLI senders).
+    """
+
+    def __init__(self, app=None):
+        self._families = {}
+        self._values = defaultdict(float)
+        self._histograms = {}
+        self._last_flush = 0.0
+        self.directory = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.directory = app.config['METRICS_DIR']
+        self.flush_interval = app.config['METRICS_FLUSH_INTERVAL']
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            atexit.register(self.flush)
+
+        self.counter('http_requests_total', 'HTTP requests by endpoint, method and status')
+        self.histogram('http_request_duration_seconds', 'HTTP request latency by endpoint')
+        self.gauge('http_requests_in_flight', 'HTTP requests currently being served')
+        self.histogram('http_request_db_queries', 'Database queries issued per request', QUERY_COUNT_BUCKETS)
+        self.histogram('http_request_db_seconds', 'Time spent in the database per request')
+        self.counter('db_queries_total', 'Database queries by endpoint')
+        self.histogram('password_hash_duration_seconds', 'Password hashing time by operation')
+        self.histogram('mail_send_duration_seconds', 'SMTP send time per message')
+        self.counter('mail_messages_total', 'Outbox messages processed by result')
+        self.gauge('mail_outbox_depth', 'Messages waiting in the mail outbox')
+        self.counter('bookings_total', 'Booking attempts and transitions by result')
+        self.counter('auth_tokens_total', 'Access and refresh tokens issued, refreshed, rejected and revoked, by result')
+        self.counter('reset_codes_total', 'Password reset codes issued, verified, rejected and swept, by result')
+        self.counter('taken_names_checks_total', 'Username and email availability checks by result')
+        self.counter('ratelimit_rejections_total', 'Requests rejected by rate limits, by endpoint and key')
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        # Engine events are global, so listen once however many apps share this instance
+        if not event.contains(Engine, 'before_cursor_execute', self._before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+        app.add_url_rule('/metrics', 'metrics', self.render_view)
+        app.extensions['metrics'] = self
+
+    ##
+    # Declaring and recording
+    ##
+
+    def counter(self, name, help):
+        self._families[name] = ('counter', help, None)
+
+    def gauge(self, name, help):
+        self._families[name] = ('gauge', help, None)
+
+    def histogram(self, name, help, buckets=DEFAULT_BUCKETS):
+        self._families[name] = ('histogram', help, tuple(buckets))
+
+    def inc(self, name, value=1, **labels):
+        self._values[(name, tuple(sorted(labels.items())))] += value
+
+    def set(self, name, value, **labels):
+        self._values[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        series = self._histograms.get(key)
+        if series is None:
+            buckets = self._families[name][2]
+            # One slot per bucket plus +Inf, then sum
+            series = self._histograms[key] = [0] * (len(buckets) + 1) + [0.0]
+        series[bisect.bisect_left(self._families[name][2], value)] += 1
+        series[-1] += value
+
+    def timer(self, name, **labels):
+        return _Timer(self, name, labels)
+
+    ##
+    # Request and database hooks
+    ##
+
+    def _before_request(self):
+        g._metrics_start = time.perf_counter()
+        g._metrics_db_queries = 0
+        g._metrics_db_seconds = 0.0
+        self.inc('http_requests_in_flight')
+
+    def _after_request(self, response):
+        self._record_request(response.status_code)
+        return response
+
+    def _teardown_request(self, exc):
+        if '_metrics_start' not in g:
+            return
+        if '_metrics_recorded' not in g:
+            self._record_request(500)
+        self.inc('http_requests_in_flight', -1)
+
+        if self.directory and time.monotonic() - self._last_flush > self.flush_interval:
+            self.flush()
+
+    def _record_request(self, status):
+        g._metrics_recorded = True
+        endpoint = request.endpoint or 'unmatched'
+        self.inc('http_requests_total', endpoint=endpoint, method=request.method, status=str(status))
+        self.observe('http_request_duration_seconds', time.perf_counter() - g._metrics_start, endpoint=endpoint)
+        self.observe('http_request_db_queries', g._metrics_db_queries, endpoint=endpoint)
+        self.observe('http_request_db_seconds', g._metrics_db_seconds, endpoint=endpoint)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('_metrics_query_start', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['_metrics_query_start'].pop()
+        endpoint = 'none'
+        if has_request_context() and '_metrics_start' in g:
+            g._metrics_db_queries += 1
+            g._metrics_db_seconds += elapsed
+            endpoint = request.endpoint or 'unmatched'
+        self.inc('db_queries_total', endpoint=endpoint)
+
+    ##
+    # Aggregation and exposition
+    ##
+
+    def _snapshot(self):
+        return {
+            'pid': os.getpid(),
+            'values': [[name, labels, value] for (name, labels), value in list(self._values.items())],
+            'histograms': [
+                [name, labels, list(series)] for (name, labels), series in list(self._histograms.items())
+            ],
+        }
+
+    def flush(self):
+        """Write this process's snapshot for other workers to aggregate"""
+        if not self.directory:
+            return
+        self._last_flush = time.monotonic()
+        path = os.path.join(self.directory, f"metrics_{os.getpid()}.json")
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self._snapshot(), f)
+        os.replace(tmp, path)
+
+    def _collect(self):
+        snapshots = [self._snapshot()]
+        if self.directory:
+            for path in glob.glob(os.path.join(self.directory, 'metrics_*.json')):
+                try:
+                    with open(path) as f:
+                        snapshot = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                if snapshot['pid'] != os.getpid():
+                    snapshots.append(snapshot)
+
+        values = defaultdict(float)
+        histograms = {}
+        for snapshot in snapshots:
+            # Gauges describe live processes only; counters survive restarts
+            alive = snapshot['pid'] == os.getpid() or _pid_alive(snapshot['pid'])
+            for name, labels, value in snapshot['values']:
+                if self._families.get(name, ('gauge',))[0] == 'gauge' and not alive:
+                    continue
+                values[(name, tuple(tuple(l) for l in labels))] += value
+            for name, labels, series in snapshot['histograms']:
+                key = (name, tuple(tuple(l) for l in labels))
+                total = histograms.setdefault(key, [0] * len(series))
+                for i, v in enumerate(series):
+                    total[i] += v
+        return values, histograms
+
+    def render(self):
+        values, histograms = self._collect()
+        lines = []
+        for name, (kind, help, buckets) in sorted(self._families.items()):
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == 'histogram':
+                for (series_name, labels), series in sorted(histograms.items()):
+                    if series_name != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(buckets + ('+Inf',), series[:-1]):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_labels(labels + (('le', str(bound)),))} {cumulative}")
+                    lines.append(f"{name}_sum{_labels(labels)} {series[-1]}")
+                    lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+            else:
+                for (series_name, labels), value in sorted(values.items()):
+                    if series_name == name:
+                        lines.append(f"{name}{_labels(labels)} {value}")
+        return '\n'.join(lines) + '\n'
+
+    def render_view(self):
+        return Response(self.render(), mimetype='text/plain; version=0.0.4')
+
+
+class _Timer(object):
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, time.perf_counter() - self.start, **self.labels)
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        '%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"'))
+        for k, v in labels
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
@@ -1,6 +1,5 @@
 from datetime import datetime
-from . import db
-from werkzeug.security import generate_password_hash
+from . import db, hasher
 
 class User(db.Model):
     __tablename__ = 'users'
@@ -14,12 +13,12 @@ class User(db.Model):
     location = db.Column(db.String(255), nullable=True)
     profile_photo = db.Column(db.String(255), nullable=True)
     joined_on = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
-    reset_code = db.Column(db.String(4), nullable=True)
-    reset_code_expiration = db.Column(db.DateTime, nullable=True)
+    # Bumped by every change to the profile, which makes it the profile's ETag
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
     
     def __init__(self, username, password, email, firstname=None, lastname=None, location=None):
         self.username = username
-        self.password = generate_password_hash(password, method='pbkdf2:sha256')
+        self.password = hasher.hash(password)
         self.email = email
         self.firstname = firstname
         self.lastname = lastname
@@ -42,4 +41,188 @@ class User(db.Model):
             return str(self.id) 
             
     def __repr__(self):
-        return '<User %r>' % (self.username)
\ No newline at end of file
+        return '<User %r>' % (self.username)
+
+
+class ResetCode(db.Model):
+    """The live password reset code for an email, at most one each; see app.resets"""
+    __tablename__ = 'reset_codes'
+
+    id = db.Column(db.Integer, primary_key=True)
+    email = db.Column(db.String(255), unique=True, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    # HMAC of the email and code, so the code is matched in SQL and never stored
+    code_hash = db.Column(db.String(64), nullable=False)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return '<ResetCode %r>' % (self.email)
+
+
+class RevokedToken(db.Model):
+    """A used refresh token id, or a revoked token family id; see app.tokens"""
+    __tablename__ = 'revoked_tokens'
+
+    id = db.Column(db.String(32), primary_key=True)
+    # Once the token (or every token of the family) has expired the row can go
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    revoked_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+    def __repr__(self):
+        return '<RevokedToken %r>' % (self.id)
+
+
+class OutboxMessage(db.Model):
+    __tablename__ = 'mail_outbox'
+
+    id = db.Column(db.Integer, primary_key=True)
+    recipient = db.Column(db.String(255), nullable=False)
+    sender = db.Column(db.String(255), nullable=False)
+    subject = db.Column(db.String(255), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(16), nullable=False, default='pending')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_mail_outbox_status_next_attempt_at', 'status', 'next_attempt_at'),
+    )
+
+    def __repr__(self):
+        return '<OutboxMessage %r to %r>' % (self.id, self.recipient)
+
+
+class Upload(db.Model):
+    __tablename__ = 'uploads'
+
+    id = db.Column(db.Integer, primary_key=True)
+    owner_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='SET NULL'), nullable=True)
+    digest = db.Column(db.String(64), nullable=False, index=True)
+    size = db.Column(db.Integer, nullable=False)
+    mime_type = db.Column(db.String(64), nullable=False)
+    width = db.Column(db.Integer, nullable=True)
+    height = db.Column(db.Integer, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_uploads_owner_id_id', 'owner_id', 'id'),
+        db.Index('ix_uploads_created_at', 'created_at'),
+    )
+
+    def __repr__(self):
+        return '<Upload %r>' % (self.digest)
+
+
+class CatalogItem(db.Model):
+    __tablename__ = 'catalog_items'
+
+    KINDS = ('services', 'rentals', 'parts')
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(16), nullable=False)
+    title = db.Column(db.String(128), nullable=False)
+    type = db.Column(db.String(64), nullable=True)
+    description = db.Column(db.Text, nullable=True)
+    image = db.Column(db.String(255), nullable=True)
+    icon = db.Column(db.String(64), nullable=True)
+    price = db.Column(db.Numeric(10, 2), nullable=True)
+    price_unit = db.Column(db.String(16), nullable=True)
+    frequency = db.Column(db.String(16), nullable=True)
+    rating = db.Column(db.Float, nullable=True)
+    users_count = db.Column(db.Integer, nullable=False, default=0)
+    available = db.Column(db.Boolean, nullable=False, default=True)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_catalog_items_kind_id', 'kind', 'id'),
+        db.Index('ix_catalog_items_updated_at', 'updated_at'),
+    )
+
+    def __repr__(self):
+        return '<CatalogItem %r %r>' % (self.kind, self.title)
+
+
+class CatalogMeta(db.Model):
+    """Single-row table whose version is bumped by every catalog write"""
+    __tablename__ = 'catalog_meta'
+
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+
+class Workshop(db.Model):
+    __tablename__ = 'workshops'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(128), nullable=False)
+    address = db.Column(db.String(255), nullable=True)
+    phone = db.Column(db.String(32), nullable=True)
+    latitude = db.Column(db.Float, nullable=False)
+    longitude = db.Column(db.Float, nullable=False)
+    # Comma-separated service types, matching CatalogItem.type for services
+    services = db.Column(db.String(255), nullable=False, default='')
+    # Local opening hours in the workshop's timezone; both null means 24/7
+    opens_at = db.Column(db.Time, nullable=True)
+    closes_at = db.Column(db.Time, nullable=True)
+    timezone = db.Column(db.String(64), nullable=False, default='UTC')
+    active = db.Column(db.Boolean, nullable=False, default=True)
+    rating = db.Column(db.Float, nullable=True)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_workshops_updated_at', 'updated_at'),
+    )
+
+    def __repr__(self):
+        return '<Workshop %r>' % (self.name)
+
+
+class BookingSlot(db.Model):
+    """A workshop time slot; reserved counts live holds plus confirmed bookings"""
+    __tablename__ = 'booking_slots'
+
+    id = db.Column(db.Integer, primary_key=True)
+    workshop_id = db.Column(db.Integer, db.ForeignKey('workshops.id', ondelete='CASCADE'), nullable=False)
+    starts_at = db.Column(db.DateTime, nullable=False)
+    ends_at = db.Column(db.DateTime, nullable=False)
+    capacity = db.Column(db.Integer, nullable=False)
+    reserved = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint('workshop_id', 'starts_at', name='uq_booking_slots_workshop_id_starts_at'),
+        db.CheckConstraint('reserved >= 0 AND reserved <= capacity', name='ck_booking_slots_reserved'),
+    )
+
+    def __repr__(self):
+        return '<BookingSlot %r at %r>' % (self.workshop_id, self.starts_at)
+
+
+class Booking(db.Model):
+    __tablename__ = 'bookings'
+
+    id = db.Column(db.Integer, primary_key=True)
+    slot_id = db.Column(db.Integer, db.ForeignKey('booking_slots.id', ondelete='CASCADE'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    service = db.Column(db.String(64), nullable=True)
+    # held -> confirmed, or held -> expired, or held/confirmed -> cancelled
+    status = db.Column(db.String(16), nullable=False, default='held')
+    hold_expires_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    confirmed_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_bookings_status_hold_expires_at', 'status', 'hold_expires_at'),
+        db.Index('ix_bookings_slot_id_status', 'slot_id', 'status'),
+        # Booking history pages walk this newest first; the included columns let the
+        # compact view be answered from the index alone on Postgres
+        db.Index('ix_bookings_user_id_created_at_id', 'user_id', 'created_at', 'id',
+                 postgresql_include=['slot_id', 'status', 'service']),
+    )
+
+    def __repr__(self):
+        return '<Booking %r %r>' % (self.id, self.status)
@@ -0,0 +1,159 @@
+import time
+import click
+
+from datetime import datetime, timedelta
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import func
+
+from app import db, metrics
+from app.models import OutboxMessage
+
+outbox_cli = AppGroup('outbox', help='Send and inspect queued outgoing mail.')
+
+
+def get_mail():
+    """Flask-Mail, set up on the current app the first time something is sent"""
+    from flask_mail import Mail
+    app = current_app._get_current_object()
+    if 'mail' not in app.extensions:
+        Mail(app)
+    return Mail()
+
+
+def enqueue_mail(recipient, subject, body, sender=None):
+    """Queue a message in the current transaction; the caller commits"""
+    message = OutboxMessage(
+        recipient=recipient,
+        sender=sender or current_app.config['MAIL_DEFAULT_SENDER'],
+        subject=subject,
+        body=body
+    )
+    db.session.add(message)
+    return message
+
+
+def queue_depth():
+    """Number of messages still waiting to be sent"""
+    return db.session.query(func.count(OutboxMessage.id)).filter_by(status='pending').scalar()
+
+
+def _backoff(attempts):
+    base = current_app.config['OUTBOX_RETRY_BASE']
+    cap = current_app.config['OUTBOX_RETRY_MAX']
+    return timedelta(seconds=min(cap, base * 2 ** (attempts - 1)))
+
+
+def _mark_failed(message, error, now):
+    message.attempts += 1
+    message.last_error = str(error)
+    if message.attempts >= current_app.config['OUTBOX_MAX_ATTEMPTS']:
+        message.status = 'failed'
+    else:
+        message.next_attempt_at = now + _backoff(message.attempts)
+
+
+def send_batch(batch_size=None):
+    """Send one batch of due messages over a single SMTP connection.
+
+    Rows are claimed with SKIP LOCKED so several senders can drain the same
+    outbox without picking up each other's messages.
+    """
+    batch_size = batch_size or current_app.config['OUTBOX_BATCH_SIZE']
+    now = datetime.utcnow()
+    messages = OutboxMessage.query \
+        .filter(OutboxMessage.status == 'pending', OutboxMessage.next_attempt_at <= now) \
+        .order_by(OutboxMessage.next_attempt_at, OutboxMessage.id) \
+        .limit(batch_size) \
+        .with_for_update(skip_locked=True) \
+        .all()
+
+    stats = {'sent': 0, 'failed': 0, 'latencies': []}
+    if not messages:
+        db.session.rollback()
+        return stats
+
+    from flask_mail import Message
+    attempted = 0
+    try:
+        with get_mail().connect() as connection:
+            for message in messages:
+                attempted += 1
+                start = time.perf_counter()
+                try:
+                    connection.send(Message(
+                        message.subject,
+                        sender=message.sender,
+                        recipients=[message.recipient],
+                        body=message.body
+                    ))
+                except Exception as e:
+                    _mark_failed(message, e, now)
+                    stats['failed'] += 1
+                    metrics.inc('mail_messages_total', result='failed')
+                    continue
+                stats['latencies'].append(time.perf_counter() - start)
+                metrics.observe('mail_send_duration_seconds', stats['latencies'][-1])
+                metrics.inc('mail_messages_total', result='sent')
+                message.status = 'sent'
+                message.sent_at = datetime.utcnow()
+                message.attempts += 1
+                stats['sent'] += 1
+    except Exception as e:
+        # Could not open (or cleanly close) the connection: retry what is left
+        current_app.logger.error(f"Outbox SMTP connection failed: {str(e)}")
+        for message in messages[attempted:]:
+            _mark_failed(message, e, now)
+            stats['failed'] += 1
+            metrics.inc('mail_messages_total', result='failed')
+
+    db.session.commit()
+    return stats
+
+
+def _report(stats):
+    latencies = sorted(stats['latencies'])
+    if latencies:
+        p50 = latencies[len(latencies) // 2] * 1000
+        worst = latencies[-1] * 1000
+    else:
+        p50 = worst = 0
+    depth = queue_depth()
+    metrics.set('mail_outbox_depth', depth)
+    metrics.flush()
+    current_app.logger.info(
+        f"Outbox batch: sent={stats['sent']} failed={stats['failed']} "
+        f"depth={depth} send_p50_ms={p50:.1f} send_max_ms={worst:.1f}"
+    )
+
+
+@outbox_cli.command('send')
+@click.option('--once', is_flag=True, help='Drain what is due and exit instead of polling.')
+@click.option('--batch-size', type=int, default=None, help='Messages per SMTP connection.')
+@click.option('--interval', type=float, default=None, help='Seconds to sleep when the outbox is idle.')
+def send_command(once, batch_size, interval):
+    """Drain the mail outbox"""
+    interval = interval if interval is not None else current_app.config['OUTBOX_POLL_INTERVAL']
+    while True:
+        stats = send_batch(batch_size)
+        if stats['sent'] or stats['failed']:
+            _report(stats)
+            continue
+        if once:
+            break
+        time.sleep(interval)
+
+
+@outbox_cli.command('status')
+def status_command():
+    """Show outbox queue depth and failures"""
+    counts = dict(
+        db.session.query(OutboxMessage.status, func.count(OutboxMessage.id))
+        .group_by(OutboxMessage.status).all()
+    )
+    oldest = db.session.query(func.min(OutboxMessage.created_at)).filter_by(status='pending').scalar()
+    click.echo(f"pending: {counts.get('pending', 0)}")
+    click.echo(f"sent: {counts.get('sent', 0)}")
+    click.echo(f"failed: {counts.get('failed', 0)}")
+    if oldest:
+        click.echo(f"oldest pending: {(datetime.utcnow() - oldest).total_seconds():.0f}s")
@@ -0,0 +1,115 @@
+import logging
+import os
+import time
+import traceback
+
+from collections import Counter
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def call_site():
+    """The innermost frame of our own code that led to the current query"""
+    for frame in reversed(traceback.extract_stack()):
+        if frame.filename.startswith(PACKAGE_DIR) and frame.filename != __file__ \
+                and not frame.filename.endswith('metrics.py'):
+            return f"{os.path.relpath(frame.filename, PACKAGE_DIR)}:{frame.lineno} in {frame.name}"
+    return 'unknown'
+
+
+class SQLProfiler(object):
+    """Captures every statement a request runs, to find query fan-out.
+
+    Profiling is on for every request when SQL_PROFILER_ENABLED is set, or for
+    a single request sending the SQL_PROFILER_HEADER header when
+    SQL_PROFILER_ALLOW_HEADER is set. Profiled responses carry a summary header
+    and the full statement list is logged. Independently of profiling, any
+    statement slower than SQL_SLOW_QUERY_MS is written to the slow-query log.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config['SQL_PROFILER_ENABLED']
+        self.header = app.config['SQL_PROFILER_HEADER']
+        self.allow_header = app.config['SQL_PROFILER_ALLOW_HEADER']
+        self.repeat_threshold = app.config['SQL_PROFILER_REPEAT_THRESHOLD']
+        self.slow_ms = app.config['SQL_SLOW_QUERY_MS']
+        self.logger = app.logger
+
+        self.slow_log = logging.getLogger('app.slow_queries')
+        if app.config['SQL_SLOW_QUERY_LOG'] and not self.slow_log.handlers:
+            handler = logging.FileHandler(app.config['SQL_SLOW_QUERY_LOG'])
+            handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+            self.slow_log.addHandler(handler)
+            self.slow_log.setLevel(logging.WARNING)
+            self.slow_log.propagate = False
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        if not event.contains(Engine, 'before_cursor_execute', self._before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+        app.extensions['sql_profiler'] = self
+
+    def _before_request(self):
+        if self.enabled or (self.allow_header and request.headers.get(self.header)):
+            g._sql_profile = []
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('_profiler_query_start', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed_ms = (time.perf_counter() - conn.info['_profiler_query_start'].pop()) * 1000
+        profile = g.get('_sql_profile') if has_request_context() else None
+        slow = self.slow_ms is not None and elapsed_ms >= self.slow_ms
+        if profile is None and not slow:
+            return
+
+        # Parameters are kept only to spot exact duplicates; they can hold
+        # password hashes and reset codes, so they are never logged
+        site = call_site()
+        if profile is not None:
+            profile.append((statement, repr(parameters), elapsed_ms, site))
+        if slow:
+            endpoint = request.endpoint if has_request_context() else '-'
+            self.slow_log.warning(
+                f"slow query {elapsed_ms:.1f}ms endpoint={endpoint} at {site}: {' '.join(statement.split())}"
+            )
+
+    def summarize(self, profile):
+        """Total count/time plus statements repeated enough to look like N+1"""
+        by_statement = Counter(statement for statement, _, _, _ in profile)
+        exact = Counter((statement, params) for statement, params, _, _ in profile)
+        return {
+            'queries': len(profile),
+            'time_ms': sum(ms for _, _, ms, _ in profile),
+            'slowest_ms': max((ms for _, _, ms, _ in profile), default=0.0),
+            'repeated': {s: n for s, n in by_statement.items() if n >= self.repeat_threshold},
+            'duplicates': sum(n - 1 for n in exact.values() if n > 1),
+        }
+
+    def _after_request(self, response):
+        profile = g.pop('_sql_profile', None)
+        if profile is None:
+            return response
+
+        summary = self.summarize(profile)
+        response.headers['X-SQL-Profile'] = (
+            f"queries={summary['queries']}; time_ms={summary['time_ms']:.2f}; "
+            f"slowest_ms={summary['slowest_ms']:.2f}; n_plus_one={len(summary['repeated'])}; "
+            f"duplicates={summary['duplicates']}"
+        )
+
+        lines = [f"SQL profile for {request.method} {request.path}: {response.headers['X-SQL-Profile']}"]
+        for statement, _, ms, site in profile:
+            lines.append(f"  {ms:8.2f}ms  {site}  {' '.join(statement.split())}")
+        for statement, n in summary['repeated'].items():
+            lines.append(f"  N+1 candidate ({n}x): {' '.join(statement.split())}")
+        self.logger.info('\n'.join(lines))
+        return response
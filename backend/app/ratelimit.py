@@ -0,0 +1,285 @@
+import fcntl
+import hashlib
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+
+from flask import request
+
+
+class RateLimitExceeded(Exception):
+    """Raised before an over-limit request reaches its view"""
+
+    def __init__(self, retry_after=1):
+        super().__init__("Rate limit exceeded")
+        self.retry_after = retry_after
+
+
+##
+# Bucket stores. take() is given (key, burst, rate) for each bucket a request
+# draws on. Each bucket holds up to `burst` tokens and refills at `rate`
+# tokens a second. take() refills them all and then spends `cost` from every
+# one, or from none if any is short. It returns each bucket's wait: 0 where
+# there were enough tokens, else the seconds until enough will be there.
+##
+
+def _refill(tokens, updated, now, burst, rate, cost):
+    """A bucket's tokens at now, and its wait for cost tokens"""
+    tokens = min(burst, tokens + (now - updated) * rate)
+    return tokens, 0 if tokens >= cost else (cost - tokens) / rate
+
+
+class MemoryBuckets(object):
+    """Buckets in a dict, private to the process.
+
+    Each gunicorn worker keeps its own, so the effective limit is the
+    configured one times the number of workers. Past max_keys, refilled
+    buckets are dropped and then the least recently used, down to 90% so the
+    pruning is paid once per many requests.
+    """
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, buckets, cost=1):
+        now = time.monotonic()
+        with self._lock:
+            # Popping and reinserting keeps the dict in least recently used order
+            states = []
+            for key, burst, rate in buckets:
+                tokens, updated, _ = self._buckets.pop(key, (burst, now, None))
+                states.append(_refill(tokens, updated, now, burst, rate, cost))
+            waits = [wait for _, wait in states]
+            spend = cost if not any(waits) else 0
+            for (key, burst, rate), (tokens, _) in zip(buckets, states):
+                tokens -= spend
+                self._buckets[key] = (tokens, now, now + (burst - tokens) / rate)
+            if len(self._buckets) > self.max_keys:
+                self._prune(now)
+        return waits
+
+    def _prune(self, now):
+        # Buckets that have refilled are indistinguishable from new ones
+        self._buckets = {key: b for key, b in self._buckets.items() if b[2] > now}
+        overflow = len(self._buckets) - int(self.max_keys * 0.9)
+        if overflow > 0:
+            for key in list(self._buckets)[:overflow]:
+                del self._buckets[key]
+
+
+class SharedMemoryBuckets(object):
+    """Buckets in a memory-mapped file shared by every worker on the host.
+
+    The file is a fixed-size open-addressing table of (key hash, tokens,
+    updated) slots, locked with flock for the few microseconds an update
+    takes. When a key's neighbourhood is full, the least recently used slot
+    in it is recycled, which can only ever reset a bucket to full.
+    """
+
+    SLOT = struct.Struct('<Qdd')
+    PROBES = 8
+
+    def __init__(self, path, slots=65536):
+        self.path = path
+        self.slots = slots
+        self._fd = None
+        self._map = None
+        self._pid = None
+
+    def _mapped(self):
+        # Forked workers must not share the parent's descriptor and its flock
+        if self._map is None or self._pid != os.getpid():
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            size = self.slots * self.SLOT.size
+            if os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+            self._fd, self._map, self._pid = fd, mmap.mmap(fd, size), os.getpid()
+        return self._fd, self._map
+
+    def _find(self, table, digest, burst, now):
+        """The slot for digest and its (tokens, updated), claiming one if new"""
+        oldest = None
+        for probe in range(self.PROBES):
+            offset = (digest + probe) % self.slots * self.SLOT.size
+            slot_digest, slot_tokens, slot_updated = self.SLOT.unpack_from(table, offset)
+            if slot_digest == digest:
+                return offset, slot_tokens, min(slot_updated, now)
+            if slot_digest == 0:
+                break
+            if oldest is None or slot_updated < oldest[1]:
+                oldest = (offset, slot_updated)
+        else:
+            offset = oldest[0]
+        # Claimed now, so a later bucket of the same take() cannot recycle it
+        self.SLOT.pack_into(table, offset, digest, burst, now)
+        return offset, burst, now
+
+    def take(self, buckets, cost=1):
+        fd, table = self._mapped()
+        digests = [
+            int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little') or 1
+            for key, _, _ in buckets
+        ]
+        now = time.monotonic()
+
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            states = []
+            for digest, (_, burst, rate) in zip(digests, buckets):
+                slot, tokens, updated = self._find(table, digest, burst, now)
+                states.append((slot,) + _refill(tokens, updated, now, burst, rate, cost))
+            waits = [wait for _, _, wait in states]
+            spend = cost if not any(waits) else 0
+            for digest, (slot, tokens, _) in zip(digests, states):
+                self.SLOT.pack_into(table, slot, digest, tokens - spend, now)
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        return waits
+
+
+class RedisBuckets(object):
+    """Buckets in Redis, shared by every worker on every host.
+
+    The refill-and-spend runs as one Lua script against the server's clock,
+    so concurrent takes cannot double-spend. Needs the redis package. The
+    keys of one take() are not given a common hash tag, so on Redis Cluster
+    an endpoint's limits must map to a single slot.
+    """
+
+    # ARGV is cost, then burst and rate for each of KEYS
+    SCRIPT = """
+    local cost = tonumber(ARGV[1])
+    local clock = redis.call('TIME')
+    local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+    local tokens, waits, short = {}, {}, false
+    for i, key in ipairs(KEYS) do
+        local burst, rate = tonumber(ARGV[2 * i]), tonumber(ARGV[2 * i + 1])
+        local state = redis.call('HMGET', key, 'tokens', 'updated')
+        local updated = tonumber(state[2]) or now
+        tokens[i] = math.min(burst, (tonumber(state[1]) or burst) + math.max(0, now - updated) * rate)
+        waits[i] = 0
+        if tokens[i] < cost then
+            waits[i] = (cost - tokens[i]) / rate
+            short = true
+        end
+    end
+    for i, key in ipairs(KEYS) do
+        local burst, rate = tonumber(ARGV[2 * i]), tonumber(ARGV[2 * i + 1])
+        if not short then tokens[i] = tokens[i] - cost end
+        redis.call('HSET', key, 'tokens', tokens[i], 'updated', now)
+        redis.call('PEXPIRE', key, math.ceil((burst - tokens[i]) / rate * 1000) + 1000)
+        waits[i] = tostring(waits[i])
+    end
+    return waits
+    """
+
+    def __init__(self, url, prefix='ratelimit:'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("RATELIMIT_BACKEND 'redis' needs the redis package installed")
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+        self._take = self._client.register_script(self.SCRIPT)
+
+    def take(self, buckets, cost=1):
+        args = [cost]
+        for _, burst, rate in buckets:
+            args += [burst, rate]
+        waits = self._take(keys=[self.prefix + key for key, _, _ in buckets], args=args)
+        return [float(wait) for wait in waits]
+
+
+BUCKET_BACKENDS = {
+    'memory': MemoryBuckets,
+    'shared': SharedMemoryBuckets,
+    'redis': RedisBuckets,
+}
+
+
+def create_buckets(name, **options):
+    try:
+        backend = BUCKET_BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown rate limit backend: {name}")
+    return backend(**options)
+
+
+##
+# What a request is limited by
+##
+
+def _client_ip():
+    return request.remote_addr or 'unknown'
+
+
+def _field(name):
+    # Login posts a form or JSON; the rest post JSON
+    data = request.get_json(silent=True)
+    value = data.get(name) if isinstance(data, dict) else request.form.get(name)
+    return value.strip().lower() if isinstance(value, str) and value.strip() else None
+
+
+KEY_FUNCTIONS = {
+    'ip': _client_ip,
+    'email': lambda: _field('email'),
+    'username': lambda: _field('username'),
+}
+
+
+class RateLimiter(object):
+    """Token-bucket limits on endpoints, checked before the view runs.
+
+    RATELIMITS maps an endpoint name to {dimension: (requests, per_seconds)},
+    for example {'api.login': {'ip': (20, 60), 'email': (5, 60)}}: each client
+    IP may then burst 20 logins and sustain one every 3s, and each email 5
+    and one every 12s. A request is rejected with 429 and Retry-After as soon
+    as any of its buckets is empty, before any database or hashing work.
+    """
+
+    def __init__(self, app=None):
+        self.buckets = None
+        self.limits = {}
+        self.metrics = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.limits = app.config['RATELIMITS'] if app.config['RATELIMIT_ENABLED'] else {}
+        backend = app.config['RATELIMIT_BACKEND']
+        self.buckets = create_buckets(backend, **app.config['RATELIMIT_BACKEND_OPTIONS'].get(backend, {}))
+        self.metrics = app.extensions.get('metrics')
+        app.before_request(self._before_request)
+        app.extensions['rate_limiter'] = self
+
+    def check(self, endpoint):
+        """Spend a token from each of the endpoint's buckets; raises RateLimitExceeded.
+
+        Tokens are only spent when every bucket has one, so a request refused
+        by one limit does not use up the others.
+        """
+        dimensions, buckets = [], []
+        for dimension, (count, per_seconds) in self.limits.get(endpoint, {}).items():
+            value = KEY_FUNCTIONS[dimension]()
+            if value is None:
+                continue
+            dimensions.append(dimension)
+            buckets.append((f"{endpoint}:{dimension}:{value}", count, count / per_seconds))
+        if not buckets:
+            return
+        waits = self.buckets.take(buckets)
+        if any(waits):
+            if self.metrics is not None:
+                for dimension, wait in zip(dimensions, waits):
+                    if wait:
+                        self.metrics.inc('ratelimit_rejections_total', endpoint=endpoint, key=dimension)
+            raise RateLimitExceeded(retry_after=max(1, math.ceil(max(waits))))
+
+    def _before_request(self):
+        if request.endpoint in self.limits:
+            self.check(request.endpoint)
@@ -0,0 +1,138 @@
+import hmac
+import time
+import secrets
+import hashlib
+import click
+
+from datetime import datetime, timedelta
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import case, delete, select, update
+
+from app import db, metrics
+from app.models import ResetCode, User
+
+reset_codes_cli = AppGroup('reset-codes', help='Manage password reset codes.')
+
+# Reset codes live in their own narrow table, one row per email, so requesting
+# and verifying them never writes to (or bloats) the users table. Codes are
+# matched in SQL by their HMAC, which makes verifying a single statement.
+
+
+def _code_hash(email, code):
+    key = current_app.config['SECRET_KEY'].encode('utf-8')
+    return hmac.new(key, f"{email}:{code}".encode('utf-8'), hashlib.sha256).hexdigest()
+
+
+def issue_code(email):
+    """Replace any code for email with a fresh one; returns it, or None if no user has that email.
+
+    The caller commits. Two requests racing for the same email both insert,
+    and the later commit fails on the unique email instead of leaving two codes.
+    """
+    user_id = db.session.scalar(select(User.id).where(User.email == email))
+    if user_id is None:
+        return None
+    code = '%04d' % secrets.randbelow(10000)
+    now = datetime.utcnow()
+    db.session.execute(delete(ResetCode).where(ResetCode.email == email))
+    db.session.add(ResetCode(
+        email=email,
+        user_id=user_id,
+        code_hash=_code_hash(email, code),
+        expires_at=now + timedelta(seconds=current_app.config['RESET_CODE_TTL']),
+        created_at=now
+    ))
+    metrics.inc('reset_codes_total', result='issued')
+    return code
+
+
+def consume_code(email, code):
+    """Check a code and use it up; returns (user_id, 'verified') or (None, why not).
+
+    A matching, live code is deleted by the same statement that checks it, so
+    it verifies exactly once however many requests race with it. Anything
+    else counts as a wrong guess against the email's code, and the guess that
+    uses up the last attempt also expires it for the sweeper. Why not is
+    'invalid', 'expired' or 'exhausted'.
+    """
+    now = datetime.utcnow()
+    max_attempts = current_app.config['RESET_CODE_MAX_ATTEMPTS']
+    user_id = db.session.scalar(
+        delete(ResetCode)
+        .where(ResetCode.email == email, ResetCode.code_hash == _code_hash(email, code),
+               ResetCode.expires_at > now, ResetCode.attempts < max_attempts)
+        .returning(ResetCode.user_id)
+        .execution_options(synchronize_session=False)
+    )
+    if user_id is not None:
+        db.session.commit()
+        metrics.inc('reset_codes_total', result='verified')
+        return user_id, 'verified'
+
+    guessed = db.session.execute(
+        update(ResetCode)
+        .where(ResetCode.email == email, ResetCode.attempts < max_attempts)
+        .values(
+            attempts=ResetCode.attempts + 1,
+            expires_at=case((ResetCode.attempts + 1 >= max_attempts, now), else_=ResetCode.expires_at)
+        )
+        .returning(ResetCode.attempts, ResetCode.expires_at)
+        .execution_options(synchronize_session=False)
+    ).first()
+    db.session.commit()
+    if guessed is None:
+        # No code, or one already out of attempts that the sweeper has yet to delete
+        guessed = db.session.execute(
+            select(ResetCode.attempts, ResetCode.expires_at).where(ResetCode.email == email)
+        ).first()
+    if guessed is None:
+        result = 'invalid'
+    elif guessed.attempts >= max_attempts:
+        result = 'exhausted'
+    elif guessed.expires_at <= now:
+        result = 'expired'
+    else:
+        result = 'invalid'
+    metrics.inc('reset_codes_total', result=result)
+    return None, result
+
+
+def sweep_codes(batch_size=None, now=None):
+    """Delete expired codes a batch per transaction; returns the number deleted.
+
+    Small batches keep each delete's locks short, so a large backlog does not
+    stall the requests issuing and verifying codes meanwhile.
+    """
+    batch_size = batch_size or current_app.config['RESET_CODE_SWEEP_BATCH_SIZE']
+    now = now or datetime.utcnow()
+    swept = 0
+    while True:
+        batch = select(ResetCode.id).where(ResetCode.expires_at <= now).limit(batch_size).scalar_subquery()
+        deleted = db.session.execute(
+            delete(ResetCode).where(ResetCode.id.in_(batch)).execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+        swept += deleted
+        if deleted < batch_size:
+            break
+    if swept:
+        metrics.inc('reset_codes_total', swept, result='swept')
+    return swept
+
+
+@reset_codes_cli.command('sweep')
+@click.option('--once', is_flag=True, help='Delete what has expired and exit instead of polling.')
+@click.option('--batch-size', type=int, default=None, help='Rows deleted per transaction.')
+@click.option('--interval', type=float, default=None, help='Seconds between sweeps.')
+def sweep_command(once, batch_size, interval):
+    """Delete expired and used-up password reset codes"""
+    interval = interval if interval is not None else current_app.config['RESET_CODE_SWEEP_INTERVAL']
+    while True:
+        swept = sweep_codes(batch_size)
+        if swept:
+            metrics.flush()
+            current_app.logger.info(f"Swept {swept} expired reset codes")
+        if once:
+            break
+        time.sleep(interval)
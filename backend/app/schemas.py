@@ -0,0 +1,162 @@
+from functools import lru_cache
+
+from marshmallow import EXCLUDE, Schema, fields, validate
+from marshmallow_sqlalchemy import SQLAlchemySchema, auto_field
+
+from app.models import User, CatalogItem, Workshop, BookingSlot, Booking
+from app.serialization import compile_schema
+
+# What the API sends for each model. Fields are listed explicitly, so a new
+# column is never exposed by accident; field types come from the columns.
+# The compiled versions at the bottom are what the views use.
+
+
+class UserSchema(SQLAlchemySchema):
+    class Meta:
+        model = User
+        ordered = True
+
+    id = auto_field()
+    username = auto_field()
+    firstname = auto_field()
+    lastname = auto_field()
+    location = auto_field()
+    profile_photo = auto_field()
+    joined_on = auto_field(format='%Y-%m-%d %H:%M:%S')
+
+
+class CatalogItemSchema(SQLAlchemySchema):
+    class Meta:
+        model = CatalogItem
+        ordered = True
+
+    id = auto_field()
+    kind = auto_field()
+    title = auto_field()
+    type = auto_field()
+    description = auto_field()
+    image = auto_field()
+    icon = auto_field()
+    price = auto_field(as_string=True)
+    price_unit = auto_field()
+    frequency = auto_field()
+    rating = auto_field()
+    users_count = auto_field()
+    available = auto_field()
+
+
+class CatalogItemInputSchema(SQLAlchemySchema):
+    """What an admin may write to a catalog item. Types, lengths and
+    nullability come from the columns; other keys are ignored."""
+
+    class Meta:
+        model = CatalogItem
+        unknown = EXCLUDE
+
+    kind = auto_field(validate=validate.OneOf(CatalogItem.KINDS))
+    title = auto_field()
+    type = auto_field()
+    description = auto_field()
+    image = auto_field()
+    icon = auto_field()
+    # Numeric(10, 2)
+    price = auto_field(places=2, validate=validate.Range(0, 99999999.99))
+    price_unit = auto_field()
+    frequency = auto_field()
+    rating = auto_field()
+    users_count = auto_field(validate=validate.Range(min=0))
+    available = auto_field()
+
+
+class WorkshopSchema(SQLAlchemySchema):
+    class Meta:
+        model = Workshop
+        ordered = True
+
+    id = auto_field()
+    name = auto_field()
+    address = auto_field()
+    phone = auto_field()
+    latitude = auto_field()
+    longitude = auto_field()
+    services = fields.Method('get_services')
+    opens_at = auto_field(format='%H:%M')
+    closes_at = auto_field(format='%H:%M')
+    timezone = auto_field()
+    active = auto_field()
+    rating = auto_field()
+
+    def get_services(self, workshop):
+        return [s.strip() for s in workshop.services.split(',') if s.strip()]
+
+
+class BookingSlotSchema(SQLAlchemySchema):
+    class Meta:
+        model = BookingSlot
+        ordered = True
+
+    id = auto_field()
+    workshop_id = auto_field()
+    starts_at = auto_field()
+    ends_at = auto_field()
+    capacity = auto_field()
+    available = fields.Function(lambda slot: slot.capacity - slot.reserved)
+
+
+class BookingSchema(SQLAlchemySchema):
+    class Meta:
+        model = Booking
+        ordered = True
+
+    id = auto_field()
+    slot_id = auto_field()
+    service = auto_field()
+    status = auto_field()
+    hold_expires_at = auto_field()
+    created_at = auto_field()
+    confirmed_at = auto_field()
+
+
+class BookingHistorySchema(Schema):
+    """A row of app.bookings.history(): a booking with its slot and workshop"""
+
+    class Meta:
+        ordered = True
+
+    # The compact view, answered from the history index alone
+    id = fields.Integer()
+    slot_id = fields.Integer()
+    status = fields.String()
+    service = fields.String()
+    created_at = fields.DateTime()
+    # The full view adds these
+    hold_expires_at = fields.DateTime()
+    confirmed_at = fields.DateTime()
+    starts_at = fields.DateTime()
+    ends_at = fields.DateTime()
+    workshop_id = fields.Integer()
+    workshop_name = fields.String()
+    workshop_address = fields.String()
+
+
+COMPACT_HISTORY_FIELDS = ('id', 'slot_id', 'status', 'service', 'created_at')
+
+# What anyone signed in may see of another user; the rest of UserSchema is
+# for the user themself (and admins)
+PUBLIC_USER_FIELDS = ('id', 'username', 'firstname', 'lastname', 'profile_photo')
+
+user_schema = compile_schema(UserSchema())
+user_update_schema = compile_schema(UserSchema(only=('id', 'firstname', 'lastname', 'location')))
+catalog_item_schema = compile_schema(CatalogItemSchema())
+catalog_item_input_schema = CatalogItemInputSchema()
+workshop_schema = compile_schema(WorkshopSchema())
+booking_slot_schema = compile_schema(BookingSlotSchema())
+booking_schema = compile_schema(BookingSchema())
+booking_history_schema = compile_schema(BookingHistorySchema())
+compact_booking_history_schema = compile_schema(BookingHistorySchema(only=COMPACT_HISTORY_FIELDS))
+
+
+@lru_cache(maxsize=None)
+def user_projection(only):
+    """The compiled UserSchema for a tuple of its fields, in schema order"""
+    return compile_schema(UserSchema(only=only))
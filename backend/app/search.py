@@ -0,0 +1,325 @@
+import bisect
+import heapq
+import math
+import re
+import threading
+import time
+
+from collections import Counter, defaultdict
+from datetime import timedelta
+from operator import itemgetter
+from flask import current_app
+
+from app import db
+from app.catalog import catalog_changed, serialize_item
+from app.models import CatalogItem
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+# How much a match in each field counts towards an item's score
+FIELD_WEIGHTS = (('title', 3.0), ('type', 2.0), ('description', 1.0))
+
+# Score multipliers for how a query token reached an indexed term
+EXACT, PREFIX, FUZZY = 1.0, 0.8, 0.6
+
+# Cap on how many indexed terms one query token may expand to
+MAX_EXPANSIONS = 50
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower()) if text else []
+
+
+def trigrams(term):
+    padded = f"^{term}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def max_typos(term):
+    if len(term) < 4:
+        return 0
+    return 1 if len(term) < 8 else 2
+
+
+def edit_distance(a, b, limit):
+    """Optimal string alignment distance, or limit + 1 once it must exceed limit"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i] + [0] * len(b)
+        for j, cb in enumerate(b, 1):
+            cost = ca != cb
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and ca == b[j - 2] and a[i - 2] == cb:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+class SearchIndex(object):
+    """In-memory inverted index over catalog items with trigram typo tolerance.
+
+    Postings map each term to {item id: field weight}. A sorted vocabulary
+    answers prefix queries by bisection and a trigram index over the vocabulary
+    finds near-miss spellings, which are then confirmed by edit distance. Every
+    query token has to match an item for it to be returned.
+    """
+
+    def __init__(self):
+        self.items = {}
+        self._item_terms = {}
+        self._postings = {}
+        self._vocabulary = []
+        self._trigrams = defaultdict(set)
+        self._rankings = {}
+
+    def __len__(self):
+        return len(self.items)
+
+    ##
+    # Maintenance
+    ##
+
+    def _weigh(self, item):
+        weights = {}
+        for field, weight in FIELD_WEIGHTS:
+            for term in tokenize(item.get(field)):
+                if weights.get(term, 0.0) < weight:
+                    weights[term] = weight
+        return weights
+
+    def _add_term(self, term):
+        self._postings[term] = {}
+        bisect.insort(self._vocabulary, term)
+        for gram in trigrams(term):
+            self._trigrams[gram].add(term)
+
+    def _drop_term(self, term):
+        del self._postings[term]
+        del self._vocabulary[bisect.bisect_left(self._vocabulary, term)]
+        for gram in trigrams(term):
+            self._trigrams[gram].discard(term)
+            if not self._trigrams[gram]:
+                del self._trigrams[gram]
+
+    def add(self, item):
+        """Index an item dict (as from serialize_item), replacing any previous version"""
+        self.remove(item['id'])
+        weights = self._weigh(item)
+        for term, weight in weights.items():
+            if term not in self._postings:
+                self._add_term(term)
+            self._postings[term][item['id']] = weight
+            self._rankings.pop(term, None)
+        self.items[item['id']] = item
+        self._item_terms[item['id']] = tuple(weights)
+
+    def remove(self, item_id):
+        terms = self._item_terms.pop(item_id, None)
+        if terms is None:
+            return
+        del self.items[item_id]
+        for term in terms:
+            postings = self._postings[term]
+            del postings[item_id]
+            self._rankings.pop(term, None)
+            if not postings:
+                self._drop_term(term)
+
+    def rebuild(self, items):
+        """Replace the whole index; much faster than add() per item"""
+        self.__init__()
+        for item in items:
+            weights = self._weigh(item)
+            for term, weight in weights.items():
+                postings = self._postings.get(term)
+                if postings is None:
+                    postings = self._postings[term] = {}
+                postings[item['id']] = weight
+            self.items[item['id']] = item
+            self._item_terms[item['id']] = tuple(weights)
+        self._vocabulary = sorted(self._postings)
+        for term in self._vocabulary:
+            for gram in trigrams(term):
+                self._trigrams[gram].add(term)
+
+    ##
+    # Querying
+    ##
+
+    def expand(self, token, prefix=False):
+        """{indexed term: multiplier} for the terms a query token may mean"""
+        expansions = {}
+        if token in self._postings:
+            expansions[token] = EXACT
+
+        if prefix and len(token) >= 2:
+            start = bisect.bisect_left(self._vocabulary, token)
+            stop = bisect.bisect_left(self._vocabulary, token + '\uffff', start)
+            # Prefer completions closest in length to what was typed
+            for term in heapq.nsmallest(MAX_EXPANSIONS, self._vocabulary[start:stop], key=len):
+                if term != token:
+                    expansions[term] = PREFIX * (0.5 + 0.5 * len(token) / len(term))
+
+        limit = max_typos(token)
+        if limit and len(expansions) < MAX_EXPANSIONS:
+            grams = trigrams(token)
+            # Each edit can break at most three trigrams
+            needed = max(1, len(grams) - 3 * limit)
+            shared = Counter()
+            for gram in grams:
+                shared.update(self._trigrams.get(gram, ()))
+            for term, count in shared.most_common():
+                if count < needed or len(expansions) >= MAX_EXPANSIONS:
+                    break
+                if term in expansions or max_typos(term) < limit:
+                    continue
+                distance = edit_distance(token, term, limit)
+                if distance <= limit:
+                    expansions[term] = FUZZY * (1 - distance / (len(token) + 1))
+        return expansions
+
+    def _ranked(self, term):
+        """The term's item ids, highest weight first"""
+        ranked = self._rankings.get(term)
+        if ranked is None:
+            postings = self._postings[term]
+            ranked = self._rankings[term] = sorted(postings, key=postings.__getitem__, reverse=True)
+        return ranked
+
+    def search(self, query, kinds=None, limit=20):
+        """The best-scoring items matching every token of query, as (score, item)"""
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not tokens:
+            return []
+
+        total = len(self.items)
+        per_token = []
+        for i, token in enumerate(tokens):
+            # The last token is usually still being typed
+            expansions = self.expand(token, prefix=(i == len(tokens) - 1))
+            if not expansions:
+                return []
+            scored = [
+                (term, multiplier * math.log(1 + total / len(self._postings[term])))
+                for term, multiplier in expansions.items()
+            ]
+            per_token.append((sum(len(self._postings[term]) for term, _ in scored), scored))
+
+        if len(per_token) == 1:
+            # An item's score is its best term, so the top few of each term's
+            # ranking always contain the overall top
+            scores = {}
+            for term, boost in per_token[0][1]:
+                postings = self._postings[term]
+                taken = 0
+                for item_id in self._ranked(term):
+                    if kinds and self.items[item_id]['kind'] not in kinds:
+                        continue
+                    score = postings[item_id] * boost
+                    if score > scores.get(item_id, 0.0):
+                        scores[item_id] = score
+                    taken += 1
+                    if taken == limit:
+                        break
+        else:
+            # Score the most selective token's items, then narrow by the rest
+            per_token.sort(key=itemgetter(0))
+            scores = {}
+            for term, boost in per_token[0][1]:
+                for item_id, weight in self._postings[term].items():
+                    if weight * boost > scores.get(item_id, 0.0):
+                        scores[item_id] = weight * boost
+            for _, scored in per_token[1:]:
+                if len(scored) == 1:
+                    postings, boost = self._postings[scored[0][0]], scored[0][1]
+                    scores = {i: score + postings[i] * boost for i, score in scores.items() if i in postings}
+                else:
+                    best = {}
+                    for term, boost in scored:
+                        postings = self._postings[term]
+                        for item_id in scores.keys() & postings.keys():
+                            if postings[item_id] * boost > best.get(item_id, 0.0):
+                                best[item_id] = postings[item_id] * boost
+                    scores = {i: scores[i] + score for i, score in best.items()}
+                if not scores:
+                    return []
+            if kinds:
+                scores = {i: score for i, score in scores.items() if self.items[i]['kind'] in kinds}
+
+        best = heapq.nlargest(limit, scores.items(), key=itemgetter(1))
+        return [(score, self.items[item_id]) for item_id, score in best]
+
+
+class CatalogSearch(object):
+    """The app's search index, kept in step with the catalog.
+
+    The index is built on first use (or by warm() when a worker starts).
+    Commits made by this process are applied straight from the
+    catalog_changed signal. Writes from other processes are noticed through
+    the catalog version, and picked up by re-reading items updated since the
+    last sync and dropping ids that no longer exist.
+    """
+
+    def __init__(self, app=None):
+        self.index = SearchIndex()
+        self._lock = threading.RLock()
+        self._version = None
+        self._watermark = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.sync_overlap = timedelta(seconds=app.config['INDEX_SYNC_OVERLAP'])
+        catalog_changed.connect(self._apply_changes, sender=app, weak=False)
+        app.extensions['catalog_search'] = self
+
+    def _apply_changes(self, sender, upserted, deleted):
+        with self._lock:
+            if self._version is None:
+                return
+            for item_id in deleted:
+                self.index.remove(item_id)
+            for item in upserted.values():
+                self.index.add(item)
+
+    def warm(self):
+        with self._lock:
+            self._refresh()
+
+    def _refresh(self):
+        version = current_app.extensions['catalog_cache'].version()
+        if self._version is None:
+            started = time.monotonic()
+            self._watermark = db.session.query(db.func.max(CatalogItem.updated_at)).scalar()
+            query = CatalogItem.query.order_by(CatalogItem.id).yield_per(1000)
+            self.index.rebuild(serialize_item(item) for item in query)
+            current_app.logger.info(
+                f"Built catalog search index: {len(self.index)} items in {time.monotonic() - started:.2f}s"
+            )
+        elif version != self._version:
+            self._sync()
+        self._version = version
+
+    def _sync(self):
+        query = CatalogItem.query
+        if self._watermark is not None:
+            # Allow for clock skew between the app servers stamping updated_at
+            query = query.filter(CatalogItem.updated_at >= self._watermark - self.sync_overlap)
+        for item in query.yield_per(1000):
+            self.index.add(serialize_item(item))
+            if self._watermark is None or item.updated_at > self._watermark:
+                self._watermark = item.updated_at
+
+        existing = set(db.session.scalars(db.select(CatalogItem.id)))
+        for item_id in set(self.index.items) - existing:
+            self.index.remove(item_id)
+
+    def search(self, query, kinds=None, limit=20):
+        with self._lock:
+            self._refresh()
+            return self.index.search(query, kinds, limit)
@@ -0,0 +1,126 @@
+from flask.json.provider import DefaultJSONProvider
+from marshmallow import fields
+
+
+##
+# JSON providers
+##
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask's JSON provider on orjson, several times faster at both ends.
+
+    Output matches the default provider's: keys are sorted while sort_keys
+    is set, non-string keys are allowed, debug responses are indented, and
+    datetimes (HTTP dates), decimals and anything else orjson does not know
+    go through the same default() hook. Only non-ASCII text differs, being
+    sent as UTF-8 rather than escaped. Needs the orjson package.
+    """
+
+    def __init__(self, app):
+        try:
+            import orjson
+        except ImportError:
+            raise RuntimeError("JSON_PROVIDER 'orjson' needs the orjson package installed")
+        super().__init__(app)
+        self._orjson = orjson
+
+    def _options(self, indent=False):
+        orjson = self._orjson
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def dumps(self, obj, **kwargs):
+        default = kwargs.get('default', self.default)
+        option = self._options(indent=bool(kwargs.get('indent')))
+        return self._orjson.dumps(obj, default=default, option=option).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return self._orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = self.compact is False or (self.compact is None and self._app.debug)
+        body = self._orjson.dumps(obj, default=self.default, option=self._options(indent))
+        return self._app.response_class(body + b"\n", mimetype=self.mimetype)
+
+
+JSON_PROVIDERS = {
+    'default': DefaultJSONProvider,
+    'orjson': OrjsonProvider,
+}
+
+
+def create_json_provider(name, app):
+    try:
+        provider = JSON_PROVIDERS[name]
+    except KeyError:
+        raise ValueError(f"Unknown JSON provider: {name}")
+    return provider(app)
+
+
+##
+# Compiled schemas
+##
+
+class CompiledSchema(object):
+    """A marshmallow schema's dump, generated once as straight-line Python.
+
+    schema.dump() walks its fields for every object, calling each field's
+    serialize() with its validation and hooks. For the field types the API
+    uses, compile_schema() instead writes out a dict literal reading the
+    attributes directly, and a list comprehension around it for many, which
+    is what the hand-written serialize_* functions did. one(obj) and
+    many(objs) return the same as dump() for objects whose attributes
+    already have the column types; Method, Function and any other fields
+    are delegated to the schema's own field objects.
+    """
+
+    def __init__(self, schema, one, many):
+        self.schema = schema
+        self.one = one
+        self.many = many
+
+
+def _field_expression(name, field, namespace, i):
+    """Python source for one field's value read from obj"""
+    attribute = field.attribute or name
+    value = f'obj.{attribute}' if attribute.isidentifier() else f'_getattr(obj, {attribute!r})'
+
+    if type(field) in (fields.Integer, fields.Float, fields.String, fields.Boolean, fields.Raw):
+        return value
+    if type(field) in (fields.DateTime, fields.Date, fields.Time):
+        fmt = field.format or 'iso'
+        if fmt == 'iso':
+            return f'(None if (_v{i} := {value}) is None else _v{i}.isoformat())'
+        if fmt in field.SERIALIZATION_FUNCS:
+            namespace[f'_fmt{i}'] = field.SERIALIZATION_FUNCS[fmt]
+            return f'(None if (_v{i} := {value}) is None else _fmt{i}(_v{i}))'
+        namespace[f'_fmt{i}'] = fmt
+        return f'(None if (_v{i} := {value}) is None else _v{i}.strftime(_fmt{i}))'
+    if type(field) is fields.Decimal and field.as_string and field.places is None:
+        return f'(None if (_v{i} := {value}) is None else format(_v{i}, "f"))'
+    # Anything else, including Method and Function fields, serializes itself
+    namespace[f'_field{i}'] = field
+    return f'_field{i}.serialize({name!r}, obj)'
+
+
+def compile_schema(schema):
+    """Compile a marshmallow Schema instance (with its only/exclude) into a CompiledSchema"""
+    namespace = {'_getattr': getattr}
+    items = []
+    for i, (name, field) in enumerate(schema.dump_fields.items()):
+        key = field.data_key if field.data_key is not None else name
+        items.append(f'{key!r}: {_field_expression(name, field, namespace, i)}')
+    literal = '{' + ', '.join(items) + '}'
+    source = (
+        f'def one(obj):\n'
+        f'    return {literal}\n'
+        f'def many(objs):\n'
+        f'    return [{literal} for obj in objs]\n'
+    )
+    exec(compile(source, f'<compiled {type(schema).__name__}>', 'exec'), namespace)
+    return CompiledSchema(schema, namespace['one'], namespace['many'])
@@ -0,0 +1,211 @@
+import threading
+import time
+import uuid
+import click
+import jwt
+
+from datetime import datetime, timedelta
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import delete, select
+from sqlalchemy.exc import IntegrityError
+
+from app import db, metrics
+from app.cache import BloomFilter
+from app.models import RevokedToken
+
+tokens_cli = AppGroup('tokens', help='Manage refresh token revocations.')
+
+# A login starts a token family: a short-lived access token plus a refresh
+# token, both carrying the family id. Each refresh spends its refresh token
+# for a new pair in the same family. Spending one twice means it was copied,
+# so the whole family is revoked; logging out revokes it too.
+
+
+class RefreshTokenReused(jwt.InvalidTokenError):
+    """A refresh token was presented after it had already been spent"""
+
+
+class RevocationList(object):
+    """Which token ids are revoked, answered from memory.
+
+    Every id in revoked_tokens is added to a Bloom filter, so the usual
+    answer (not revoked) costs a few hashes and no query; only when the
+    filter says maybe is the table asked. Revocations made by this process
+    are added as they commit; every TOKEN_REVOCATION_SYNC_INTERVAL seconds
+    the filter also reads rows revoked since its last sync. It is rebuilt
+    from the live rows once it holds more ids than it was sized for.
+    """
+
+    def __init__(self, app=None):
+        self._lock = threading.RLock()
+        self.filter = None
+        self._synced_at = 0.0
+        self._watermark = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.capacity = app.config['TOKEN_REVOCATION_CAPACITY']
+        self.error_rate = app.config['TOKEN_REVOCATION_ERROR_RATE']
+        self.sync_interval = app.config['TOKEN_REVOCATION_SYNC_INTERVAL']
+        self.sync_overlap = timedelta(seconds=app.config['INDEX_SYNC_OVERLAP'])
+        app.extensions['token_revocations'] = self
+
+    def warm(self):
+        with self._lock:
+            self._refresh()
+
+    def _refresh(self):
+        if self.filter is not None and time.monotonic() - self._synced_at < self.sync_interval:
+            return
+        if self.filter is None or self.filter.count > self.filter.capacity:
+            live = db.session.scalar(
+                select(db.func.count(RevokedToken.id)).where(RevokedToken.expires_at > datetime.utcnow())
+            )
+            self.filter = BloomFilter(max(self.capacity, live * 2), self.error_rate)
+            self._watermark = None
+            self._sync(select(RevokedToken.id, RevokedToken.revoked_at)
+                       .where(RevokedToken.expires_at > datetime.utcnow()))
+        else:
+            query = select(RevokedToken.id, RevokedToken.revoked_at)
+            if self._watermark is not None:
+                # Allow for clock skew between the app servers stamping revoked_at
+                query = query.where(RevokedToken.revoked_at >= self._watermark - self.sync_overlap)
+            self._sync(query)
+        self._synced_at = time.monotonic()
+
+    def _sync(self, query):
+        for token_id, revoked_at in db.session.execute(query.execution_options(yield_per=1000)):
+            self.filter.add(token_id)
+            if self._watermark is None or revoked_at > self._watermark:
+                self._watermark = revoked_at
+
+    def add(self, token_id):
+        with self._lock:
+            if self.filter is not None:
+                self.filter.add(token_id)
+
+    def is_revoked(self, token_id):
+        with self._lock:
+            self._refresh()
+            if token_id not in self.filter:
+                return False
+        return db.session.scalar(
+            select(RevokedToken.id).where(RevokedToken.id == token_id, RevokedToken.expires_at > datetime.utcnow())
+        ) is not None
+
+
+def _revocations():
+    return current_app.extensions['token_revocations']
+
+
+def _revoke(token_id, expires_at):
+    """Record token_id as revoked; False if it already was. Commits."""
+    db.session.add(RevokedToken(id=token_id, expires_at=expires_at, revoked_at=datetime.utcnow()))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return False
+    _revocations().add(token_id)
+    return True
+
+
+def issue_tokens(user_id, family=None):
+    """A new access and refresh token pair, in a new family unless one is given"""
+    now = datetime.utcnow()
+    secret = current_app.config['SECRET_KEY']
+    access_ttl = current_app.config['ACCESS_TOKEN_TTL']
+    result = 'refreshed' if family else 'issued'
+    family = family or uuid.uuid4().hex
+    access_token = jwt.encode({
+        'user_id': user_id,
+        'fam': family,
+        'type': 'access',
+        'iat': now,
+        'exp': now + timedelta(seconds=access_ttl)
+    }, secret, algorithm='HS256')
+    refresh_token = jwt.encode({
+        'user_id': user_id,
+        'fam': family,
+        'jti': uuid.uuid4().hex,
+        'type': 'refresh',
+        'iat': now,
+        'exp': now + timedelta(seconds=current_app.config['REFRESH_TOKEN_TTL'])
+    }, secret, algorithm='HS256')
+    metrics.inc('auth_tokens_total', result=result)
+    return {
+        'access_token': access_token,
+        'refresh_token': refresh_token,
+        'expires_in': access_ttl
+    }
+
+
+def refresh(refresh_token):
+    """Spend a refresh token for a new token pair in its family.
+
+    Checking the family costs no query unless the revocation filter matches
+    it. Spending is a single insert of the token id, which fails if another
+    request (in any process) spent it first: the token was replayed, so the
+    family is revoked and RefreshTokenReused raised. Raises the usual jwt
+    exceptions on bad, expired or revoked tokens.
+    """
+    claims = jwt.decode(refresh_token, current_app.config['SECRET_KEY'], algorithms=["HS256"])
+    if claims.get('type') != 'refresh' or not {'user_id', 'fam', 'jti'} <= claims.keys():
+        raise jwt.InvalidTokenError('Not a refresh token')
+    if _revocations().is_revoked(claims['fam']):
+        metrics.inc('auth_tokens_total', result='revoked')
+        raise jwt.InvalidTokenError('Token has been revoked')
+
+    if not _revoke(claims['jti'], datetime.utcfromtimestamp(claims['exp'])):
+        revoke_family(claims['fam'])
+        metrics.inc('auth_tokens_total', result='reused')
+        raise RefreshTokenReused('Refresh token already used')
+    return issue_tokens(claims['user_id'], claims['fam'])
+
+
+def revoke_family(family):
+    """Revoke every access and refresh token issued under family"""
+    # No token of the family can outlive the newest possible refresh token
+    expires_at = datetime.utcnow() + timedelta(seconds=current_app.config['REFRESH_TOKEN_TTL'])
+    if _revoke(family, expires_at):
+        metrics.inc('auth_tokens_total', result='family_revoked')
+
+
+def is_revoked(claims):
+    """Whether verified token claims belong to a revoked family"""
+    return 'fam' in claims and _revocations().is_revoked(claims['fam'])
+
+
+def sweep_revocations(batch_size=None, now=None):
+    """Delete revocations whose tokens have all expired, a batch per transaction"""
+    batch_size = batch_size or current_app.config['TOKEN_SWEEP_BATCH_SIZE']
+    now = now or datetime.utcnow()
+    swept = 0
+    while True:
+        batch = select(RevokedToken.id).where(RevokedToken.expires_at <= now).limit(batch_size).scalar_subquery()
+        deleted = db.session.execute(
+            delete(RevokedToken).where(RevokedToken.id.in_(batch)).execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+        swept += deleted
+        if deleted < batch_size:
+            break
+    return swept
+
+
+@tokens_cli.command('sweep')
+@click.option('--once', is_flag=True, help='Delete what has expired and exit instead of polling.')
+@click.option('--batch-size', type=int, default=None, help='Rows deleted per transaction.')
+@click.option('--interval', type=float, default=None, help='Seconds between sweeps.')
+def sweep_command(once, batch_size, interval):
+    """Delete revocations for tokens that have expired anyway"""
+    interval = interval if interval is not None else current_app.config['TOKEN_SWEEP_INTERVAL']
+    while True:
+        swept = sweep_revocations(batch_size)
+        if swept:
+            current_app.logger.info(f"Swept {swept} expired token revocations")
+        if once:
+            break
+        time.sleep(interval)
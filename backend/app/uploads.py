@@ -0,0 +1,100 @@
+import os
+import click
+
+from datetime import datetime
+from itertools import groupby
+from flask.cli import AppGroup
+
+from app import db, image_pipeline
+from app.imaging import sniff_image, mime_type
+from app.models import Upload, User
+from app.storage import is_content_key
+
+uploads_cli = AppGroup('uploads', help='Maintain the index of uploaded photos.')
+
+
+def _describe(digest, objects):
+    """Build an index row for a stored photo whose upload was never recorded.
+
+    The original is gone by now, so size is the bytes stored across variants
+    and dimensions come from the largest variant.
+    """
+    largest = max(objects, key=lambda o: int(o[0].rsplit('/', 1)[1].split('.', 1)[0]))
+    with image_pipeline.store.open(largest[0]) as f:
+        info = sniff_image(f)
+    pil_format, width, height = info if info else (None, None, None)
+    return Upload(
+        digest=digest,
+        size=sum(size for _, size, _ in objects),
+        mime_type=mime_type(pil_format),
+        width=width,
+        height=height,
+        created_at=datetime.utcfromtimestamp(min(mtime for _, _, mtime in objects))
+    )
+
+
+def _backfill(batch, dry_run):
+    digests = [digest for digest, _ in batch]
+    known = {d for (d,) in db.session.query(Upload.digest).filter(Upload.digest.in_(digests))}
+    owners = dict(db.session.query(User.profile_photo, User.id).filter(User.profile_photo.in_(digests)))
+
+    added = 0
+    for digest, objects in batch:
+        if digest in known:
+            continue
+        upload = _describe(digest, objects)
+        upload.owner_id = owners.get(digest)
+        if not dry_run:
+            db.session.add(upload)
+        added += 1
+
+    if not dry_run:
+        db.session.commit()
+    return added
+
+
+def _prune(batch_size, dry_run):
+    """Delete index rows whose photo is no longer in the store"""
+    removed = 0
+    last_id = 0
+    while True:
+        rows = db.session.query(Upload.id, Upload.digest) \
+            .filter(Upload.id > last_id).order_by(Upload.id).limit(batch_size).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+
+        missing = [
+            row.id for row in rows
+            if not os.path.exists(image_pipeline.original_path(row.digest))
+            and not any(image_pipeline.store.exists(key) for key in image_pipeline.variant_keys(row.digest))
+        ]
+        if missing and not dry_run:
+            Upload.query.filter(Upload.id.in_(missing)).delete(synchronize_session=False)
+            db.session.commit()
+        removed += len(missing)
+    return removed
+
+
+@uploads_cli.command('reconcile')
+@click.option('--batch-size', type=int, default=500, show_default=True)
+@click.option('--dry-run', is_flag=True, help='Report what would change without writing.')
+def reconcile_command(batch_size, dry_run):
+    """Backfill and repair the uploads table from the photo store"""
+    scanned = added = 0
+    batch = []
+    objects = image_pipeline.store.iter_objects()
+    for digest, group in groupby(objects, key=lambda o: o[0].split('/', 1)[0]):
+        if not is_content_key(digest):
+            continue
+        batch.append((digest, list(group)))
+        scanned += 1
+        if len(batch) >= batch_size:
+            added += _backfill(batch, dry_run)
+            batch = []
+    if batch:
+        added += _backfill(batch, dry_run)
+
+    removed = _prune(batch_size, dry_run)
+    verb = 'would be' if dry_run else 'were'
+    click.echo(f"Scanned {scanned} photos: {added} {verb} added to the index, {removed} stale rows {verb} removed.")
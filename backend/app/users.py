@@ -0,0 +1,273 @@
+import csv
+import json
+import os
+import time
+import click
+
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import islice, repeat
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import select
+from werkzeug.security import generate_password_hash
+
+from app import db
+from app.models import User
+
+users_cli = AppGroup('users', help='Bulk import and export users.')
+
+EXPORT_FIELDS = ('id', 'username', 'email', 'firstname', 'lastname', 'location', 'joined_on')
+
+# Longest value each imported field may have, from the users table
+FIELD_LENGTHS = {
+    'username': User.username.type.length,
+    'email': User.email.type.length,
+    'firstname': User.firstname.type.length,
+    'lastname': User.lastname.type.length,
+    'location': User.location.type.length,
+    'password_hash': User.password.type.length,
+}
+
+
+def _format_for(file, fmt):
+    if fmt:
+        return fmt
+    return 'ndjson' if os.path.splitext(file.name)[1].lower() in ('.ndjson', '.jsonl') else 'csv'
+
+
+def _read_records(file, fmt):
+    """Yield (line, record, error) for each input row, without reading ahead"""
+    if fmt == 'csv':
+        reader = csv.DictReader(file)
+        for record in reader:
+            yield reader.line_num, record, None
+        return
+
+    for line, text in enumerate(file, 1):
+        if not text.strip():
+            continue
+        try:
+            record = json.loads(text)
+        except ValueError as e:
+            yield line, None, f"Invalid JSON: {e}"
+            continue
+        if not isinstance(record, dict):
+            yield line, None, "Expected a JSON object"
+            continue
+        yield line, record, None
+
+
+def _clean(record):
+    """The users row for an input record; raises ValueError naming the problem"""
+    row = {}
+    for field in ('username', 'email', 'password', 'password_hash', 'firstname', 'lastname', 'location'):
+        value = record.get(field)
+        if value is None or value == '':
+            continue
+        if not isinstance(value, str):
+            raise ValueError(f"{field} must be a string")
+        value = value if field in ('password', 'password_hash') else value.strip()
+        if field in FIELD_LENGTHS and len(value) > FIELD_LENGTHS[field]:
+            raise ValueError(f"{field} is longer than {FIELD_LENGTHS[field]} characters")
+        row[field] = value
+
+    missing = [field for field in ('username', 'email') if field not in row]
+    if 'password' not in row and 'password_hash' not in row:
+        missing.append('password')
+    if missing:
+        raise ValueError(f"Missing required fields: {', '.join(missing)}")
+    if '@' not in row['email']:
+        raise ValueError("email is not an email address")
+    # Hashes exported from another environment carry their method and salt
+    if 'password_hash' in row and row['password_hash'].count('$') != 2:
+        raise ValueError("password_hash is not a werkzeug password hash")
+    return row
+
+
+class Importer(object):
+    """Validates, hashes and inserts users a batch at a time.
+
+    Passwords are hashed in a process pool sized to the machine, and the next
+    batch is hashed while the previous one is being inserted. Rows are
+    inserted with a multi-row INSERT ... ON CONFLICT DO NOTHING, so a
+    duplicate username or email (including one registered while the import
+    runs) is reported against its row instead of failing the whole batch.
+    """
+
+    def __init__(self, pool, workers, method, report):
+        self.pool = pool
+        self.workers = workers
+        self.method = method
+        self.report = report
+        self.imported = 0
+        self.failed = 0
+        self._insert = self._insert_statement()
+
+    def _insert_statement(self):
+        dialect = db.engine.dialect.name
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        elif dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            raise click.ClickException(f"Bulk import does not support {dialect} databases")
+        return insert(User.__table__).on_conflict_do_nothing().returning(User.username)
+
+    def fail(self, line, error):
+        self.failed += 1
+        self.report(line, error)
+
+    def prepare(self, batch):
+        """Validate a batch and start hashing its passwords; returns what insert() needs"""
+        rows = []
+        usernames, emails = set(), set()
+        for line, record, error in batch:
+            try:
+                if error is not None:
+                    raise ValueError(error)
+                row = _clean(record)
+                if row['username'] in usernames or row['email'] in emails:
+                    raise ValueError("Duplicate username or email earlier in the file")
+            except ValueError as e:
+                self.fail(line, str(e))
+                continue
+            usernames.add(row['username'])
+            emails.add(row['email'])
+            rows.append((line, row))
+
+        # Skip hashing for rows that cannot be inserted anyway
+        taken_usernames = set(db.session.scalars(select(User.username).where(User.username.in_(usernames))))
+        taken_emails = set(db.session.scalars(select(User.email).where(User.email.in_(emails))))
+        db.session.rollback()
+        valid = []
+        for line, row in rows:
+            if row['username'] in taken_usernames:
+                self.fail(line, "Username already exists")
+            elif row['email'] in taken_emails:
+                self.fail(line, "Email already exists")
+            else:
+                valid.append((line, row))
+
+        to_hash = [row.pop('password') for _, row in valid if 'password_hash' not in row]
+        chunksize = max(1, len(to_hash) // (4 * self.workers))
+        hashes = self.pool.map(generate_password_hash, to_hash, repeat(self.method), chunksize=chunksize)
+        return valid, hashes
+
+    def insert(self, valid, hashes):
+        now = datetime.utcnow()
+        params = []
+        for _, row in valid:
+            password = row.pop('password_hash', None) or next(hashes)
+            row.pop('password', None)
+            params.append(dict(
+                username=row['username'],
+                email=row['email'],
+                password=password,
+                firstname=row.get('firstname'),
+                lastname=row.get('lastname'),
+                location=row.get('location'),
+                joined_on=now
+            ))
+        if not params:
+            return
+
+        inserted = set(db.session.scalars(self._insert, params))
+        db.session.commit()
+        self.imported += len(inserted)
+        for line, row in valid:
+            if row['username'] not in inserted:
+                self.fail(line, "Username or email already exists")
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+@users_cli.command('import')
+@click.argument('source', type=click.File('r', encoding='utf-8'))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']), default=None,
+              help='Input format; guessed from the file extension by default.')
+@click.option('--batch-size', type=int, default=1000, show_default=True)
+@click.option('--workers', type=int, default=None, help='Hashing processes; defaults to the number of CPUs.')
+@click.option('--errors', 'errors_file', type=click.File('w', encoding='utf-8'), default=None,
+              help='Write rejected rows here as NDJSON instead of to stderr.')
+def import_command(source, fmt, batch_size, workers, errors_file):
+    """Create users from a CSV or NDJSON file ('-' for stdin).
+
+    Each row needs username, email and either password or password_hash (as
+    written by `users export --password-hashes`); firstname, lastname and
+    location are optional. Rows that fail are reported and skipped.
+    """
+    def report(line, error):
+        if errors_file is not None:
+            errors_file.write(json.dumps({'line': line, 'error': error}) + '\n')
+        else:
+            click.echo(f"line {line}: {error}", err=True)
+
+    workers = workers or os.cpu_count() or 1
+    started = time.monotonic()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        importer = Importer(pool, workers, current_app.config['PASSWORD_HASH_METHOD'], report)
+        pending = None
+        for batch in _batches(_read_records(source, _format_for(source, fmt)), batch_size):
+            prepared = importer.prepare(batch)
+            if pending is not None:
+                importer.insert(*pending)
+            pending = prepared
+        if pending is not None:
+            importer.insert(*pending)
+
+    elapsed = time.monotonic() - started
+    click.echo(
+        f"Imported {importer.imported} users, rejected {importer.failed} rows in {elapsed:.1f}s "
+        f"({importer.imported / max(elapsed, 1e-9):.0f} users/s)",
+        err=True
+    )
+
+
+@users_cli.command('export')
+@click.argument('target', type=click.File('w', encoding='utf-8'), default='-')
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']), default=None,
+              help='Output format; guessed from the file extension by default.')
+@click.option('--batch-size', type=int, default=1000, show_default=True)
+@click.option('--password-hashes', is_flag=True, help='Include password hashes, for moving users between environments.')
+def export_command(target, fmt, batch_size, password_hashes):
+    """Write every user to a CSV or NDJSON file ('-' for stdout)"""
+    fmt = _format_for(target, fmt)
+    fields = EXPORT_FIELDS + (('password_hash',) if password_hashes else ())
+    columns = [getattr(User, field) for field in EXPORT_FIELDS]
+    if password_hashes:
+        columns.append(User.password.label('password_hash'))
+
+    writer = None
+    if fmt == 'csv':
+        writer = csv.DictWriter(target, fieldnames=fields, lineterminator='\n')
+        writer.writeheader()
+
+    exported = 0
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            select(*columns).where(User.id > last_id).order_by(User.id).limit(batch_size)
+        ).all()
+        db.session.rollback()
+        if not rows:
+            break
+        last_id = rows[-1].id
+
+        for row in rows:
+            record = dict(row._mapping)
+            record['joined_on'] = record['joined_on'].isoformat() if record['joined_on'] else None
+            if writer is not None:
+                writer.writerow(record)
+            else:
+                target.write(json.dumps(record) + '\n')
+        exported += len(rows)
+
+    click.echo(f"Exported {exported} users", err=True)
@@ -10,31 +10,50 @@ This file creates your application.
 import os
 import jwt
 import secrets
-import random
 
 from datetime import datetime, timedelta
 from functools import wraps
 from datetime import datetime
-from app import app, db, login_manager
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from app import db, login_manager, hasher, image_pipeline, catalog_cache, catalog_search, workshop_directory
 
 
-from flask import current_app, render_template, request, jsonify, send_file, session, send_from_directory, url_for, redirect, g
+from flask import Blueprint, current_app, render_template, request, jsonify, send_file, session, url_for, redirect, g, abort, make_response
 from flask_login import login_user, logout_user, current_user, login_required
 
 from werkzeug.utils import secure_filename
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.exceptions import HTTPException
 
-from sqlalchemy import func
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy import func, or_
+from sqlalchemy.exc import SQLAlchemyError, IntegrityError
+from marshmallow import ValidationError
 
 from app.forms import LoginForm, RegistrationForm
-from app.models import User
+from app.models import User, Upload, CatalogItem, Workshop, Booking, BookingSlot
+from app.hashing import HashingOverloaded
+from app.ratelimit import RateLimitExceeded
+from app.httpcache import conditional, compressed
+from app.auth import decode_token, bearer_token, TokenUser
+from app.imaging import SOURCE_FORMATS, VARIANT_FORMATS, sniff_image, mime_type, variant_key
+from app.storage import is_content_key
+from app.dbpool import pool_status
+from app.catalog import serialize_item
+from app.schemas import (
+    user_schema, user_update_schema, booking_slot_schema, booking_schema, booking_history_schema,
+    compact_booking_history_schema, user_projection, PUBLIC_USER_FIELDS, catalog_item_input_schema
+)
+from app.workshops import EDITABLE_FIELDS as WORKSHOP_FIELDS, serialize_workshop, is_open
 
 from flask_wtf.csrf import generate_csrf
 
 from itsdangerous import URLSafeTimedSerializer as Serializer
-from flask_mail import Message
-from app import mail
+from app.resets import issue_code, consume_code
+from app.tokens import issue_tokens, refresh as refresh_tokens, revoke_family, RefreshTokenReused
+from app.outbox import enqueue_mail
+from app.availability import is_taken, add_taken
+from app.bookings import reserve, confirm, cancel, history, slots_query
+
+api = Blueprint('api', __name__)
 
 
 ##
@@ -60,11 +79,11 @@ def requires_auth(f):
 
     token = parts[1]
     try:
-        payload = jwt.decode(token, app.config['SECRET_KEY'], algorithms=["HS256"])
+        payload = decode_token(token)
 
     except jwt.ExpiredSignatureError:
         return jsonify({'code': 'token_expired', 'description': 'token is expired'}), 401
-    except jwt.DecodeError:
+    except jwt.InvalidTokenError:
         return jsonify({'code': 'token_invalid_signature', 'description': 'Token signature is invalid'}), 401
 
     g.current_user = user = payload
@@ -72,14 +91,29 @@ def requires_auth(f):
 
   return decorated
 
+def admin_required(f):
+  @wraps(f)
+  @login_required
+  def decorated(*args, **kwargs):
+    if current_user.id not in current_app.config['ADMIN_USER_IDS']:
+      return jsonify({'error': 'Admin access required'}), 403
+    return f(*args, **kwargs)
+
+  return decorated
+
 
 # Define the default route
-@app.route('/')
+@api.route('/')
 def index():
     return jsonify(message="This is the beginning of our API")
 
+TAKEN_ERRORS = {
+    'username': "Username already exists",
+    'email': "Email already exists",
+}
+
 #
-@app.route('/api/v1/register', methods=['POST'])
+@api.route('/api/v1/register', methods=['POST'])
 def register():
     try:
         data = request.get_json(force=True)
@@ -92,11 +126,14 @@ def register():
                 "missing": missing
             }), 400
             
-        if User.query.filter_by(username=data['username']).first():
-            return jsonify({"error": "Username already exists"}), 400
-            
-        if User.query.filter_by(email=data['email']).first():
-            return jsonify({"error": "Email already exists"}), 400
+        # Fail fast, before the slow hash, on names the filter knows are taken;
+        # a new name costs no query here, the unique constraints decide
+        for field in TAKEN_ERRORS:
+            if is_taken(field, data[field]):
+                return jsonify({"error": TAKEN_ERRORS[field]}), 400
+        
+        # Hand the connection back to the pool before the slow hash
+        db.session.close()
         
         user = User(
             username=data['username'],
@@ -108,7 +145,18 @@ def register():
         )
         
         db.session.add(user)
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Lost a race for the name (or it is too new for the filter)
+            db.session.rollback()
+            taken = db.session.execute(
+                db.select(User.username == data['username'], User.email == data['email'])
+                .where(or_(User.username == data['username'], User.email == data['email']))
+            ).first()
+            field = 'username' if taken is None or taken[0] else 'email'
+            return jsonify({"error": TAKEN_ERRORS[field]}), 400
+        add_taken(user.username, user.email)
         
         return jsonify({
             "message": "User registered successfully",
@@ -122,6 +170,8 @@ def register():
             }
         }), 201
         
+    except HashingOverloaded:
+        raise
     except SQLAlchemyError as e:
         db.session.rollback()
         return jsonify({"error": "Database operation failed", "details": str(e)}), 500
@@ -129,8 +179,19 @@ def register():
         return jsonify({"error": "Registration failed", "details": str(e)}), 400
 
 
+# Whether a username and/or email is still free, for checking as the user
+# types; a free name is answered from memory, a possible match by the table
+@api.route('/api/v1/availability', methods=['GET'])
+def availability():
+    asked = {field: request.args[field] for field in TAKEN_ERRORS if request.args.get(field)}
+    if not asked:
+        return jsonify({"error": "username or email is required"}), 400
+    return jsonify({
+        "available": {field: not is_taken(field, value) for field, value in asked.items()}
+    }), 200
+
 # Define the login route
-@app.route('/api/v1/auth/login', methods=['POST'])
+@api.route('/api/v1/auth/login', methods=['POST'])
 def login():
     loginForm = LoginForm()
     
@@ -140,13 +201,20 @@ def login():
         
         user = User.query.filter_by(email=email).first()
         
-        if user and check_password_hash(user.password, password):
-            login_user(user)
-            jwt_token = generate_reset_token(user.id)
+        # Hand the connection back to the pool before the slow hash check
+        db.session.close()
+        
+        if user and hasher.verify(user.password, password):
+            # In token mode the bearer token alone authenticates later requests
+            if current_app.config['AUTH_MODE'] == 'session':
+                login_user(user)
+            tokens = issue_tokens(user.id)
             
             return jsonify({
                 "message": "User successfully logged in.",
-                "token": jwt_token,
+                "token": tokens['access_token'],
+                "refresh_token": tokens['refresh_token'],
+                "expires_in": tokens['expires_in'],
                 "user": {
                     "id": user.id,
                     "username": user.username,
@@ -160,7 +228,7 @@ def login():
     return jsonify({"error": "Validation failed", "details": errors}), 400
 
 # Define the logout route
-@app.route('/api/v1/auth/logout', methods=['POST'])
+@api.route('/api/v1/auth/logout', methods=['POST'])
 @login_required 
 def logout():
     try:
@@ -168,6 +236,10 @@ def logout():
         if not auth_header or not auth_header.startswith('Bearer '):
             return jsonify({"error": "Missing or invalid authorization header"}), 401
             
+        # Revoke the refresh token along with every access token of this login
+        family = getattr(current_user, 'claims', {}).get('fam')
+        if family:
+            revoke_family(family)
         logout_user()
         
         return jsonify({
@@ -187,40 +259,43 @@ def logout():
 ##
 
 #
-@app.route('/api/v1/auth/request-password-reset', methods=['POST'])
+@api.route('/api/v1/auth/request-password-reset', methods=['POST'])
 def request_reset():
     email = request.json.get('email')
     if not email:
         return jsonify({"error": "Email is required"}), 400
 
-    user = User.query.filter_by(email=email).first()
-    
-    if user:
-        reset_code = ''.join([str(random.randint(0, 9)) for _ in range(4)])
-        expiration = datetime.utcnow() + timedelta(minutes=15)
-        
-        user.reset_code = reset_code
-        user.reset_code_expiration = expiration
-        db.session.commit()
+    reset_code = issue_code(email)
+    if reset_code:
+        minutes = current_app.config['RESET_CODE_TTL'] // 60
+
+        # Queued in the same transaction as the code; `flask outbox send` delivers it
+        enqueue_mail(
+            email,
+            "Your Password Reset Code",
+            f"Your password reset code is: {reset_code}\n\nThis code will expire in {minutes} minutes."
+        )
         
         try:
-            msg = Message(
-                "Your Password Reset Code",
-                sender="noreply@yourdomain.com",
-                recipients=[email],
-                body=f"Your password reset code is: {reset_code}\n\nThis code will expire in 15 minutes."
-            )
-            mail.send(msg)
-            return jsonify({"message": "If an account exists with this email, a reset code has been sent"}), 200
-        except Exception as e:
-            app.logger.error(f"Failed to send email: {str(e)}")
+            db.session.commit()
+        except IntegrityError:
+            # A concurrent request for the same email issued (and mailed) its code first
+            db.session.rollback()
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            current_app.logger.error(f"Failed to queue reset code: {str(e)}")
             return jsonify({"error": "Failed to send reset code"}), 500
-    
 
     return jsonify({"message": "If an account exists with this email, a reset code has been sent"}), 200
 
+RESET_CODE_ERRORS = {
+    'invalid': "Invalid code",
+    'expired': "Code expired",
+    'exhausted': "Too many attempts, request a new code",
+}
+
 #
-@app.route('/api/v1/auth/verify-reset-code', methods=['POST'])
+@api.route('/api/v1/auth/verify-reset-code', methods=['POST'])
 def verify_code():
     try:
         email = request.json.get('email')
@@ -229,19 +304,13 @@ def verify_code():
         if not email or not token:
             return jsonify({"error": "Email and token are required"}), 400
 
-        user = User.query.filter_by(email=email).first()
-        if not user:
-            return jsonify({"error": "User not found"}), 404
-            
-        if user.reset_code != token:
-            return jsonify({"error": "Invalid code"}), 400
-            
-        if user.reset_code_expiration < datetime.utcnow():
-            return jsonify({"error": "Code expired"}), 400
+        user_id, result = consume_code(email, token)
+        if user_id is None:
+            return jsonify({"error": RESET_CODE_ERRORS[result]}), 400
             
         expiration = datetime.utcnow() + timedelta(minutes=10)
         payload = {
-            'user_id': user.id,
+            'user_id': user_id,
             'exp': expiration.timestamp()
         }
         
@@ -255,11 +324,11 @@ def verify_code():
         }), 200
         
     except Exception as e:
-        app.logger.error(f"Verify code error: {str(e)}")
+        current_app.logger.error(f"Verify code error: {str(e)}")
         return jsonify({"error": "Verification failed"}), 500
     
 #
-@app.route('/api/v1/auth/reset-password', methods=['POST'])
+@api.route('/api/v1/auth/reset-password', methods=['POST'])
 def reset_password_with_token():
     try:
         data = request.get_json()
@@ -285,19 +354,22 @@ def reset_password_with_token():
         if 'exp' not in payload or datetime.utcnow().timestamp() > payload['exp']:
             return jsonify({"error": "Token expired"}), 400
             
+        # Hash before touching the database so no connection is held meanwhile
+        password_hash = hasher.hash(new_password)
+            
         user = User.query.get(payload.get('user_id'))
         if not user:
             return jsonify({"error": "User not found"}), 404
             
-        user.password = generate_password_hash(new_password)
-        user.reset_code = None
-        user.reset_code_expiration = None
+        user.password = password_hash
         db.session.commit()
         
         return jsonify({"success": True, "message": "Password updated successfully"}), 200
         
+    except HashingOverloaded:
+        raise
     except Exception as e:
-        app.logger.error(f"Password reset error: {str(e)}")
+        current_app.logger.error(f"Password reset error: {str(e)}")
         return jsonify({"error": "Password reset failed"}), 500
 
 
@@ -310,13 +382,38 @@ def reset_password_with_token():
 def load_user(user_id):
     return User.query.get(int(user_id))
 
+# Authenticate from the bearer token without touching the database
+@login_manager.request_loader
+def load_user_from_request(request):
+    token = bearer_token(request)
+    if not token:
+        return None
+    try:
+        return TokenUser(decode_token(token))
+    except jwt.InvalidTokenError:
+        return None
+
+# Answer API clients with a 401 rather than a redirect to the login route
+@login_manager.unauthorized_handler
+def unauthorized():
+    return jsonify({"error": "Authentication required"}), 401
+
 
 ##
 # Functions for user management
 ##
 
-@app.route('/api/v1/users/<int:user_id>', methods=['GET', 'PATCH'])
+def user_etag(user_id):
+    # One narrow read of the version, so an unchanged profile never loads the row
+    if current_user.id != user_id:
+        return None
+    version = db.session.scalar(db.select(User.version).where(User.id == user_id))
+    return None if version is None else f"user-{user_id}-{version}"
+
+@api.route('/api/v1/users/<int:user_id>', methods=['GET', 'PATCH'])
 @login_required
+@compressed
+@conditional(user_etag)
 def user_profile(user_id):
     try:
         if current_user.id != user_id:
@@ -331,39 +428,66 @@ def user_profile(user_id):
                 current_user.lastname = data['lastname']
             if 'location' in data:
                 current_user.location = data['location']
+            current_user.version = User.version + 1
                 
             db.session.commit()
             
             return jsonify({
                 "message": "Profile updated successfully",
-                "user": {
-                    "id": current_user.id,
-                    "firstname": current_user.firstname,
-                    "lastname": current_user.lastname,
-                    "location": current_user.location
-                }
+                "user": user_update_schema.one(current_user)
             }), 200
             
-        return jsonify({
-            "id": current_user.id,
-            "username": current_user.username,
-            "firstname": current_user.firstname,
-            "lastname": current_user.lastname,
-            "location": current_user.location,
-            "profile_photo": current_user.profile_photo,
-            "joined_on": current_user.joined_on.strftime('%Y-%m-%d %H:%M:%S')
-        }), 200
+        return jsonify(user_schema.one(current_user)), 200
         
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
         
+# Several users at once (?ids=1,2,3), in one query for just the requested
+# fields (?fields=username,profile_photo). The caller and admins get every
+# field asked for; other users get only the public ones.
+@api.route('/api/v1/users', methods=['GET'])
+@login_required
+@compressed
+def users_batch():
+    try:
+        ids = list(dict.fromkeys(int(i) for i in request.args.get('ids', '').split(',') if i.strip()))
+    except ValueError:
+        return jsonify({"error": "ids must be comma-separated user ids"}), 400
+    if not ids:
+        return jsonify({"error": "ids is required"}), 400
+    max_ids = current_app.config['USERS_BATCH_MAX_IDS']
+    if len(ids) > max_ids:
+        return jsonify({"error": f"At most {max_ids} ids per request"}), 400
+
+    fields = tuple(user_schema.schema.fields)
+    if request.args.get('fields'):
+        requested = set(request.args['fields'].split(','))
+        unknown = requested - set(fields)
+        if unknown:
+            return jsonify({"error": f"Unknown fields: {', '.join(sorted(unknown))}"}), 400
+        # id always comes back, to match results to the ids asked for
+        fields = tuple(f for f in fields if f in requested or f == 'id')
+    full = user_projection(fields)
+    public = user_projection(tuple(f for f in fields if f in PUBLIC_USER_FIELDS))
+    is_admin = current_user.id in current_app.config['ADMIN_USER_IDS']
+
+    rows = db.session.execute(
+        db.select(*(getattr(User, f) for f in fields)).where(User.id.in_(ids))
+    ).all()
+    found = {row.id: row for row in rows}
+    return jsonify({
+        "users": [(full if is_admin or user_id == current_user.id else public).one(found[user_id])
+                  for user_id in ids if user_id in found],
+        "missing": [user_id for user_id in ids if user_id not in found]
+    }), 200
+
 ##
 # Functions for token creation in API's and Web Forms.
 ##
 
 # API route for retrieving CSRF token
-@app.route('/api/v1/csrf-token', methods=['GET'])
+@api.route('/api/v1/csrf-token', methods=['GET'])
 def get_csrf():
     try:
         csrf_token = generate_csrf() 
@@ -372,50 +496,30 @@ def get_csrf():
         return jsonify({'error': str(e)}), 500
 
 
-# API route for generatiing JWT token
-def generate_reset_token(user_id):
-    """Generate a JWT token for password reset"""
-    try:
-        payload = {
-            'user_id': user_id,
-            'exp': datetime.utcnow() + timedelta(minutes=30),
-            'iat': datetime.utcnow(),
-            'purpose': 'password_reset'
-        }
-        return jwt.encode(
-            payload,
-            app.config['SECRET_KEY'],
-            algorithm='HS256'
-        )
-    except Exception as e:
-        app.logger.error(f"Token generation error: {str(e)}")
-        raise
-
 #
-@app.route('/api/v1/auth/refresh', methods=['POST'])
+@api.route('/api/v1/auth/refresh', methods=['POST'])
 def refresh_token():
     try:
-        refresh_token = request.json.get('refresh_token')
+        data = request.get_json(silent=True) or {}
+        refresh_token = data.get('refresh_token')
         if not refresh_token:
             return jsonify({"error": "Refresh token required"}), 400
         
-        payload = jwt.decode(
-            refresh_token,
-            app.config['SECRET_KEY'],
-            algorithms=["HS256"]
-        )
-        
-        new_token = generate_token(payload['sub'])
+        tokens = refresh_tokens(refresh_token)
         
         return jsonify({
-            "access_token": new_token,
+            "access_token": tokens['access_token'],
+            "refresh_token": tokens['refresh_token'],
+            "expires_in": tokens['expires_in'],
             "token_type": "Bearer"
         }), 200
         
     except jwt.ExpiredSignatureError:
         return jsonify({"error": "Refresh token expired"}), 401
-    except Exception as e:
-        return jsonify({"error": str(e)}), 400
+    except RefreshTokenReused:
+        return jsonify({"error": "Refresh token already used, please log in again"}), 401
+    except jwt.InvalidTokenError:
+        return jsonify({"error": "Invalid refresh token"}), 401
 
 
 ##
@@ -428,7 +532,7 @@ def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in current_app.config['ALLOWED_EXTENSIONS']
 
-@app.route('/api/v1/photos', methods=['POST'])
+@api.route('/api/v1/photos', methods=['POST'])
 @login_required
 def upload_photo():
     try:
@@ -439,35 +543,52 @@ def upload_photo():
         if file.filename == '':
             return jsonify({"error": "No selected file"}), 400
         
-        if not allowed_file(file.filename):
+        info = sniff_image(file.stream)
+        if not allowed_file(file.filename) or not info or info[0] not in SOURCE_FORMATS:
             allowed = ', '.join(current_app.config['ALLOWED_EXTENSIONS'])
             return jsonify({
                 "error": "Invalid file type",
                 "allowed_extensions": allowed
             }), 400
             
-        os.makedirs(current_app.config['UPLOAD_FOLDER'], exist_ok=True)
+        # Store by content hash and let the pipeline resize and strip it off-request
+        digest, size = image_pipeline.ingest(file.stream)
+        pil_format, width, height = info
         
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        ext = file.filename.rsplit('.', 1)[1].lower()
-        filename = secure_filename(f"user_{current_user.id}_{timestamp}.{ext}")
-        filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-        
-        file.save(filepath)
+        old_photo = current_user.profile_photo
+        current_user.profile_photo = digest
+        current_user.version = User.version + 1
+        db.session.add(Upload(
+            owner_id=current_user.id,
+            digest=digest,
+            size=size,
+            mime_type=mime_type(pil_format),
+            width=width,
+            height=height
+        ))
+        db.session.commit()
         
-        if current_user.profile_photo:
-            old_file = os.path.join(current_app.config['UPLOAD_FOLDER'], current_user.profile_photo)
-            if os.path.exists(old_file):
+        # Identical photos are shared, so drop only this user's uploads of the
+        # old photo, and its blobs only once no user or upload points at them
+        if old_photo and old_photo != digest and is_content_key(old_photo):
+            Upload.query.filter_by(owner_id=current_user.id, digest=old_photo).delete()
+            db.session.commit()
+            if not User.query.filter_by(profile_photo=old_photo).first() \
+                    and not Upload.query.filter_by(digest=old_photo).first():
+                image_pipeline.delete(old_photo)
+        elif old_photo and not is_content_key(old_photo):
+            old_file = os.path.join(current_app.config['UPLOAD_FOLDER'], secure_filename(old_photo))
+            try:
                 os.remove(old_file)
+            except FileNotFoundError:
+                pass
         
-        current_user.profile_photo = filename
-        db.session.commit()
-        
-        photo_url = url_for('get_photo', filename=filename, _external=True)
+        photo_url = url_for('.get_photo', filename=digest, _external=True)
         return jsonify({
             "message": "Photo uploaded successfully",
-            "filename": filename,
-            "url": photo_url
+            "filename": digest,
+            "url": photo_url,
+            "sizes": list(image_pipeline.sizes)
         }), 200
         
     except Exception as e:
@@ -478,69 +599,402 @@ def upload_photo():
         }), 500
         
 #
-@app.route('/api/v1/photos/<filename>', methods=['GET'])
+@api.route('/api/v1/photos/<filename>', methods=['GET'])
 def get_photo(filename):
     try:
         clean_filename = secure_filename(filename.split('?')[0].split('#')[0])
-        current_app.logger.info(f"Attempting to serve photo: {clean_filename}")
         
         if not clean_filename:
             current_app.logger.error("Empty filename received")
             abort(400, description="Invalid filename")
+        
+        size = image_pipeline.pick_size(request.args.get('size', current_app.config['PHOTO_DEFAULT_SIZE'], type=int))
+        fmt = request.args.get('format')
+        if fmt not in image_pipeline.formats:
+            fmt = 'webp' if 'webp' in image_pipeline.formats and 'image/webp' in request.headers.get('Accept', '') else image_pipeline.formats[-1]
+        
+        if not is_content_key(clean_filename):
+            return legacy_photo(clean_filename, size, fmt)
             
-        upload_folder = current_app.config['UPLOAD_FOLDER']
-        filepath = os.path.join(upload_folder, clean_filename)
-        current_app.logger.info(f"Looking for file at: {filepath}")
-        
-        if not os.path.exists(filepath):
-            current_app.logger.error(f"File not found at: {filepath}")
-            current_app.logger.info(f"Upload folder contents: {os.listdir(upload_folder)}")
-            abort(404, description="File not found")
-            
-        current_app.logger.info(f"Serving file: {filepath}")
-        return send_from_directory(
-            upload_folder,
-            clean_filename,
-            conditional=True
-        )
+        # Content never changes under a key, so a matching ETag needs no disk access
+        key = variant_key(clean_filename, size, fmt)
+        max_age = current_app.config['PHOTO_CACHE_MAX_AGE']
+        etag = f"{clean_filename}-{size}-{fmt}"
+        if request.if_none_match.contains(etag):
+            response = current_app.response_class(status=304)
+        else:
+            try:
+                response = image_pipeline.store.send(key, VARIANT_FORMATS[fmt][1], max_age)
+            except FileNotFoundError:
+                # The background job for a fresh upload hasn't landed yet
+                if not image_pipeline.ensure(clean_filename):
+                    abort(404, description="File not found")
+                response = image_pipeline.store.send(key, VARIANT_FORMATS[fmt][1], max_age)
+        
+        response.set_etag(etag)
+        response.cache_control.public = True
+        response.cache_control.max_age = max_age
+        response.cache_control.immutable = True
+        response.vary.add('Accept')
+        return response
+    except HTTPException:
+        raise
     except Exception as e:
         current_app.logger.error(f"Error serving {filename}: {str(e)}", exc_info=True)
         abort(500, description="Error serving file")
 
 
+# Move a pre-content-addressing upload into the store and redirect to it
+def legacy_photo(filename, size, fmt):
+    legacy_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
+    if not os.path.isfile(legacy_path):
+        abort(404, description="File not found")
+        
+    try:
+        with open(legacy_path, 'rb') as f:
+            digest, _ = image_pipeline.ingest(f)
+    except FileNotFoundError:
+        # A concurrent request moved it first
+        abort(404, description="File not found")
+    image_pipeline.ensure(digest)
+    
+    # Bump the version too, so conditional GETs of these users see the new photo
+    User.query.filter_by(profile_photo=filename).update({'profile_photo': digest, 'version': User.version + 1})
+    db.session.commit()
+    try:
+        os.remove(legacy_path)
+    except FileNotFoundError:
+        pass
+    
+    return redirect(url_for('.get_photo', filename=digest, size=size, format=fmt), code=301)
+
+
+##
+# Catalog of services, rentals and parts.
+##
+
+# Paged listing served from the per-process catalog cache
+def catalog_page_args():
+    limit = request.args.get('limit', current_app.config['CATALOG_PAGE_SIZE'], type=int)
+    limit = max(1, min(limit, current_app.config['CATALOG_MAX_PAGE_SIZE']))
+    return request.args.get('cursor', type=int), limit
+
+def catalog_etag(kind):
+    # The version alone decides freshness, so revalidation never serializes anything
+    cursor, limit = catalog_page_args()
+    return f"{kind}-{catalog_cache.version()}-{cursor}-{limit}"
+
+@api.route('/api/v1/<any(services, rentals, parts):kind>', methods=['GET'])
+@compressed
+@conditional(catalog_etag, public=True)
+def list_catalog(kind):
+    cursor, limit = catalog_page_args()
+    return current_app.response_class(catalog_cache.page(kind, cursor, limit), mimetype='application/json')
+
+# The editable fields of a catalog item, validated and converted to column types
+def catalog_fields(data, partial=False):
+    try:
+        return catalog_item_input_schema.load(data if isinstance(data, dict) else {}, partial=partial)
+    except ValidationError as e:
+        abort(make_response(jsonify({"error": "Invalid catalog item", "details": e.messages}), 400))
+
+@api.route('/api/v1/admin/catalog', methods=['POST'])
+@admin_required
+def create_catalog_item():
+    fields = catalog_fields(request.get_json() or {})
+    if not fields.get('title'):
+        return jsonify({"error": "kind and title are required"}), 400
+    
+    item = CatalogItem(**fields)
+    db.session.add(item)
+    db.session.commit()
+    return jsonify(serialize_item(item)), 201
+
+@api.route('/api/v1/admin/catalog/<int:item_id>', methods=['PATCH', 'DELETE'])
+@admin_required
+def update_catalog_item(item_id):
+    item = db.session.get(CatalogItem, item_id)
+    if item is None:
+        return jsonify({"error": "Catalog item not found"}), 404
+    
+    if request.method == 'DELETE':
+        db.session.delete(item)
+        db.session.commit()
+        return '', 204
+    
+    for field, value in catalog_fields(request.get_json() or {}, partial=True).items():
+        setattr(item, field, value)
+    db.session.commit()
+    return jsonify(serialize_item(item)), 200
+
+# Prefix and typo-tolerant search across the catalog, from the in-memory index
+@api.route('/api/v1/search', methods=['GET'])
+@compressed
+def search_catalog():
+    query = request.args.get('q', '').strip()
+    limit = request.args.get('limit', current_app.config['SEARCH_DEFAULT_LIMIT'], type=int)
+    limit = max(1, min(limit, current_app.config['SEARCH_MAX_LIMIT']))
+    
+    kinds = None
+    if request.args.get('kind'):
+        kinds = set(request.args['kind'].split(','))
+        if not kinds <= set(CatalogItem.KINDS):
+            return jsonify({"error": f"kind must be one of {', '.join(CatalogItem.KINDS)}"}), 400
+    
+    results = catalog_search.search(query, kinds, limit)
+    return jsonify({
+        "query": query,
+        "results": [dict(item, score=round(score, 3)) for score, item in results]
+    }), 200
+
+
+##
+# Workshop discovery.
+##
+
+# The k nearest workshops to a point, from the in-memory spatial index
+@api.route('/api/v1/workshops/nearby', methods=['GET'])
+@compressed
+def nearby_workshops():
+    lat = request.args.get('lat', type=float)
+    lon = request.args.get('lon', type=float)
+    if lat is None or lon is None or not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return jsonify({"error": "lat and lon are required, in degrees"}), 400
+    
+    k = request.args.get('k', current_app.config['WORKSHOP_DEFAULT_RESULTS'], type=int)
+    k = max(1, min(k, current_app.config['WORKSHOP_MAX_RESULTS']))
+    radius_km = request.args.get('radius_km', current_app.config['WORKSHOP_DEFAULT_RADIUS_KM'], type=float)
+    radius_km = max(0.0, min(radius_km, current_app.config['WORKSHOP_MAX_RADIUS_KM']))
+    open_only = request.args.get('open', 'true').lower() != 'false'
+    
+    results = workshop_directory.nearby(lat, lon, k, radius_km, request.args.get('service'), open_only)
+    return jsonify({
+        "workshops": [
+            dict(workshop, distance_km=round(distance, 3), open_now=is_open(workshop))
+            for distance, workshop in results
+        ]
+    }), 200
+
+def workshop_fields(data):
+    fields = {k: v for k, v in data.items() if k in WORKSHOP_FIELDS}
+    try:
+        if 'latitude' in fields and not -90 <= float(fields['latitude']) <= 90:
+            abort(400, description="latitude must be between -90 and 90")
+        if 'longitude' in fields and not -180 <= float(fields['longitude']) <= 180:
+            abort(400, description="longitude must be between -180 and 180")
+        for field in ('opens_at', 'closes_at'):
+            if fields.get(field) is not None:
+                fields[field] = datetime.strptime(fields[field], '%H:%M').time()
+        if 'timezone' in fields:
+            ZoneInfo(fields['timezone'])
+    except (TypeError, ValueError, ZoneInfoNotFoundError) as e:
+        abort(400, description=f"Invalid workshop field: {e}")
+    if isinstance(fields.get('services'), list):
+        fields['services'] = ','.join(fields['services'])
+    return fields
+
+@api.route('/api/v1/admin/workshops', methods=['POST'])
+@admin_required
+def create_workshop():
+    fields = workshop_fields(request.get_json() or {})
+    if not fields.get('name') or fields.get('latitude') is None or fields.get('longitude') is None:
+        return jsonify({"error": "name, latitude and longitude are required"}), 400
+    
+    workshop = Workshop(**fields)
+    db.session.add(workshop)
+    db.session.commit()
+    return jsonify(serialize_workshop(workshop)), 201
+
+@api.route('/api/v1/admin/workshops/<int:workshop_id>', methods=['PATCH', 'DELETE'])
+@admin_required
+def update_workshop(workshop_id):
+    workshop = db.session.get(Workshop, workshop_id)
+    if workshop is None:
+        return jsonify({"error": "Workshop not found"}), 404
+    
+    if request.method == 'DELETE':
+        db.session.delete(workshop)
+        db.session.commit()
+        return '', 204
+    
+    for field, value in workshop_fields(request.get_json() or {}).items():
+        setattr(workshop, field, value)
+    db.session.commit()
+    return jsonify(serialize_workshop(workshop)), 200
+
+
+##
+# Bookings.
+##
+
+# Upcoming slots of a workshop, with the places left in each
+@api.route('/api/v1/workshops/<int:workshop_id>/slots', methods=['GET'])
+@compressed
+def workshop_slots(workshop_id):
+    try:
+        since = datetime.fromisoformat(request.args['from']) if request.args.get('from') else datetime.utcnow()
+    except ValueError as e:
+        return jsonify({"error": "Invalid from", "details": str(e)}), 400
+    days = max(1, min(request.args.get('days', 7, type=int), 31))
+    
+    slots = db.session.scalars(slots_query(workshop_id, since, days)).all()
+    return jsonify({"slots": booking_slot_schema.many(slots)}), 200
+
+BOOKING_ERRORS = {
+    'not_found': ("Slot not found", 404),
+    'started': ("Slot has already started", 410),
+    'full': ("This slot is fully booked", 409),
+}
+
+# Hold a place in a slot until it is confirmed or the hold lapses
+@api.route('/api/v1/bookings', methods=['POST'])
+@login_required
+def create_booking():
+    data = request.get_json() or {}
+    if not isinstance(data.get('slot_id'), int):
+        return jsonify({"error": "slot_id is required"}), 400
+    
+    booking, result = reserve(data['slot_id'], current_user.id, data.get('service'))
+    if booking is None:
+        error, status = BOOKING_ERRORS[result]
+        return jsonify({"error": error}), status
+    return jsonify(booking_schema.one(booking)), 201
+
+@api.route('/api/v1/bookings/<int:booking_id>/confirm', methods=['POST'])
+@login_required
+def confirm_booking(booking_id):
+    if not confirm(booking_id, current_user.id):
+        return jsonify({"error": "No active hold for this booking; it may have expired"}), 409
+    return jsonify(booking_schema.one(db.session.get(Booking, booking_id))), 200
+
+@api.route('/api/v1/bookings/<int:booking_id>', methods=['DELETE'])
+@login_required
+def cancel_booking(booking_id):
+    if not cancel(booking_id, current_user.id):
+        return jsonify({"error": "Booking not found"}), 404
+    return '', 204
+
+def booking_history_page(user_id):
+    limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+    compact = request.args.get('view') == 'compact'
+    try:
+        rows, next_cursor = history(user_id, request.args.get('cursor'), limit, compact=compact)
+    except ValueError:
+        return jsonify({"error": "Invalid cursor"}), 400
+    schema = compact_booking_history_schema if compact else booking_history_schema
+    return jsonify({
+        "bookings": schema.many(rows),
+        "next_cursor": next_cursor
+    }), 200
+
+# The user's bookings, newest first; pass the previous page's next_cursor to
+# continue, and view=compact for just the fields a list needs
+@api.route('/api/v1/bookings', methods=['GET'])
+@login_required
+@compressed
+def list_bookings():
+    return booking_history_page(current_user.id)
+
+@api.route('/api/v1/users/<int:user_id>/history', methods=['GET'])
+@login_required
+@compressed
+def user_history(user_id):
+    if current_user.id != user_id:
+        return jsonify({"error": "Unauthorized access"}), 403
+    return booking_history_page(user_id)
+
+@api.route('/api/v1/admin/workshops/<int:workshop_id>/slots', methods=['POST'])
+@admin_required
+def create_slots(workshop_id):
+    if db.session.get(Workshop, workshop_id) is None:
+        return jsonify({"error": "Workshop not found"}), 404
+    
+    try:
+        slots = [BookingSlot(
+            workshop_id=workshop_id,
+            starts_at=datetime.fromisoformat(entry['starts_at']),
+            ends_at=datetime.fromisoformat(entry['ends_at']),
+            capacity=int(entry['capacity']),
+            reserved=0
+        ) for entry in (request.get_json() or {}).get('slots', [])]
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({"error": "Invalid slot", "details": str(e)}), 400
+    
+    db.session.add_all(slots)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({"error": "A slot already starts at that time, or a capacity is negative"}), 409
+    return jsonify({"slots": booking_slot_schema.many(slots)}), 201
+
+
 ##
 # Functions for error, and request handling.
 ##
 
 # Debug function for config.py
-@app.route('/debug/config')
+@api.route('/debug/config')
 def debug_config():
     return jsonify({
         "UPLOAD_FOLDER": current_app.config['UPLOAD_FOLDER'],
         "ALLOWED_EXTENSIONS": list(current_app.config['ALLOWED_EXTENSIONS'])
     })
 
-# Debug function for file uploads
-@app.route('/debug/uploads')
-def debug_uploads():
-    uploads_dir = current_app.config['UPLOAD_FOLDER']
-    if not os.path.exists(uploads_dir):
-        return jsonify({"error": f"Upload directory {uploads_dir} does not exist"}), 500
-    
-    files = []
-    for f in os.listdir(uploads_dir):
-        filepath = os.path.join(uploads_dir, f)
-        files.append({
-            "name": f,
-            "size": os.path.getsize(filepath),
-            "modified": datetime.fromtimestamp(os.path.getmtime(filepath)).isoformat()
-        })
-    
+# Admin listing of uploaded photos, served from the uploads index
+@api.route('/api/v1/admin/uploads')
+@admin_required
+def list_uploads():
+    try:
+        limit = min(request.args.get('limit', 50, type=int), 500)
+        query = Upload.query
+        
+        owner_id = request.args.get('owner_id', type=int)
+        if owner_id is not None:
+            query = query.filter(Upload.owner_id == owner_id)
+        if request.args.get('mime_type'):
+            query = query.filter(Upload.mime_type == request.args['mime_type'])
+        if request.args.get('since'):
+            query = query.filter(Upload.created_at >= datetime.fromisoformat(request.args['since']))
+        if request.args.get('until'):
+            query = query.filter(Upload.created_at < datetime.fromisoformat(request.args['until']))
+        
+        # Newest first; the cursor is the last id of the previous page
+        cursor = request.args.get('cursor', type=int)
+        if cursor is not None:
+            query = query.filter(Upload.id < cursor)
+        uploads = query.order_by(Upload.id.desc()).limit(limit + 1).all()
+        
+        has_more = len(uploads) > limit
+        uploads = uploads[:limit]
+        
+        return jsonify({
+            "uploads": [{
+                "id": u.id,
+                "owner_id": u.owner_id,
+                "digest": u.digest,
+                "size": u.size,
+                "mime_type": u.mime_type,
+                "width": u.width,
+                "height": u.height,
+                "created_at": u.created_at.isoformat(),
+                "url": url_for('.get_photo', filename=u.digest, _external=True)
+            } for u in uploads],
+            "next_cursor": uploads[-1].id if has_more else None
+        }), 200
+        
+    except ValueError as e:
+        return jsonify({"error": "Invalid filter", "details": str(e)}), 400
+
+# Connection pool diagnostics for this worker
+@api.route('/api/v1/admin/db-pool')
+@admin_required
+def db_pool_status():
     return jsonify({
-        "upload_folder": uploads_dir,
-        "files": files,
-        "absolute_path": os.path.abspath(uploads_dir)
-    })
+        "pid": os.getpid(),
+        "gevent_mode": current_app.config['GEVENT_MODE'],
+        "pool": pool_status(db.engine)
+    }), 200
 
 # Error function for form.
 def form_errors(form):
@@ -555,13 +1009,33 @@ def form_errors(form):
     return error_messages
 
 
+# Handle 400 Bad Request errors
+@api.app_errorhandler(400)
+def bad_request(error):
+    return jsonify({'error': error.description}), 400
+
 # Handle 404 Not Found errors
-@app.errorhandler(404)
+@api.app_errorhandler(404)
 def page_not_found(error):
     return jsonify({'error': 'Not found'}), 404
 
 
+# Handle a saturated password hashing pool
+@api.app_errorhandler(HashingOverloaded)
+def hashing_overloaded(error):
+    response = jsonify({'error': 'Server is busy, please try again shortly'})
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, 503
+
+
+@api.app_errorhandler(RateLimitExceeded)
+def rate_limit_exceeded(error):
+    response = jsonify({'error': 'Too many requests, please try again later'})
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, 429
+
+
 # Handle 500 Internal Server Error
-@app.errorhandler(500)
+@api.app_errorhandler(500)
 def internal_server_error(error):
     return jsonify({'error': 'Internal server error'}), 500
\ No newline at end of file
@@ -0,0 +1,34 @@
+import os
+import threading
+
+from concurrent.futures import ProcessPoolExecutor
+
+
+class LazyProcessPool(object):
+    """A ProcessPoolExecutor created on first use and once per process.
+
+    gunicorn workers forked from a preloaded master must not inherit the
+    master's pool, so the executor is rebuilt whenever the pid changes.
+    """
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        if self._executor is None or self._pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._pid != os.getpid():
+                    self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+                    self._pid = os.getpid()
+        return self._executor
+
+    def submit(self, fn, *args, **kwargs):
+        return self._get_executor().submit(fn, *args, **kwargs)
+
+    def shutdown(self):
+        if self._executor is not None and self._pid == os.getpid():
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
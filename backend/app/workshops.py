@@ -0,0 +1,248 @@
+import heapq
+import math
+import threading
+import time
+
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import Workshop
+from app.schemas import workshop_schema
+
+EARTH_RADIUS_KM = 6371.0088
+
+EDITABLE_FIELDS = (
+    'name', 'address', 'phone', 'latitude', 'longitude', 'services', 'opens_at', 'closes_at',
+    'timezone', 'active', 'rating'
+)
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+serialize_workshop = workshop_schema.one
+
+
+def is_open(workshop, now=None):
+    """Whether a serialized workshop is open at now (UTC), allowing overnight hours"""
+    if not workshop['active']:
+        return False
+    if workshop['opens_at'] is None or workshop['closes_at'] is None:
+        return True
+    now = (now or datetime.now(timezone.utc)).astimezone(ZoneInfo(workshop['timezone']))
+    local = now.strftime('%H:%M')
+    if workshop['opens_at'] <= workshop['closes_at']:
+        return workshop['opens_at'] <= local < workshop['closes_at']
+    return local >= workshop['opens_at'] or local < workshop['closes_at']
+
+
+class GridIndex(object):
+    """Points bucketed into fixed-size latitude/longitude cells.
+
+    k-nearest queries walk rings of cells outwards from the query point and
+    stop once no unvisited cell can be closer than the k-th hit (or the
+    radius), so their cost depends on how crowded the neighbourhood is rather
+    than on how many points there are in total.
+    """
+
+    def __init__(self, cell_degrees):
+        self.cell_degrees = cell_degrees
+        self.lat_cells = math.ceil(180 / cell_degrees)
+        self.lon_cells = math.ceil(360 / cell_degrees)
+        self.points = {}
+        self.cells = defaultdict(dict)
+
+    def __len__(self):
+        return len(self.points)
+
+    def cell(self, lat, lon):
+        row = min(int((lat + 90) / self.cell_degrees), self.lat_cells - 1)
+        col = int((lon + 180) / self.cell_degrees) % self.lon_cells
+        return row, col
+
+    def add(self, point_id, lat, lon, payload):
+        self.remove(point_id)
+        cell = self.cell(lat, lon)
+        self.cells[cell][point_id] = (lat, lon, payload)
+        self.points[point_id] = cell
+
+    def remove(self, point_id):
+        cell = self.points.pop(point_id, None)
+        if cell is None:
+            return
+        del self.cells[cell][point_id]
+        if not self.cells[cell]:
+            del self.cells[cell]
+
+    def _ring(self, row, col, r):
+        if r == 0:
+            yield row, col
+            return
+        for dc in range(-r, r + 1):
+            yield row - r, col + dc
+            yield row + r, col + dc
+        for dr in range(-r + 1, r):
+            yield row + dr, col - r
+            yield row + dr, col + r
+
+    def _ring_distance(self, lat, r):
+        """A lower bound on the distance to any point in ring r"""
+        if r <= 1:
+            return 0.0
+        gap = math.radians((r - 1) * self.cell_degrees)
+        # Longitude cells narrow towards the poles, so use the widest latitude reached
+        widest = min(90.0, abs(lat) + (r + 1) * self.cell_degrees)
+        across = 2 * math.asin(min(1.0, math.cos(math.radians(widest)) * math.sin(min(gap, math.pi) / 2)))
+        return EARTH_RADIUS_KM * min(gap, across)
+
+    def nearest(self, lat, lon, k, radius_km, accept=None):
+        """Up to k (distance_km, payload) within radius_km, nearest first"""
+        row, col = self.cell(lat, lon)
+        heap = []  # max-heap on distance, as (-distance, id, payload)
+        max_rings = max(self.lat_cells, self.lon_cells // 2 + 1)
+        for r in range(max_rings):
+            bound = self._ring_distance(lat, r)
+            if bound > radius_km or (len(heap) == k and bound > -heap[0][0]):
+                break
+            seen = set()
+            for cell_row, cell_col in self._ring(row, col, r):
+                if not 0 <= cell_row < self.lat_cells:
+                    continue
+                cell = (cell_row, cell_col % self.lon_cells)
+                # Near the poles or across the whole globe a ring can wrap onto itself
+                if cell in seen:
+                    continue
+                seen.add(cell)
+                for point_id, (plat, plon, payload) in self.cells.get(cell, {}).items():
+                    distance = haversine_km(lat, lon, plat, plon)
+                    if distance > radius_km or (len(heap) == k and distance >= -heap[0][0]):
+                        continue
+                    if accept is not None and not accept(payload):
+                        continue
+                    if len(heap) == k:
+                        heapq.heapreplace(heap, (-distance, point_id, payload))
+                    else:
+                        heapq.heappush(heap, (-distance, point_id, payload))
+        return [(-d, payload) for d, _, payload in sorted(heap, reverse=True)]
+
+
+class WorkshopDirectory(object):
+    """The workshop spatial index, kept in step with the workshops table.
+
+    Built on first use (or by warm() when a worker starts). Commits made by
+    this process are applied as they happen; every WORKSHOP_SYNC_INTERVAL
+    seconds the index also re-reads rows updated since its last sync, and
+    drops deleted ids whenever the row count disagrees with the index.
+    """
+
+    def __init__(self, app=None):
+        self._lock = threading.RLock()
+        self.index = None
+        self._synced_at = 0.0
+        self._watermark = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.cell_degrees = app.config['WORKSHOP_GRID_DEGREES']
+        self.sync_interval = app.config['WORKSHOP_SYNC_INTERVAL']
+        self.sync_overlap = timedelta(seconds=app.config['INDEX_SYNC_OVERLAP'])
+        app.extensions['workshop_directory'] = self
+
+    def _add(self, workshop):
+        self.index.add(workshop['id'], workshop['latitude'], workshop['longitude'], workshop)
+
+    def apply(self, upserted, deleted):
+        with self._lock:
+            if self.index is None:
+                return
+            for workshop_id in deleted:
+                self.index.remove(workshop_id)
+            for workshop in upserted.values():
+                self._add(workshop)
+
+    def warm(self):
+        with self._lock:
+            self._refresh()
+
+    def _refresh(self):
+        if self.index is not None and time.monotonic() - self._synced_at < self.sync_interval:
+            return
+        if self.index is None:
+            started = time.monotonic()
+            self.index = GridIndex(self.cell_degrees)
+            self._sync(Workshop.query)
+            current_app.logger.info(
+                f"Built workshop index: {len(self.index)} workshops in {time.monotonic() - started:.2f}s"
+            )
+        else:
+            query = Workshop.query
+            if self._watermark is not None:
+                # Allow for clock skew between the app servers stamping updated_at
+                query = query.filter(Workshop.updated_at >= self._watermark - self.sync_overlap)
+            self._sync(query)
+            if db.session.query(db.func.count(Workshop.id)).scalar() != len(self.index):
+                existing = set(db.session.scalars(db.select(Workshop.id)))
+                for workshop_id in set(self.index.points) - existing:
+                    self.index.remove(workshop_id)
+        self._synced_at = time.monotonic()
+
+    def _sync(self, query):
+        for workshop in query.yield_per(1000):
+            self._add(serialize_workshop(workshop))
+            if self._watermark is None or workshop.updated_at > self._watermark:
+                self._watermark = workshop.updated_at
+
+    def nearby(self, lat, lon, k, radius_km, service=None, open_only=True):
+        now = datetime.now(timezone.utc)
+
+        def accept(workshop):
+            if service is not None and service not in workshop['services']:
+                return False
+            return is_open(workshop, now) if open_only else workshop['active']
+
+        with self._lock:
+            self._refresh()
+            return self.index.nearest(lat, lon, k, radius_km, accept)
+
+
+##
+# Applying this process's commits to the index
+##
+
+@event.listens_for(Session, 'after_flush')
+def _record_workshop_changes(session, flush_context):
+    upserted = {o.id: o for o in session.new | session.dirty if isinstance(o, Workshop)}
+    deleted = {o.id for o in session.deleted if isinstance(o, Workshop)}
+    if not upserted and not deleted:
+        return
+
+    changes = session.info.setdefault('workshop_changes', {'upserted': {}, 'deleted': set()})
+    for workshop_id, workshop in upserted.items():
+        changes['upserted'][workshop_id] = serialize_workshop(workshop)
+    for workshop_id in deleted:
+        changes['upserted'].pop(workshop_id, None)
+    changes['deleted'] |= deleted
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_workshop_changes(session):
+    changes = session.info.pop('workshop_changes', None)
+    if not changes or not has_app_context():
+        return
+    directory = current_app.extensions.get('workshop_directory')
+    if directory is not None:
+        directory.apply(**changes)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_workshop_changes(session):
+    session.info.pop('workshop_changes', None)
@@ -0,0 +1,5 @@
+# ASGI serving: uvicorn asgi:application, or
+# gunicorn -c gunicorn.asgi.conf.py asgi:application
+from app.asgi import create_asgi_app
+
+application = create_asgi_app()
@@ -0,0 +1,127 @@
+"""
+The read endpoints under gunicorn+gevent against the ASGI mode (asgi.py).
+
+Seeds --users users, each with --bookings bookings across one workshop's
+slots, then for each server in turn drives booking history, workshop slots
+and the profile endpoint (which goes through the WSGI bridge in ASGI mode)
+for --duration seconds from --concurrency client threads. Both servers run
+--workers processes against the same throwaway SQLite database (or
+--database-url). Results are saved as JSON (see compare.py).
+
+    python benchmarks/asgi_vs_gevent.py
+    python benchmarks/asgi_vs_gevent.py --concurrency 200 --database-url postgresql://localhost/roadside_bench
+"""
+
+import argparse
+import tempfile
+
+from datetime import datetime, timedelta
+
+import jwt
+
+from common import bench_env, print_table, run_script, save_results, start_server, stop_server, summarize
+from load import drive
+
+SEED = """
+from datetime import datetime, timedelta
+from app import app, db
+from app.models import User, Workshop, BookingSlot, Booking
+with app.app_context():
+    db.create_all()
+    db.session.execute(User.__table__.insert(), [
+        dict(id=i, username=f'reader{i}', email=f'reader{i}@example.com', password='x', joined_on=datetime.utcnow())
+        for i in range(1, %(users)d + 1)
+    ])
+    workshop = Workshop(name='Benchmark Workshop', latitude=0.0, longitude=0.0)
+    db.session.add(workshop)
+    db.session.flush()
+    start = datetime.utcnow().replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+    db.session.execute(BookingSlot.__table__.insert(), [
+        dict(workshop_id=workshop.id, starts_at=start + timedelta(hours=h), ends_at=start + timedelta(hours=h + 1),
+             capacity=10000, reserved=0)
+        for h in range(7 * 24)
+    ])
+    now = datetime.utcnow()
+    db.session.execute(Booking.__table__.insert(), [
+        dict(user_id=u, slot_id=b %% (7 * 24) + 1, service='Oil change', status='confirmed',
+             created_at=now - timedelta(minutes=b), confirmed_at=now)
+        for u in range(1, %(users)d + 1) for b in range(%(bookings)d)
+    ])
+    db.session.commit()
+"""
+
+SERVERS = ('gevent', 'asgi')
+
+
+class Scenarios(object):
+    def __init__(self, url, users, secret):
+        self.url = url
+        self.users = users
+        expires = datetime.utcnow() + timedelta(hours=2)
+        self.tokens = {i: jwt.encode({'user_id': i, 'exp': expires}, secret, algorithm='HS256')
+                       for i in range(1, users + 1)}
+
+    def auth(self, i):
+        user_id = i % self.users + 1
+        return user_id, {'Authorization': 'Bearer ' + self.tokens[user_id]}
+
+    def history(self, session, i):
+        user_id, headers = self.auth(i)
+        r = session.get(self.url + '/api/v1/users/%d/history' % user_id, headers=headers)
+        return r.status_code == 200
+
+    def slots(self, session, i):
+        r = session.get(self.url + '/api/v1/workshops/1/slots', params={'days': 1 + i % 7})
+        return r.status_code == 200
+
+    def user_profile(self, session, i):
+        user_id, headers = self.auth(i)
+        r = session.get(self.url + '/api/v1/users/%d' % user_id, headers=headers)
+        return r.status_code == 200
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--servers', nargs='+', choices=SERVERS, default=list(SERVERS))
+    parser.add_argument('--users', type=int, default=500, help='seeded users')
+    parser.add_argument('--bookings', type=int, default=40, help='bookings per user')
+    parser.add_argument('--concurrency', type=int, default=100, help='client threads')
+    parser.add_argument('--duration', type=float, default=10, help='seconds per scenario')
+    parser.add_argument('--warmup', type=float, default=2, help='seconds per scenario not recorded')
+    parser.add_argument('--workers', type=int, default=1, help='server worker processes')
+    parser.add_argument('--database-url', default=None, help='a scratch database; defaults to a throwaway SQLite file')
+    parser.add_argument('--port', type=int, default=5098)
+    parser.add_argument('--timeout', type=float, default=60, help='per-request client timeout in seconds')
+    parser.add_argument('--output', default=None,
+                        help='results JSON; defaults to benchmarks/results/asgi_vs_gevent-<rev>.json')
+    args = parser.parse_args()
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        env = bench_env(tmp, args.database_url)
+        run_script(SEED % {'users': args.users, 'bookings': args.bookings}, env)
+        for server in args.servers:
+            proc, url = start_server(env, args.port, args.workers, server=server)
+            try:
+                scenarios = Scenarios(url, args.users, env['SECRET_KEY'])
+                for name in ('history', 'slots', 'user_profile'):
+                    fn = getattr(scenarios, name)
+                    if args.warmup:
+                        drive(fn, args.concurrency, args.warmup, args.timeout)
+                    latencies, errors, elapsed = drive(fn, args.concurrency, args.duration, args.timeout)
+                    rows.append(summarize('%s %s' % (server, name), latencies, elapsed, errors))
+                    print_table(rows[-1:])
+            finally:
+                stop_server(proc)
+
+    print()
+    print_table(rows)
+    print('saved', save_results(
+        'asgi_vs_gevent', rows, args.output,
+        database=env['DATABASE_URL'].split(':', 1)[0], users=args.users, bookings=args.bookings,
+        concurrency=args.concurrency, duration=args.duration, workers=args.workers
+    ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""
+Booking throughput and correctness with many bookers racing for few slots.
+
+Starts gunicorn against a throwaway SQLite database (or --database-url),
+seeds one workshop with --slots slots of --capacity places, then has
+--bookers concurrent users each try to hold and confirm a place in a random
+slot. Reports attempts/s and bookings/s, and exits non-zero if any slot ended
+up with more live bookings than places or with a reserved count that
+disagrees with its bookings.
+
+    python benchmarks/booking_contention.py --bookers 500 --slots 5 --capacity 10
+"""
+
+import argparse
+import json
+import random
+import sys
+import tempfile
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import jwt
+import requests
+
+from common import bench_env, run_script, start_server, stop_server
+
+SEED = """
+from datetime import datetime, timedelta
+from app import app, db
+from app.models import User, Workshop, BookingSlot
+with app.app_context():
+    db.create_all()
+    db.session.execute(User.__table__.insert(), [
+        dict(id=i, username=f'booker{i}', email=f'booker{i}@example.com', password='x')
+        for i in range(1, %(bookers)d + 1)
+    ])
+    workshop = Workshop(name='Benchmark Workshop', latitude=0.0, longitude=0.0)
+    db.session.add(workshop)
+    db.session.flush()
+    start = datetime.utcnow().replace(minute=0, second=0, microsecond=0) + timedelta(days=1)
+    db.session.add_all([
+        BookingSlot(workshop_id=workshop.id, starts_at=start + timedelta(hours=h),
+                    ends_at=start + timedelta(hours=h + 1), capacity=%(capacity)d, reserved=0)
+        for h in range(%(slots)d)
+    ])
+    db.session.commit()
+"""
+
+VERIFY = """
+import json
+from sqlalchemy import func
+from app import app, db
+from app.models import Booking, BookingSlot
+with app.app_context():
+    live = dict(
+        db.session.query(Booking.slot_id, func.count(Booking.id))
+        .filter(Booking.status.in_(('held', 'confirmed'))).group_by(Booking.slot_id).all()
+    )
+    print(json.dumps([
+        dict(id=slot.id, capacity=slot.capacity, reserved=slot.reserved, live=live.get(slot.id, 0))
+        for slot in BookingSlot.query.order_by(BookingSlot.id)
+    ]))
+"""
+
+
+def book(url, token, slot_id, timeout):
+    """Hold then confirm; returns the outcome"""
+    headers = {'Authorization': 'Bearer ' + token}
+    try:
+        r = requests.post(url + '/api/v1/bookings', json={'slot_id': slot_id}, headers=headers, timeout=timeout)
+        if r.status_code == 409:
+            return 'full'
+        if r.status_code != 201:
+            return 'error'
+        r = requests.post(url + '/api/v1/bookings/%d/confirm' % r.json()['id'], headers=headers, timeout=timeout)
+        return 'booked' if r.status_code == 200 else 'error'
+    except requests.RequestException:
+        return 'error'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--bookers', type=int, default=500)
+    parser.add_argument('--slots', type=int, default=5)
+    parser.add_argument('--capacity', type=int, default=10)
+    parser.add_argument('--concurrency', type=int, default=100, help='requests in flight at once')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn worker processes')
+    parser.add_argument('--database-url', default=None, help='defaults to a throwaway SQLite file')
+    parser.add_argument('--port', type=int, default=5098)
+    parser.add_argument('--timeout', type=float, default=60)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = bench_env(tmp, args.database_url, HASH_WORKERS=0)
+        run_script(SEED % vars(args), env)
+
+        # Mint tokens directly rather than paying for a password hash per user
+        expires = datetime.utcnow() + timedelta(hours=1)
+        tokens = [jwt.encode({'user_id': i, 'exp': expires}, env['SECRET_KEY'], algorithm='HS256')
+                  for i in range(1, args.bookers + 1)]
+        rng = random.Random(1)
+        slot_ids = [rng.randint(1, args.slots) for _ in tokens]
+
+        proc, url = start_server(env, args.port, args.workers)
+        try:
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+                outcomes = list(pool.map(lambda a: book(url, *a, args.timeout), zip(tokens, slot_ids)))
+            elapsed = time.perf_counter() - start
+        finally:
+            stop_server(proc)
+
+        slots = json.loads(run_script(VERIFY, env))
+
+    booked = outcomes.count('booked')
+    print('bookers=%d slots=%d capacity=%d workers=%d' % (args.bookers, args.slots, args.capacity, args.workers))
+    print('booked=%d full=%d errors=%d in %.2fs' % (booked, outcomes.count('full'), outcomes.count('error'), elapsed))
+    print('attempts/s=%.1f bookings/s=%.1f' % (len(outcomes) / elapsed, booked / elapsed))
+
+    overbooked = [s for s in slots if s['live'] > s['capacity'] or s['live'] != s['reserved']]
+    for slot in slots:
+        print('slot %(id)d: capacity=%(capacity)d reserved=%(reserved)d live=%(live)d' % slot)
+    if overbooked or booked > args.slots * args.capacity:
+        print('OVERBOOKED: %r' % overbooked)
+        sys.exit(1)
+    print('no overbooking')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+How long a fresh process takes to import the app, build it and answer its first request.
+
+Each run is a new interpreter against a throwaway SQLite database (or
+--database-url). It times 'import app', create_app() and the first and
+second profile requests through the test client, and reports percentiles
+over --runs runs. The first request carries every cost left for first use:
+the first connection, the in-memory indexes and the lazy imports. So each
+run is done cold, and again with warm_up() before the first request, which
+is what gunicorn.conf.py does for every worker. Results are saved as JSON
+(see compare.py).
+
+    python benchmarks/boot_latency.py --runs 20
+"""
+
+import argparse
+import json
+import tempfile
+
+from common import bench_env, print_table, run_script, save_results, summarize
+
+SEED = """
+from app import app, db
+from app.models import User
+with app.app_context():
+    db.create_all()
+    db.session.add(User('boot', 'boot-password', 'boot@example.com'))
+    db.session.commit()
+"""
+
+RUN = """
+import json, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+from app import create_app, warm_up
+flask_app = create_app()
+created = time.perf_counter()
+if %(warm)r:
+    warm_up(flask_app)
+warmed = time.perf_counter()
+
+import jwt
+from datetime import datetime, timedelta
+token = jwt.encode({'user_id': 1, 'exp': datetime.utcnow() + timedelta(hours=1)},
+                   flask_app.config['SECRET_KEY'], algorithm='HS256')
+client = flask_app.test_client()
+timings = []
+for _ in range(2):
+    before = time.perf_counter()
+    response = client.get('/api/v1/users/1', headers={'Authorization': 'Bearer ' + token})
+    assert response.status_code == 200, response.status_code
+    timings.append(time.perf_counter() - before)
+print(json.dumps({
+    'import': imported - start, 'create_app': created - imported, 'warm_up': warmed - created,
+    'first_request': timings[0], 'second_request': timings[1],
+}))
+"""
+
+STEPS = ('import', 'create_app', 'warm_up', 'first_request', 'second_request')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10, help='fresh interpreters per mode')
+    parser.add_argument('--database-url', default=None, help='a scratch database; defaults to a throwaway SQLite file')
+    parser.add_argument('--output', default=None, help='results JSON; defaults to benchmarks/results/boot-<rev>.json')
+    args = parser.parse_args()
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        env = bench_env(tmp, args.database_url)
+        run_script(SEED, env)
+        for mode, warm in (('cold', False), ('warmed', True)):
+            timings = {step: [] for step in STEPS}
+            for _ in range(args.runs):
+                for step, seconds in json.loads(run_script(RUN % {'warm': warm}, env)).items():
+                    timings[step].append(seconds)
+            for step in STEPS:
+                if step == 'warm_up' and not warm:
+                    continue
+                rows.append(summarize('%s %s' % (mode, step), timings[step]))
+            print_table(rows[-4 - warm:])
+
+    print()
+    print_table(rows)
+    print('saved', save_results(
+        'boot', rows, args.output,
+        database=env['DATABASE_URL'].split(':', 1)[0], runs=args.runs
+    ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""
+Helpers shared by the benchmark scripts: running the app under gunicorn,
+summarising latencies and saving results as JSON for compare.py.
+"""
+
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+from datetime import datetime, timezone
+
+import requests
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(BACKEND_DIR, 'benchmarks', 'results')
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))]
+
+
+def summarize(name, seconds, elapsed=None, errors=0, **extra):
+    """A result row from per-operation durations in seconds, in milliseconds.
+
+    Throughput is operations per second of wall time when elapsed is given
+    (concurrent runs), otherwise per second of summed operation time.
+    """
+    total = elapsed if elapsed is not None else sum(seconds)
+    row = {
+        'name': name,
+        'count': len(seconds),
+        'errors': errors,
+        'throughput': len(seconds) / total if total else None,
+        'mean_ms': statistics.mean(seconds) * 1000 if seconds else None,
+        'p50_ms': percentile(seconds, 50) * 1000 if seconds else None,
+        'p95_ms': percentile(seconds, 95) * 1000 if seconds else None,
+        'p99_ms': percentile(seconds, 99) * 1000 if seconds else None,
+        'max_ms': max(seconds) * 1000 if seconds else None,
+    }
+    row.update(extra)
+    return row
+
+
+def print_table(rows):
+    print('%-34s %8s %7s %10s %10s %10s %10s' % ('name', 'count', 'errors', 'ops/s', 'p50 ms', 'p95 ms', 'p99 ms'))
+    for row in rows:
+        print('%-34s %8d %7d %10.1f %10.3f %10.3f %10.3f' % (
+            row['name'], row['count'], row['errors'], row['throughput'] or 0,
+            row['p50_ms'] or 0, row['p95_ms'] or 0, row['p99_ms'] or 0))
+
+
+def bench_env(tmp, database_url=None, **overrides):
+    """Environment for running the app against a throwaway SQLite file (or database_url)"""
+    env = dict(os.environ)
+    env.update({
+        'DATABASE_URL': database_url or 'sqlite:///' + os.path.join(tmp, 'bench.db'),
+        'SECRET_KEY': env.get('SECRET_KEY', 'bench-secret'),
+        'UPLOAD_FOLDER': os.path.join(tmp, 'uploads'),
+        # The benchmarks measure the endpoints, not how fast they get throttled
+        'RATELIMIT_ENABLED': 'False',
+    })
+    env.update({key: str(value) for key, value in overrides.items()})
+    return env
+
+
+def run_script(script, env):
+    """Run a snippet against the app in a fresh interpreter and return its stdout"""
+    result = subprocess.run([sys.executable, '-c', script], cwd=BACKEND_DIR, env=env,
+                            check=True, capture_output=True, text=True)
+    return result.stdout
+
+
+# How each serving mode is started, each through its production gunicorn config
+SERVER_COMMANDS = {
+    'gevent': ['-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--worker-connections', '2000', 'app:app'],
+    'asgi': ['-m', 'gunicorn', '-c', 'gunicorn.asgi.conf.py', 'asgi:application'],
+}
+
+
+def start_server(env, port, workers=1, server='gevent'):
+    url = 'http://127.0.0.1:%d' % port
+    try:
+        requests.get(url + '/', timeout=1)
+        raise RuntimeError('something is already listening on port %d' % port)
+    except requests.ConnectionError:
+        pass
+    proc = subprocess.Popen(
+        [sys.executable] + SERVER_COMMANDS[server] + ['-w', str(workers), '-b', '127.0.0.1:%d' % port],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    for _ in range(100):
+        try:
+            requests.get(url + '/', timeout=5)
+            return proc, url
+        except requests.RequestException:
+            time.sleep(0.1)
+    stop_server(proc)
+    raise RuntimeError('server did not start')
+
+
+def stop_server(proc):
+    # Terminate rather than kill, so the arbiter takes its workers down too
+    proc.terminate()
+    proc.wait()
+
+
+def git_revision():
+    try:
+        revision = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR,
+                                  check=True, capture_output=True, text=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=BACKEND_DIR,
+                               check=True, capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return revision + ('-dirty' if dirty else '')
+
+
+def save_results(suite, rows, output=None, **meta):
+    """Write rows with enough context to compare runs; returns the path written"""
+    revision = git_revision()
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, '%s-%s.json' % (suite, revision or 'unknown'))
+    document = {
+        'suite': suite,
+        'meta': dict(
+            revision=revision,
+            created_at=datetime.now(timezone.utc).isoformat(),
+            python=platform.python_version(),
+            platform=platform.platform(),
+            cpus=os.cpu_count(),
+            **meta
+        ),
+        'results': rows,
+    }
+    with open(output, 'w') as f:
+        json.dump(document, f, indent=2)
+    return output
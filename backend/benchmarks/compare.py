@@ -0,0 +1,69 @@
+"""
+Compare two benchmark result files and fail on regressions.
+
+Matches results by name and flags any whose latency (p95 unless --metric
+says otherwise) rose, or whose throughput fell, by more than --threshold
+percent. Exits 1 if anything regressed, so it can gate a CI job:
+
+    python benchmarks/micro.py --output base.json      # on the base commit
+    python benchmarks/micro.py --output head.json      # on the change
+    python benchmarks/compare.py base.json head.json --threshold 10
+"""
+
+import argparse
+import json
+import sys
+
+
+def load(path):
+    with open(path) as f:
+        document = json.load(f)
+    return document, {row['name']: row for row in document['results']}
+
+
+def change(before, after):
+    if not before or after is None:
+        return None
+    return (after - before) / before * 100
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('base')
+    parser.add_argument('head')
+    parser.add_argument('--threshold', type=float, default=10, help='percent change that counts as a regression')
+    parser.add_argument('--metric', choices=('p50', 'p95', 'p99'), default='p95', help='latency percentile to compare')
+    args = parser.parse_args()
+
+    base_doc, base = load(args.base)
+    head_doc, head = load(args.head)
+    if base_doc['suite'] != head_doc['suite']:
+        sys.exit('cannot compare a %s run with a %s run' % (base_doc['suite'], head_doc['suite']))
+    print('%s: %s -> %s' % (base_doc['suite'], base_doc['meta'].get('revision'), head_doc['meta'].get('revision')))
+
+    key = args.metric + '_ms'
+    print('%-34s %10s %10s %8s %10s %10s %8s  %s' % (
+        'name', 'base ' + args.metric, 'head ' + args.metric, 'change', 'base ops/s', 'head ops/s', 'change', ''))
+    regressions = []
+    for name in sorted(base.keys() & head.keys()):
+        b, h = base[name], head[name]
+        latency = change(b[key], h[key])
+        throughput = change(b['throughput'], h['throughput'])
+        regressed = (latency is not None and latency > args.threshold) or \
+                    (throughput is not None and -throughput > args.threshold)
+        if regressed:
+            regressions.append(name)
+        print('%-34s %10.3f %10.3f %+7.1f%% %10.1f %10.1f %+7.1f%%  %s' % (
+            name, b[key] or 0, h[key] or 0, latency or 0,
+            b['throughput'] or 0, h['throughput'] or 0, throughput or 0, 'REGRESSED' if regressed else ''))
+
+    for name in sorted(base.keys() ^ head.keys()):
+        print('%-34s only in %s' % (name, 'base' if name in base else 'head'))
+
+    if regressions:
+        print('%d regressed by more than %g%%: %s' % (len(regressions), args.threshold, ', '.join(regressions)))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
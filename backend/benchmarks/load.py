@@ -0,0 +1,218 @@
+"""
+Concurrent load against the core user endpoints, with per-endpoint percentiles.
+
+Starts gunicorn against a throwaway SQLite database (or --database-url, which
+must be a scratch database), seeds --users users, then drives each scenario
+in turn for --duration seconds from --concurrency client threads and reports
+throughput and p50/p95/p99 per endpoint. Results are saved as JSON (see
+compare.py).
+
+    python benchmarks/load.py
+    python benchmarks/load.py --scenarios login user_profile --concurrency 50 --duration 20
+    python benchmarks/load.py --database-url postgresql://localhost/roadside_bench --workers 4
+"""
+
+import argparse
+import io
+import itertools
+import os
+import random
+import threading
+import tempfile
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import jwt
+import requests
+from PIL import Image
+
+from common import bench_env, print_table, run_script, save_results, start_server, stop_server, summarize
+
+PASSWORD = 'benchmark-password'
+
+SEED = """
+from datetime import datetime
+from werkzeug.security import generate_password_hash
+from app import app, db
+from app.models import User
+with app.app_context():
+    db.create_all()
+    password = generate_password_hash(%(password)r, app.config['PASSWORD_HASH_METHOD'])
+    db.session.execute(User.__table__.insert(), [
+        dict(username=f'load{i}', email=f'load{i}@example.com', password=password, firstname='Load',
+             lastname=f'User {i}', location='Nairobi', joined_on=datetime.utcnow())
+        for i in range(1, %(users)d + 1)
+    ])
+    db.session.commit()
+"""
+
+SCENARIOS = ('register', 'availability', 'login', 'user_profile', 'users_batch', 'upload_photo', 'get_photo')
+
+# Users fetched per users_batch request
+BATCH_SIZE = 20
+
+
+def random_png(rng, side=128):
+    buffer = io.BytesIO()
+    Image.frombytes('RGB', (side, side), rng.randbytes(side * side * 3)).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+class Scenarios(object):
+    """One request per call for each endpoint, spread over the seeded users"""
+
+    def __init__(self, url, users, secret, photos):
+        self.url = url
+        self.users = users
+        self.run = datetime.utcnow().strftime('%H%M%S')
+        expires = datetime.utcnow() + timedelta(hours=2)
+        self.tokens = {i: jwt.encode({'user_id': i, 'exp': expires}, secret, algorithm='HS256')
+                       for i in range(1, users + 1)}
+        self.photos = photos
+        self.photo = None
+        # Warm-up and timed runs both register, so new accounts need their own sequence
+        self._new_ids = itertools.count()
+
+    def user(self, i):
+        return i % self.users + 1
+
+    def auth(self, user_id):
+        return {'Authorization': 'Bearer ' + self.tokens[user_id]}
+
+    def register(self, session, i):
+        i = next(self._new_ids)
+        r = session.post(self.url + '/api/v1/register', json={
+            'username': 'new%s_%d' % (self.run, i), 'email': 'new%s_%d@example.com' % (self.run, i),
+            'password': PASSWORD
+        })
+        return r.status_code == 201
+
+    def availability(self, session, i):
+        # Half free names, half taken ones, which the filter sends to the table
+        username = 'free%s_%d' % (self.run, i) if i % 2 else 'load%d' % self.user(i)
+        r = session.get(self.url + '/api/v1/availability', params={'username': username})
+        return r.status_code == 200 and r.json()['available']['username'] == bool(i % 2)
+
+    def login(self, session, i):
+        r = session.post(self.url + '/api/v1/auth/login',
+                         json={'email': 'load%d@example.com' % self.user(i), 'password': PASSWORD})
+        return r.status_code == 200
+
+    def user_profile(self, session, i):
+        user_id = self.user(i)
+        r = session.get(self.url + '/api/v1/users/%d' % user_id, headers=self.auth(user_id))
+        return r.status_code == 200
+
+    def users_batch(self, session, i):
+        user_id = self.user(i)
+        ids = ','.join(str(self.user(i + j)) for j in range(BATCH_SIZE))
+        r = session.get(self.url + '/api/v1/users', params={'ids': ids, 'fields': 'username,profile_photo'},
+                        headers=self.auth(user_id))
+        return r.status_code == 200 and len(r.json()['users']) == BATCH_SIZE
+
+    def upload_photo(self, session, i):
+        r = session.post(self.url + '/api/v1/photos', headers=self.auth(self.user(i)),
+                         files={'file': ('photo.png', self.photos[i % len(self.photos)], 'image/png')})
+        return r.status_code == 200
+
+    def get_photo(self, session, i):
+        r = session.get(self.url + '/api/v1/photos/' + self.photo, params={'size': (64, 256, 1024)[i % 3]})
+        return r.status_code == 200 and len(r.content) > 0
+
+    def prepare(self):
+        # get_photo needs something to fetch
+        with requests.Session() as session:
+            r = session.post(self.url + '/api/v1/photos', headers=self.auth(1),
+                             files={'file': ('photo.png', self.photos[0], 'image/png')})
+            r.raise_for_status()
+            self.photo = r.json()['filename']
+
+
+def drive(fn, concurrency, duration, timeout):
+    """Call fn from concurrency threads for duration seconds"""
+    counter = itertools.count()
+    deadline = time.perf_counter() + duration
+    lock = threading.Lock()
+    latencies, errors = [], [0]
+
+    def client():
+        with requests.Session() as session:
+            session.request = _with_timeout(session.request, timeout)
+            while time.perf_counter() < deadline:
+                i = next(counter)
+                start = time.perf_counter()
+                try:
+                    ok = fn(session, i)
+                except requests.RequestException:
+                    ok = False
+                elapsed = time.perf_counter() - start
+                with lock:
+                    if ok:
+                        latencies.append(elapsed)
+                    else:
+                        errors[0] += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(client) for _ in range(concurrency)]:
+            future.result()
+    return latencies, errors[0], time.perf_counter() - start
+
+
+def _with_timeout(request, timeout):
+    def wrapped(*args, **kwargs):
+        kwargs.setdefault('timeout', timeout)
+        return request(*args, **kwargs)
+    return wrapped
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--users', type=int, default=1000, help='seeded users')
+    parser.add_argument('--concurrency', type=int, default=20, help='client threads')
+    parser.add_argument('--duration', type=float, default=10, help='seconds per scenario')
+    parser.add_argument('--warmup', type=float, default=2, help='seconds per scenario not recorded')
+    parser.add_argument('--workers', type=int, default=1, help='gunicorn worker processes')
+    parser.add_argument('--hash-workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--database-url', default=None, help='a scratch database; defaults to a throwaway SQLite file')
+    parser.add_argument('--port', type=int, default=5097)
+    parser.add_argument('--timeout', type=float, default=60, help='per-request client timeout in seconds')
+    parser.add_argument('--output', default=None, help='results JSON; defaults to benchmarks/results/load-<rev>.json')
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    photos = [random_png(rng) for _ in range(20)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = bench_env(tmp, args.database_url, HASH_WORKERS=args.hash_workers,
+                        HASH_MAX_PENDING=args.concurrency * args.workers, HASH_QUEUE_TIMEOUT=args.timeout)
+        run_script(SEED % {'password': PASSWORD, 'users': args.users}, env)
+        proc, url = start_server(env, args.port, args.workers)
+        try:
+            scenarios = Scenarios(url, args.users, env['SECRET_KEY'], photos)
+            scenarios.prepare()
+            rows = []
+            for name in args.scenarios:
+                fn = getattr(scenarios, name)
+                if args.warmup:
+                    drive(fn, args.concurrency, args.warmup, args.timeout)
+                latencies, errors, elapsed = drive(fn, args.concurrency, args.duration, args.timeout)
+                rows.append(summarize(name, latencies, elapsed, errors))
+                print_table(rows[-1:])
+        finally:
+            stop_server(proc)
+
+    print()
+    print_table(rows)
+    print('saved', save_results(
+        'load', rows, args.output,
+        database=env['DATABASE_URL'].split(':', 1)[0], users=args.users, concurrency=args.concurrency,
+        duration=args.duration, workers=args.workers, hash_workers=args.hash_workers
+    ))
+
+
+if __name__ == '__main__':
+    main()
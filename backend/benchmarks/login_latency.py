@@ -0,0 +1,130 @@
+"""
+Login latency under concurrent load, with hashing inline vs. in the process pool.
+
+Starts a single gunicorn gevent worker against a throwaway SQLite database,
+fires bursts of concurrent logins and reports p50/p99 per concurrency level,
+along with the p99 of a cheap probe request issued during each burst.
+"before" runs with HASH_WORKERS=0 (pbkdf2 on the event loop), "after" with the
+pool enabled.
+
+    python benchmarks/login_latency.py --levels 50 200 500
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from common import BACKEND_DIR, percentile, start_server, stop_server
+
+EMAIL = 'bench@example.com'
+PASSWORD = 'benchmark-password'
+
+
+def seed(env):
+    script = (
+        "from app import app, db\n"
+        "from app.models import User\n"
+        "with app.app_context():\n"
+        "    db.create_all()\n"
+        "    db.session.add(User('bench', %r, %r))\n"
+        "    db.session.commit()\n" % (PASSWORD, EMAIL)
+    )
+    subprocess.run([sys.executable, '-c', script], cwd=BACKEND_DIR, env=env, check=True)
+
+
+def burst(url, concurrency, timeout):
+    def one(_):
+        start = time.perf_counter()
+        try:
+            r = requests.post(url + '/api/v1/auth/login', json={'email': EMAIL, 'password': PASSWORD}, timeout=timeout)
+        except requests.RequestException:
+            return None, None
+        return time.perf_counter() - start, r.status_code
+
+    # Probe a cheap endpoint throughout the burst: if hashing blocks the event
+    # loop, this is the latency every unrelated request on the worker sees.
+    probes = []
+    done = threading.Event()
+
+    def probe():
+        while not done.is_set():
+            start = time.perf_counter()
+            try:
+                requests.get(url + '/', timeout=timeout)
+            except requests.RequestException:
+                pass
+            probes.append(time.perf_counter() - start)
+            time.sleep(0.05)
+
+    prober = threading.Thread(target=probe)
+    prober.start()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(concurrency)))
+    done.set()
+    prober.join()
+
+    latencies = [t for t, status in results if status == 200]
+    return {
+        'ok': len(latencies),
+        'rejected': sum(1 for _, status in results if status == 503),
+        'failed': sum(1 for _, status in results if status not in (200, 503)),
+        'p50_ms': statistics.median(latencies) * 1000 if latencies else None,
+        'p99_ms': percentile(latencies, 99) * 1000 if latencies else None,
+        'probe_p99_ms': percentile(probes, 99) * 1000 if probes else None,
+    }
+
+
+def run_mode(name, hash_workers, levels, port, timeout):
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ)
+        env.update({
+            'DATABASE_URL': 'sqlite:///' + os.path.join(tmp, 'bench.db'),
+            'SECRET_KEY': env.get('SECRET_KEY', 'bench-secret'),
+            'UPLOAD_FOLDER': os.path.join(tmp, 'uploads'),
+            'HASH_WORKERS': str(hash_workers),
+            'HASH_MAX_PENDING': str(max(levels)),
+            'HASH_QUEUE_TIMEOUT': '60',
+            'RATELIMIT_ENABLED': 'False',
+        })
+        seed(env)
+        proc, url = start_server(env, port)
+        try:
+            burst(url, 4, timeout)  # warm up the pool and connection
+            rows = []
+            for level in levels:
+                rows.append(dict(mode=name, concurrency=level, **burst(url, level, timeout)))
+            return rows
+        finally:
+            stop_server(proc)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--levels', type=int, nargs='+', default=[50, 200, 500])
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='HASH_WORKERS for the "after" run')
+    parser.add_argument('--port', type=int, default=5099)
+    parser.add_argument('--timeout', type=float, default=120, help='per-request client timeout in seconds')
+    args = parser.parse_args()
+
+    rows = run_mode('before', 0, args.levels, args.port, args.timeout)
+    rows += run_mode('after', args.workers, args.levels, args.port, args.timeout)
+
+    print('%-8s %12s %6s %9s %7s %10s %10s %14s' % (
+        'mode', 'concurrency', 'ok', 'rejected', 'failed', 'p50 ms', 'p99 ms', 'probe p99 ms'))
+    for row in rows:
+        print('%-8s %12d %6d %9d %7d %10.1f %10.1f %14.1f' % (
+            row['mode'], row['concurrency'], row['ok'], row['rejected'], row['failed'],
+            row['p50_ms'] or 0, row['p99_ms'] or 0, row['probe_p99_ms'] or 0))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+"""
+Micro-benchmarks for the per-request costs behind the API.
+
+Times password hashing and verification with the configured method, JSON
+serialisation of typical responses (a profile, a catalog page, a history
+page) and bearer token encode/decode, both verified and from the claims
+cache. The serialize group compares marshmallow's dump with the compiled
+schemas, and the default JSON provider with orjson, for a single object and
+1,000-item lists. Each sample is the mean of a batch of calls, so
+sub-millisecond operations are not swamped by timer overhead. Results are
+printed and saved as JSON (see compare.py).
+
+    python benchmarks/micro.py
+    python benchmarks/micro.py --only json token --output /tmp/micro.json
+    python benchmarks/micro.py --only serialize
+"""
+
+import argparse
+import os
+import sys
+import time
+
+from datetime import datetime, timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+os.environ.setdefault('SECRET_KEY', 'bench-secret')
+
+import jwt  # noqa: E402
+from flask.json.provider import DefaultJSONProvider  # noqa: E402
+from werkzeug.security import generate_password_hash, check_password_hash  # noqa: E402
+
+from app import app  # noqa: E402
+from app.auth import decode_token  # noqa: E402
+from app.models import User, CatalogItem  # noqa: E402
+from app.schemas import user_schema, catalog_item_schema, booking_history_schema  # noqa: E402
+from app.serialization import OrjsonProvider  # noqa: E402
+from common import print_table, save_results, summarize  # noqa: E402
+
+GROUPS = ('hash', 'json', 'token', 'serialize')
+
+
+def sample(fn, samples, batch):
+    """Per-call seconds, averaged over batches of calls"""
+    fn()
+    durations = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        for _ in range(batch):
+            fn()
+        durations.append((time.perf_counter() - start) / batch)
+    return durations
+
+
+def profile_payload(i=1):
+    return {
+        "id": i,
+        "username": "driver%d" % i,
+        "email": "driver%d@example.com" % i,
+        "firstname": "Amani",
+        "lastname": "Otieno",
+        "location": "Nairobi, Kenya",
+        "profile_photo": "a" * 64,
+        "profile_photo_url": "http://127.0.0.1:5000/api/v1/photos/" + "a" * 64,
+        "joined_on": datetime(2024, 5, 1, 9, 30).isoformat(),
+    }
+
+
+def catalog_payload(count):
+    return {
+        "items": [{
+            "id": i,
+            "kind": "services",
+            "title": "Express Flat Tyre Service %d" % i,
+            "type": "Flat Tyre",
+            "description": "Roadside tyre change or repair, with a spare fitted if needed. " * 2,
+            "image": "services/flat-tyre.png",
+            "icon": "tyre",
+            "price": "1500.00",
+            "price_unit": "KES",
+            "frequency": "per visit",
+            "rating": 4.6,
+            "users_count": 1200 + i,
+            "available": True,
+        } for i in range(count)],
+        "next_cursor": count,
+    }
+
+
+def history_payload(count):
+    return {
+        "bookings": [{
+            "id": i,
+            "slot_id": i * 3,
+            "status": "confirmed",
+            "service": "Oil Change",
+            "created_at": datetime(2026, 1, 1, 8, i % 60).isoformat(),
+            "starts_at": datetime(2026, 1, 2, 8).isoformat(),
+            "ends_at": datetime(2026, 1, 2, 9).isoformat(),
+            "workshop_id": 7,
+            "workshop_name": "Westlands Auto Care",
+            "workshop_address": "Waiyaki Way, Nairobi",
+        } for i in range(count)],
+        "next_cursor": "MjAyNi0wMS0wMVQwODowMDowMHwx",
+    }
+
+
+def user_model(i=1):
+    # Transient instances, without User.__init__ hashing a password
+    user = User.__mapper__.class_manager.new_instance()
+    for field, value in profile_payload(i).items():
+        if field in User.__table__.columns:
+            setattr(user, field, value)
+    user.joined_on = datetime(2024, 5, 1, 9, 30)
+    return user
+
+
+def catalog_models(count):
+    return [CatalogItem(**dict(item, price=Decimal(item['price']))) for item in catalog_payload(count)['items']]
+
+
+def history_rows(count):
+    # Result rows are plain attribute bags to the serializers
+    rows = []
+    for row in history_payload(count)['bookings']:
+        row = dict(row, hold_expires_at=None, confirmed_at=None)
+        for field in ('created_at', 'starts_at', 'ends_at'):
+            row[field] = datetime.fromisoformat(row[field])
+        rows.append(SimpleNamespace(**row))
+    return rows
+
+
+def run_hash(args):
+    method = app.config['PASSWORD_HASH_METHOD']
+    stored = generate_password_hash('benchmark-password', method)
+    return [
+        summarize('hash.generate', sample(lambda: generate_password_hash('benchmark-password', method),
+                                          args.hash_samples, 1), method=method),
+        summarize('hash.verify', sample(lambda: check_password_hash(stored, 'benchmark-password'),
+                                        args.hash_samples, 1), method=method),
+    ]
+
+
+def run_json(args):
+    rows = []
+    payloads = (('profile', profile_payload()), ('catalog_page', catalog_payload(20)),
+                ('catalog_page_100', catalog_payload(100)), ('history_page', history_payload(20)))
+    with app.app_context():
+        for name, payload in payloads:
+            rows.append(summarize('json.' + name, sample(lambda: app.json.dumps(payload), args.samples, args.batch),
+                                  bytes=len(app.json.dumps(payload))))
+    return rows
+
+
+def run_token(args):
+    secret = app.config['SECRET_KEY']
+    claims = {'user_id': 1, 'exp': datetime.utcnow() + timedelta(hours=1)}
+    token = jwt.encode(claims, secret, algorithm='HS256')
+    with app.app_context():
+        decode_token(token)
+        return [
+            summarize('token.encode', sample(lambda: jwt.encode(claims, secret, algorithm='HS256'),
+                                             args.samples, args.batch)),
+            summarize('token.decode', sample(lambda: jwt.decode(token, secret, algorithms=['HS256']),
+                                             args.samples, args.batch)),
+            summarize('token.decode_cached', sample(lambda: decode_token(token), args.samples, args.batch)),
+        ]
+
+
+def run_serialize(args):
+    """Schema dump and JSON encoding, each alone and as a whole response body"""
+    rows = []
+    cases = (
+        ('user', user_schema, user_model(), False, args.batch),
+        ('catalog_1000', catalog_item_schema, catalog_models(1000), True, max(1, args.batch // 100)),
+        ('history_1000', booking_history_schema, history_rows(1000), True, max(1, args.batch // 100)),
+    )
+    with app.app_context():
+        providers = (('default', DefaultJSONProvider(app)), ('orjson', OrjsonProvider(app)))
+        for name, compiled, obj, many, batch in cases:
+            marshmallow = lambda: compiled.schema.dump(obj, many=many)
+            dump = compiled.many if many else compiled.one
+            rows.append(summarize('serialize.%s.marshmallow' % name, sample(marshmallow, args.samples, batch)))
+            rows.append(summarize('serialize.%s.compiled' % name, sample(lambda: dump(obj), args.samples, batch)))
+            data = dump(obj)
+            for provider_name, provider in providers:
+                rows.append(summarize('encode.%s.%s' % (name, provider_name),
+                                      sample(lambda: provider.dumps(data), args.samples, batch),
+                                      bytes=len(provider.dumps(data).encode('utf-8'))))
+            # What a view pays: marshmallow and the default provider, against compiled and orjson
+            default, fast = providers[0][1], providers[1][1]
+            rows.append(summarize('response.%s.before' % name,
+                                  sample(lambda: default.dumps(marshmallow()), args.samples, batch)))
+            rows.append(summarize('response.%s.after' % name,
+                                  sample(lambda: fast.dumps(dump(obj)), args.samples, batch)))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--only', nargs='+', choices=GROUPS, default=list(GROUPS))
+    parser.add_argument('--samples', type=int, default=50, help='batches timed per benchmark')
+    parser.add_argument('--batch', type=int, default=200, help='calls per batch')
+    parser.add_argument('--hash-samples', type=int, default=5, help='hashes timed (each is slow on purpose)')
+    parser.add_argument('--output', default=None, help='results JSON; defaults to benchmarks/results/micro-<rev>.json')
+    args = parser.parse_args()
+
+    runners = {'hash': run_hash, 'json': run_json, 'token': run_token, 'serialize': run_serialize}
+    rows = []
+    for group in args.only:
+        rows += runners[group](args)
+
+    print_table(rows)
+    print('saved', save_results('micro', rows, args.output, samples=args.samples, batch=args.batch))
+
+
+if __name__ == '__main__':
+    main()
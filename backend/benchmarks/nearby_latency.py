@@ -0,0 +1,104 @@
+"""
+Nearby-workshop query latency as the number of workshops grows.
+
+Builds the in-memory GridIndex over synthetic workshops clustered around
+towns and times k-nearest queries from points in and between the towns, at
+each --sizes count. The "scan" rows compute the same answer by measuring the
+distance to every workshop, which is what an unindexed query has to do.
+
+    python benchmarks/nearby_latency.py --sizes 10000 100000 500000
+"""
+
+import argparse
+import heapq
+import os
+import random
+import statistics
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+os.environ.setdefault('SECRET_KEY', 'bench-secret')
+
+from app.config import Config  # noqa: E402
+from app.workshops import GridIndex, haversine_km  # noqa: E402
+from common import percentile  # noqa: E402
+
+SERVICES = ('Repair', 'Flat Tyre', 'Flat Battery', 'Wash', 'Recovery', 'Oil Change')
+
+
+def synthetic_workshops(count, towns, seed=1):
+    rng = random.Random(seed)
+    # Towns scattered over a region roughly the size of East Africa
+    centres = [(rng.uniform(-12, 5), rng.uniform(29, 42), rng.uniform(0.02, 0.15)) for _ in range(towns)]
+    for i in range(1, count + 1):
+        lat, lon, spread = rng.choice(centres)
+        yield {
+            'id': i,
+            'latitude': rng.gauss(lat, spread),
+            'longitude': rng.gauss(lon, spread),
+            'services': rng.sample(SERVICES, rng.randint(1, 3)),
+        }, centres
+
+
+def scan(workshops, lat, lon, k, radius_km, accept):
+    hits = []
+    for workshop in workshops:
+        distance = haversine_km(lat, lon, workshop['latitude'], workshop['longitude'])
+        if distance <= radius_km and accept(workshop):
+            hits.append((distance, workshop['id']))
+    return heapq.nsmallest(k, hits)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 500000])
+    parser.add_argument('--towns', type=int, default=300)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--radius-km', type=float, default=Config.WORKSHOP_DEFAULT_RADIUS_KM)
+    parser.add_argument('--cell-degrees', type=float, default=Config.WORKSHOP_GRID_DEGREES)
+    args = parser.parse_args()
+
+    print('%-6s %9s %8s %9s %9s %9s' % ('mode', 'workshops', 'build s', 'p50 ms', 'p99 ms', 'max ms'))
+    for size in args.sizes:
+        rows = list(synthetic_workshops(size, args.towns))
+        workshops = [workshop for workshop, _ in rows]
+        centres = rows[0][1]
+
+        start = time.perf_counter()
+        index = GridIndex(args.cell_degrees)
+        for workshop in workshops:
+            index.add(workshop['id'], workshop['latitude'], workshop['longitude'], workshop)
+        build_seconds = time.perf_counter() - start
+
+        # Half the queries from inside towns, half from anywhere in the region
+        rng = random.Random(2)
+        points = []
+        for i in range(args.queries):
+            if i % 2:
+                lat, lon, spread = rng.choice(centres)
+                points.append((rng.gauss(lat, spread), rng.gauss(lon, spread), rng.choice(SERVICES)))
+            else:
+                points.append((rng.uniform(-12, 5), rng.uniform(29, 42), rng.choice(SERVICES)))
+
+        for mode in ('index', 'scan'):
+            samples = []
+            # The scan is linear in the workshop count, so time fewer of them
+            for lat, lon, service in points if mode == 'index' else points[:max(2, args.queries // 50)]:
+                accept = (lambda w, s=service: s in w['services'])
+                begin = time.perf_counter()
+                if mode == 'index':
+                    index.nearest(lat, lon, args.k, args.radius_km, accept)
+                else:
+                    scan(workshops, lat, lon, args.k, args.radius_km, accept)
+                samples.append((time.perf_counter() - begin) * 1000)
+            print('%-6s %9d %8.2f %9.3f %9.3f %9.3f' % (
+                mode, size, build_seconds if mode == 'index' else 0,
+                statistics.median(samples), percentile(samples, 99), max(samples)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""
+Catalog search latency over a synthetic catalog, index vs. substring scan.
+
+Builds the in-memory SearchIndex over --items generated catalog items and
+times a mix of keystroke-by-keystroke prefixes, misspellings and multi-word
+queries, plus incremental add/remove. The "scan" rows run the same queries as
+a case-insensitive substring match over every item, which is what an
+ILIKE '%q%' query does on each keystroke (without the database round trip).
+
+    python benchmarks/search_latency.py --items 100000
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+os.environ.setdefault('SECRET_KEY', 'bench-secret')
+
+from app.search import SearchIndex  # noqa: E402
+from common import percentile  # noqa: E402
+
+KINDS = ('services', 'rentals', 'parts')
+MAKES = ('ford', 'toyota', 'honda', 'nissan', 'mazda', 'volkswagen', 'mercedes', 'hyundai', 'kia',
+         'chevrolet', 'subaru', 'peugeot', 'renault', 'isuzu', 'mitsubishi', 'suzuki', 'yamaha')
+SERVICES = ('repair', 'flat tyre', 'flat battery', 'wash', 'recovery', 'oil change', 'brake check',
+            'wheel alignment', 'diagnostics', 'towing', 'detailing', 'engine tune', 'aircon regas')
+VEHICLES = ('car', 'motorcycle', 'bicycle', 'truck', 'van', 'pickup', 'minibus', 'scooter', 'trailer')
+PARTS = ('battery', 'brake pad', 'brake disc', 'oil filter', 'air filter', 'spark plug', 'radiator',
+         'alternator', 'starter motor', 'headlight', 'wiper blade', 'clutch kit', 'timing belt', 'tyre')
+ADJECTIVES = ('express', 'premium', 'mobile', 'budget', 'certified', 'genuine', 'heavy duty',
+              'roadside', 'weekend', 'overnight', 'eco', 'performance', 'compact', 'family')
+
+QUERIES = {
+    'prefix': ['b', 'ba', 'bat', 'batt', 'batte', 'batter', 'battery', 'oil chan', 'toy', 'alter'],
+    'typo': ['batery', 'alternater', 'motorcyle', 'recovry', 'volkswagon', 'radiater', 'mitsubichi'],
+    'multi': ['brake pad toyota', 'premium wash', 'oil change honda', 'truck rental weekend', 'toyota serv',
+              'flat tyre express', 'spark plug yamaha'],
+}
+
+
+def synthetic_catalog(count, seed=1):
+    rng = random.Random(seed)
+    for i in range(1, count + 1):
+        kind = rng.choice(KINDS)
+        make = rng.choice(MAKES)
+        adjective = rng.choice(ADJECTIVES)
+        model = '%s%d' % (rng.choice('abcdefghjkmnprstvxz'), rng.randint(1, 999))
+        if kind == 'services':
+            kind_type = rng.choice(SERVICES)
+            title = '%s %s service' % (adjective, kind_type)
+        elif kind == 'rentals':
+            kind_type = rng.choice(VEHICLES)
+            title = '%s %s rental' % (adjective, kind_type)
+        else:
+            kind_type = rng.choice(PARTS)
+            title = '%s %s %s' % (make, kind_type, model)
+        yield {
+            'id': i,
+            'kind': kind,
+            'title': title.title(),
+            'type': kind_type.title(),
+            'description': 'Suits %s %s vehicles. %s option from %s.' % (
+                make, model, adjective.capitalize(), rng.choice(MAKES)),
+        }
+
+
+def substring_scan(items, query, limit):
+    # Every row is tested, as ranking the matches needs all of them
+    needle = query.lower()
+    matches = [item for item in items if needle in item['title'].lower() or needle in item['description'].lower()]
+    return matches[:limit]
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--items', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=20, help='runs per query')
+    parser.add_argument('--limit', type=int, default=20)
+    args = parser.parse_args()
+
+    items = list(synthetic_catalog(args.items))
+    index = SearchIndex()
+    start = time.perf_counter()
+    index.rebuild(items)
+    build_seconds = time.perf_counter() - start
+    print('built index over %d items (%d terms) in %.2fs' % (len(index), len(index._postings), build_seconds))
+
+    print('%-7s %-6s %8s %9s %9s %9s' % ('mode', 'group', 'queries', 'p50 ms', 'p99 ms', 'max ms'))
+    for group, queries in QUERIES.items():
+        for mode in ('index', 'scan'):
+            samples = []
+            for query in queries:
+                if mode == 'index':
+                    samples += timed(lambda: index.search(query, limit=args.limit), args.repeat)
+                else:
+                    samples += timed(lambda: substring_scan(items, query, args.limit), max(1, args.repeat // 5))
+            print('%-7s %-6s %8d %9.2f %9.2f %9.2f' % (
+                mode, group, len(queries), statistics.median(samples), percentile(samples, 99), max(samples)))
+
+    fresh = list(synthetic_catalog(1000, seed=2))
+    for item in fresh:
+        item['id'] += args.items
+    add = timed(lambda: [index.add(item) for item in fresh], 1)[0] / len(fresh)
+    remove = timed(lambda: [index.remove(item['id']) for item in fresh], 1)[0] / len(fresh)
+    print('incremental: add %.3f ms/item, remove %.3f ms/item' % (add, remove))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,16 @@
+# ASGI serving: gunicorn -c gunicorn.asgi.conf.py asgi:application
+# Each worker runs an event loop (see app/asgi.py) and warms up in its
+# lifespan startup, so there is no gevent setup and no post_worker_init here.
+import multiprocessing
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+
+worker_class = 'uvicorn.workers.UvicornWorker'
+
+# Building the ASGI app opens nothing, so it can be built once in the master
+preload_app = os.environ.get('PRELOAD_APP', 'False') == 'True'
+
+timeout = 30
+graceful_timeout = 30
@@ -0,0 +1,35 @@
+# Production serving: gunicorn -c gunicorn.conf.py app:app
+# This is the gevent setup; the ASGI mode has its own, gunicorn.asgi.conf.py
+import multiprocessing
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+
+# Gevent workers serve many requests per process, so psycopg2 must yield to
+# the hub while it waits; GEVENT_MODE switches that on in the app
+worker_class = 'gevent'
+worker_connections = int(os.environ.get('WORKER_CONNECTIONS', 1000))
+raw_env = ['GEVENT_MODE=True']
+
+# Build the app once in the master and fork it, instead of in every worker
+preload_app = os.environ.get('PRELOAD_APP', 'False') == 'True'
+if preload_app:
+    # Patch before the master builds the app, so the locks it creates are gevent's
+    from gevent import monkey
+    monkey.patch_all()
+
+timeout = 30
+graceful_timeout = 30
+
+
+def post_worker_init(worker):
+    # Open database connections and build the in-memory indexes before the
+    # worker takes traffic. The app opens nothing while it is being built,
+    # so preload_app is safe: forked workers inherit no connections or pools.
+    # Any other worker class (uvicorn's, given -k) gets the ASGI app, which
+    # warms up in its own startup.
+    from flask import Flask
+    from app import warm_up
+    if isinstance(worker.wsgi, Flask):
+        warm_up(worker.wsgi)
@@ -0,0 +1,37 @@
+"""Add booking history index
+
+Revision ID: 3b8d0c6f1a27
+Revises: 7a2c91f4e3d5
+Create Date: 2026-10-19 09:02:41.906114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b8d0c6f1a27'
+down_revision = '7a2c91f4e3d5'
+branch_labels = None
+depends_on = None
+
+
+# CREATE/DROP INDEX CONCURRENTLY cannot run inside a transaction, so these run
+# in autocommit blocks. If a concurrent build fails it leaves an INVALID index
+# behind: drop it and run the upgrade again.
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_bookings_user_id_created_at_id', 'bookings', ['user_id', 'created_at', 'id'], unique=False,
+            postgresql_include=['slot_id', 'status', 'service'], postgresql_concurrently=True
+        )
+        op.drop_index('ix_bookings_user_id_id', table_name='bookings', postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_bookings_user_id_id', 'bookings', ['user_id', 'id'], unique=False, postgresql_concurrently=True
+        )
+        op.drop_index('ix_bookings_user_id_created_at_id', table_name='bookings', postgresql_concurrently=True)
@@ -11,7 +11,7 @@ import { SafeAreaView } from 'react-native-safe-area-context';
 // Import Icons, Images and Colors
 import { icons, images } from '../../../constants';
 import colors from '../../../constants/colors';
-import { registerUser, loginUser } from '../../../src/services/api';
+import { registerUser, loginUser, checkAvailability } from '../../../src/services/api';
 
 // Form Error
 type FormErrors = {
@@ -64,6 +64,22 @@ const Sign = () => {
     setSignupData(prev => ({ ...prev, [name]: value }));
   };
 
+  // Flag a taken username or email as soon as the field is left, not on submit
+  const handleSignupBlur = async (name: 'username' | 'email') => {
+    const value = signupData[name];
+    if (!value) return;
+    try {
+      const available = await checkAvailability({ [name]: value });
+      const message = name === 'username' ? 'Username is already taken' : 'Email is already registered';
+      setErrors(prev => ({
+        ...prev,
+        signup: { ...prev.signup, [name]: available[name] === false ? message : undefined },
+      }));
+    } catch (error) {
+      // Submitting still checks; a failed lookup just skips the early warning
+    }
+  };
+
   const handleLoginInputChange = (name: keyof typeof loginData, value: string) => {
     setLoginData(prev => ({ ...prev, [name]: value }));
   };
@@ -215,6 +231,7 @@ const Sign = () => {
                         autoCapitalize="none"
                         value={signupData.username}
                         onChangeText={(text) => handleSignupInputChange('username', text)}
+                        onBlur={() => handleSignupBlur('username')}
                       />
 
                       <TouchableOpacity>
@@ -235,6 +252,7 @@ const Sign = () => {
                         autoCapitalize="none"
                         value={signupData.email}
                         onChangeText={(text) => handleSignupInputChange('email', text)}
+                        onBlur={() => handleSignupBlur('email')}
                       />
 
                       <TouchableOpacity>
@@ -1,4 +1,4 @@
-import React, { useState } from 'react';
+import React, { useEffect, useState } from 'react';
 import { useRouter } from 'expo-router';
 
 // Import Supported Contents
@@ -13,6 +13,9 @@ import { SafeAreaView } from 'react-native-safe-area-context';
 import { icons, images } from '../../constants';
 import colors from '../../constants/colors';
 
+// Import API Services
+import { getCatalog, searchCatalog } from '../../src/services/api';
+
 const categories = [
     {
         id: 0,
@@ -139,20 +142,86 @@ const rentings = [
   },
 ];
 
+// Map catalog items from the API onto the bundled images and icons
+const toService = (item: any) => ({
+  id: item.id,
+  title: item.title,
+  type: item.type,
+  frequency: item.frequency,
+  image: images[item.image as keyof typeof images] ?? images.image1,
+  icon: icons[item.icon as keyof typeof icons] ?? icons.repair,
+  stars: item.rating !== null ? item.rating.toFixed(1) : '',
+  description: item.description,
+  users: `${Math.round(item.users_count / 1000)}K`,
+  per: item.price_unit,
+  price: item.price !== null ? String(Number(item.price)) : '',
+});
+
+const toRenting = (item: any) => ({
+  id: item.id,
+  title: item.title,
+  image: images[item.image as keyof typeof images] ?? images.car,
+  available: item.available ? 'Available' : 'Unavailable',
+});
+
 const Home = () => {
   const router = useRouter();
 
+  // The bundled catalog is shown until (or unless) the server's loads
+  const [serviceItems, setServiceItems] = useState(services);
+  const [rentingItems, setRentingItems] = useState(rentings);
+
+  useEffect(() => {
+    getCatalog('services')
+      .then(items => setServiceItems(items.map(toService)))
+      .catch(error => console.error('Error fetching services:', error.message));
+    getCatalog('rentals')
+      .then(items => setRentingItems(items.map(toRenting)))
+      .catch(error => console.error('Error fetching rentals:', error.message));
+  }, []);
+
   const [selectedCategory, setSelectedCategory] = useState('Services');
 
   const [searchQuery, setSearchQuery] = useState('');
 
-  const filteredServices = services.filter(service => 
-    service.title.toLowerCase().includes(searchQuery.toLowerCase())
-  );
-
-  const filteredRentings = rentings.filter(renting => 
-    renting.title.toLowerCase().includes(searchQuery.toLowerCase())
-  );
+  // Server-side results for the search box, or null to fall back to local filtering
+  const [searchResults, setSearchResults] = useState<any[] | null>(null);
+
+  useEffect(() => {
+    const query = searchQuery.trim();
+    if (!query) {
+      setSearchResults(null);
+      return;
+    }
+
+    // Wait for a pause in typing; drop responses for superseded queries
+    let cancelled = false;
+    const timer = setTimeout(() => {
+      searchCatalog(query)
+        .then(results => { if (!cancelled) setSearchResults(results); })
+        .catch(error => {
+          console.error('Error searching catalog:', error.message);
+          if (!cancelled) setSearchResults(null);
+        });
+    }, 150);
+
+    return () => {
+      cancelled = true;
+      clearTimeout(timer);
+    };
+  }, [searchQuery]);
+
+  const filteredServices = searchResults
+    ? searchResults.filter(item => item.kind === 'services').map(toService)
+    : serviceItems.filter(service => 
+        service.title.toLowerCase().includes(searchQuery.toLowerCase())
+      );
+
+  const filteredRentings = searchResults
+    ? searchResults.filter(item => item.kind === 'rentals').map(toRenting)
+    : rentingItems.filter(renting => 
+        renting.title.toLowerCase().includes(searchQuery.toLowerCase())
+      );
 
   return (
     <>
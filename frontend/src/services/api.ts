@@ -27,7 +27,9 @@ const refreshAuthToken = async () => {
       refresh_token: refreshToken
     });
     
+    // Refresh tokens are single use: keep the rotated one for next time
     await SecureStore.setItemAsync('auth_token', response.data.access_token);
+    await SecureStore.setItemAsync('refresh_token', response.data.refresh_token);
     return response.data.access_token;
   } catch (error) {
     await SecureStore.deleteItemAsync('auth_token');
@@ -36,6 +38,18 @@ const refreshAuthToken = async () => {
   }
 };
 
+// Access tokens are short-lived: on a 401, refresh once and retry the request
+api.interceptors.response.use(undefined, async (error) => {
+  const original = error.config;
+  if (error.response?.status !== 401 || !original || original._retried || original.url?.startsWith('/auth/')) {
+    throw error;
+  }
+  original._retried = true;
+  const token = await refreshAuthToken();
+  original.headers = { ...original.headers, 'Authorization': `Bearer ${token}` };
+  return api(original);
+});
+
 // Update photo URL generation
 export const getPhotoUrl = (filename: string) => {
   return `${apiURL}/api/v1/photos/${filename}`;
@@ -71,6 +85,18 @@ export const registerUser = async (userData: {
   }
 };
 
+// Whether a username and/or email is still free, to check before submitting.
+// Resolves to e.g. { username: true, email: false }
+export const checkAvailability = async (fields: { username?: string; email?: string }) => {
+  const response = await api.get('/availability', {
+    params: {
+      ...(fields.username && { username: fields.username }),
+      ...(fields.email && { email: fields.email }),
+    },
+  });
+  return response.data.available as { username?: boolean; email?: boolean };
+};
+
 // Declare loginUser
 export const loginUser = async (credentials: {
   email: string;
@@ -84,6 +110,7 @@ export const loginUser = async (credentials: {
 
     if (response.data.token) {
       await SecureStore.setItemAsync('auth_token', response.data.token);
+      await SecureStore.setItemAsync('refresh_token', response.data.refresh_token);
       await AsyncStorage.setItem('user', JSON.stringify(response.data.user));
     }
 
@@ -111,6 +138,7 @@ export const logoutUser = async () => {
       }
     });
     await SecureStore.deleteItemAsync('auth_token');
+    await SecureStore.deleteItemAsync('refresh_token');
     await AsyncStorage.removeItem('user');
   } catch (error) {
     console.error('Logout error:', error);
@@ -191,15 +219,29 @@ export const getUserProfile = async (userId?: number) => {
       throw new Error('User ID not available');
     }
 
+    // The profile is cached with its ETag so an unchanged one costs a 304
+    const cacheKey = `profile:${userId}`;
+    const cachedJson = await AsyncStorage.getItem(cacheKey);
+    const cached = cachedJson ? JSON.parse(cachedJson) : null;
+
     const response = await api.get(`/users/${userId}`, {
       headers: {
         'Authorization': `Bearer ${token}`,
-        'Accept': 'application/json'
-      }
+        'Accept': 'application/json',
+        ...(cached && { 'If-None-Match': cached.etag })
+      },
+      validateStatus: (status) => status === 200 || status === 304,
     });
+
+    let data = cached?.profile;
+    if (response.status === 200) {
+      data = response.data;
+      if (response.headers.etag) {
+        await AsyncStorage.setItem(cacheKey, JSON.stringify({ etag: response.headers.etag, profile: data }));
+      }
+    }
     
     // Ensure profile_photo is properly formatted
-    const data = response.data;
     if (data.profile_photo && !data.profile_photo.startsWith('http')) {
       data.profile_photo_url = `${apiURL}/api/v1/photos/${data.profile_photo}`;
     }
@@ -215,6 +257,20 @@ export const getUserProfile = async (userId?: number) => {
   }
 };
 
+// Several users in one request, e.g. everyone on a booking history screen.
+// Others come back with their public fields only; unknown ids are skipped.
+export const getUsers = async (userIds: number[], fields?: string[]) => {
+  const token = await SecureStore.getItemAsync('auth_token');
+  const response = await api.get('/users', {
+    headers: { 'Authorization': `Bearer ${token}` },
+    params: {
+      ids: Array.from(new Set(userIds)).join(','),
+      ...(fields && { fields: fields.join(',') }),
+    },
+  });
+  return response.data.users;
+};
+
 // Declare user profile by ID
 export const updateUserProfile = async (
   userId: number,
@@ -301,4 +357,127 @@ export const uploadProfilePhoto = async (imageUri: string) => {
       error: error.response?.data?.error || error.message
     };
   }
-};
\ No newline at end of file
+};
+// Declare catalog listing (services, rentals or parts)
+// Pages are cached with their ETag so an unchanged catalog costs a 304
+export const getCatalog = async (kind: 'services' | 'rentals' | 'parts') => {
+  const items: any[] = [];
+  let cursor: number | null = null;
+
+  do {
+    const cacheKey: string = `catalog:${kind}:${cursor ?? ''}`;
+    const cachedJson = await AsyncStorage.getItem(cacheKey);
+    const cached = cachedJson ? JSON.parse(cachedJson) : null;
+
+    const response: any = await api.get(`/${kind}`, {
+      params: { limit: 100, ...(cursor !== null && { cursor }) },
+      headers: cached ? { 'If-None-Match': cached.etag } : {},
+      validateStatus: (status) => status === 200 || status === 304,
+    });
+
+    let page = cached?.page;
+    if (response.status === 200) {
+      page = response.data;
+      if (response.headers.etag) {
+        await AsyncStorage.setItem(cacheKey, JSON.stringify({ etag: response.headers.etag, page }));
+      }
+    }
+
+    items.push(...page.items);
+    cursor = page.next_cursor;
+  } while (cursor !== null);
+
+  return items;
+};
+
+// Declare catalog search
+export const searchCatalog = async (query: string, kinds?: string[]) => {
+  const response = await api.get('/search', {
+    params: { q: query, ...(kinds && { kind: kinds.join(',') }) },
+  });
+  return response.data.results;
+};
+
+// Declare nearby workshops
+export const getNearbyWorkshops = async (
+  latitude: number,
+  longitude: number,
+  options: { k?: number; radiusKm?: number; service?: string; openOnly?: boolean } = {}
+) => {
+  const response = await api.get('/workshops/nearby', {
+    params: {
+      lat: latitude,
+      lon: longitude,
+      ...(options.k && { k: options.k }),
+      ...(options.radiusKm && { radius_km: options.radiusKm }),
+      ...(options.service && { service: options.service }),
+      ...(options.openOnly === false && { open: 'false' }),
+    },
+  });
+  return response.data.workshops;
+};
+
+// Bookable slots at a workshop over the next `days` days
+export const getWorkshopSlots = async (workshopId: number, options: { from?: string; days?: number } = {}) => {
+  const response = await api.get(`/workshops/${workshopId}/slots`, {
+    params: {
+      ...(options.from && { from: options.from }),
+      ...(options.days && { days: options.days }),
+    },
+  });
+  return response.data.slots;
+};
+
+// Hold a place in a slot; the hold lapses unless confirmed in time
+export const createBooking = async (slotId: number, service?: string) => {
+  const token = await SecureStore.getItemAsync('auth_token');
+  try {
+    const response = await api.post('/bookings', { slot_id: slotId, ...(service && { service }) }, {
+      headers: { 'Authorization': `Bearer ${token}` },
+    });
+    return { success: true, data: response.data };
+  } catch (error: any) {
+    return {
+      success: false,
+      full: error.response?.status === 409,
+      error: error.response?.data?.error || 'Booking failed',
+    };
+  }
+};
+
+export const confirmBooking = async (bookingId: number) => {
+  const token = await SecureStore.getItemAsync('auth_token');
+  try {
+    const response = await api.post(`/bookings/${bookingId}/confirm`, null, {
+      headers: { 'Authorization': `Bearer ${token}` },
+    });
+    return { success: true, data: response.data };
+  } catch (error: any) {
+    return { success: false, error: error.response?.data?.error || 'Could not confirm booking' };
+  }
+};
+
+export const cancelBooking = async (bookingId: number) => {
+  const token = await SecureStore.getItemAsync('auth_token');
+  await api.delete(`/bookings/${bookingId}`, {
+    headers: { 'Authorization': `Bearer ${token}` },
+  });
+};
+
+// One page of the user's booking history, newest first; pass the previous
+// page's nextCursor to continue
+export const getBookingHistory = async (
+  userId: number,
+  options: { cursor?: string | null; limit?: number; compact?: boolean } = {}
+) => {
+  const token = await SecureStore.getItemAsync('auth_token');
+  const response = await api.get(`/users/${userId}/history`, {
+    headers: { 'Authorization': `Bearer ${token}` },
+    params: {
+      ...(options.cursor && { cursor: options.cursor }),
+      ...(options.limit && { limit: options.limit }),
+      ...(options.compact && { view: 'compact' }),
+    },
+  });
+  return { bookings: response.data.bookings, nextCursor: response.data.next_cursor as string | null };
+};